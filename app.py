@@ -1,15 +1,19 @@
 import os
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
 
-# 1. Initialize Firebase Admin SDK AT THE VERY TOP
 load_dotenv()
-firebase_key_raw = os.getenv('FIREBASE_KEY')
-service_account_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serviceAccountKey.json')
 
-if not firebase_admin._apps:
+def init_firebase():
+    # Called from create_app() (and CLI commands) rather than at import, so importing
+    # the module and gunicorn's preload stay free of credential parsing and I/O.
+    # Imported here: firebase_admin pulls in google-auth/requests (~0.25s per worker)
+    import firebase_admin
+    from firebase_admin import credentials
+    if firebase_admin._apps:
+        return
+    firebase_key_raw = os.getenv('FIREBASE_KEY')
+    service_account_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serviceAccountKey.json')
     try:
         if firebase_key_raw:
             # Parse the JSON string from environment variable
@@ -31,16 +35,31 @@ if not firebase_admin._apps:
     except Exception as e:
         print(f"CRITICAL: Firebase initialization failed: {e}")
 
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, session, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, session, abort, Response, stream_with_context, stream_template, get_flashed_messages
+from markupsafe import Markup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-import pandas as pd
 from io import BytesIO
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Student, Subject, Attendance, Classroom, Department, get_db
+from models import db, User, Student, Subject, Attendance, Classroom, Department, get_db, user_cache, collection_versions, TTLCache, day_counts, BulkWriter, FirestoreUnavailable, BREAKER_COOLDOWN
+from live_stats import LiveAttendanceStats
+from student_search import student_index
+from status_history import status_history
+import denormalize
+from compression import compress_response, rechunk
+from sqlite_mirror import fresh_mirror
+from write_behind import get_queue as get_write_queue
+from cascade import cascade_jobs
+from archive import add_counts, archived_day_counts, archived_records
+from defaulters import DEFAULTER_THRESHOLD, defaulters_index
 from datetime import datetime
 from functools import wraps
+import click
 import csv
+import threading
 import io
+import copy
+import itertools
+import hashlib
 
 def admin_required(f):
     @wraps(f)
@@ -73,6 +92,7 @@ import secrets
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get("SECRET_KEY", "dev")
+app.after_request(compress_response)
 # supabase or local sqlite settings removed for firebase
 
 
@@ -84,7 +104,7 @@ login_manager.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    return User.get_cached(user_id)
 
 
 def create_default_admin():
@@ -103,30 +123,160 @@ def create_default_admin():
     except Exception as e:
         print(f"Error creating default admin: {e}")
 
-# Create default admin safely
-with app.app_context():
-    create_default_admin()
-    
-    # ensure all stored usernames/emails are normalized to lowercase
-    try:
-        all_users = User.query.all()
-        for u in all_users:
+# --- One-shot maintenance (run via `flask --app app maintain`, not at worker boot) ---
+MAINTENANCE_COLLECTION = 'maintenance'
+NORMALIZE_USERS_MARKER = 'normalize_users_v1'
+
+def normalize_users(force=False):
+    """Lowercase stored usernames/emails and backfill login_keys, in batched writes.
+
+    Idempotent: records a completion marker and is a no-op afterwards unless forced.
+    Returns the number of users rewritten.
+    """
+    db_conn = get_db()
+    marker_ref = db_conn.collection(MAINTENANCE_COLLECTION).document(NORMALIZE_USERS_MARKER)
+    if not force and marker_ref.get().exists:
+        return 0
+
+    updated = 0
+    with BulkWriter() as writer:
+        # Stream directly so a failed read aborts instead of recording the marker
+        for doc in db_conn.collection(User.__collection__).stream():
+            data = doc.to_dict() or {}
+            u = User(id=doc.id, **data)
             changed = False
-            if hasattr(u, 'email') and u.email:
+            if getattr(u, 'email', None):
                 normalized = u.email.strip().lower()
                 if u.email != normalized:
                     u.email = normalized
                     changed = True
-            if hasattr(u, 'username') and u.username:
+            if getattr(u, 'username', None):
                 normalized = u.username.strip().lower()
                 if u.username != normalized:
                     u.username = normalized
                     changed = True
-            if changed:
-                u.save()
-        # note: this will update any existing teacher records too
-    except Exception as e:
-        print(f"Error normalizing users: {e}")
+            # backfill the login-key index for accounts saved before it existed
+            if data.get('login_keys') != u.to_dict()['login_keys']:
+                changed = True
+            if not changed:
+                continue
+            writer.set(db_conn.collection(User.__collection__).document(str(u.id)), u.to_dict())
+            user_cache.pop(str(u.id))
+            updated += 1
+
+    marker_ref.set({'completed_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), 'updated': updated})
+    return updated
+
+@app.cli.command('maintain')
+@click.option('--force', is_flag=True, help='Re-run normalization even if already completed.')
+def maintain_command(force):
+    """Create the default admin and normalize stored user credentials."""
+    init_firebase()
+    create_default_admin()
+    updated = normalize_users(force=force)
+    print(f"User normalization complete: {updated} users updated.")
+
+@app.cli.command('cascade-delete')
+@click.argument('kind', type=click.Choice(['department', 'class', 'student', 'subject']))
+@click.argument('doc_id')
+def cascade_delete_command(kind, doc_id):
+    """Delete a department, class, student or subject with everything that references it."""
+    from cascade import plan
+    init_firebase()
+    job_id = cascade_jobs.create(kind, doc_id)
+    removed = cascade_jobs.run(job_id, lambda: plan(kind, doc_id))
+    if removed is None:
+        raise click.ClickException(f"Cascade failed; see job {job_id}.")
+    print(f"Removed {', '.join(f'{c} {n}' for c, n in removed.items()) or 'nothing'} (job {job_id}).")
+
+@app.cli.command('purge-orphans')
+def purge_orphans_command():
+    """Remove attendance and student logins left behind by earlier single-document deletes."""
+    from cascade import plan_orphans
+    init_firebase()
+    job_id = cascade_jobs.create('orphans', 'sweep')
+    removed = cascade_jobs.run(job_id, plan_orphans)
+    if removed is None:
+        raise click.ClickException(f"Orphan sweep failed; see job {job_id}.")
+    print(f"Removed {', '.join(f'{c} {n}' for c, n in removed.items()) or 'nothing'} (job {job_id}).")
+
+@app.cli.command('close-semester')
+@click.option('--until', required=True, help='Last day of the semester (YYYY-MM-DD); later records stay live.')
+@click.option('--class-id', 'class_ids', multiple=True, help='Class to close (repeatable); default every class.')
+@click.option('--semester', help="Semester label for the archive; default each class's current_semester.")
+def close_semester_command(until, class_ids, semester):
+    """Move attendance up to --until into per-class-per-semester archive blobs with final rollups."""
+    from archive import close_semester
+    try:
+        datetime.strptime(until, '%Y-%m-%d')
+    except ValueError:
+        raise click.BadParameter('expected YYYY-MM-DD', param_hint='--until')
+    init_firebase()
+    if not class_ids:
+        class_ids = [c.id for c in Classroom.query.all()]
+    moved = 0
+    for class_id in class_ids:
+        result = close_semester(class_id, until, semester)
+        if result is None:
+            print(f"Class {class_id} not found; skipped.")
+            continue
+        moved += result['records']
+    print(f"Closed {len(class_ids)} classes up to {until}: {moved} records in the archive.")
+
+@app.cli.command('rebuild-defaulters')
+def rebuild_defaulters_command():
+    """Recompute every student's entry in the attendance shortage index."""
+    init_firebase()
+    stored = defaulters_index.rebuild()
+    print(f"Defaulters index rebuilt: {stored} students.")
+
+@app.cli.command('export-snapshot')
+@click.argument('out_dir')
+@click.option('--format', 'fmt', type=click.Choice(['parquet', 'arrow']), default='parquet',
+              help='parquet (zstd, smallest) or arrow (IPC, memory-mappable).')
+@click.option('--full', is_flag=True, help='Ignore the watermark and export every record.')
+def export_snapshot_command(out_dir, fmt, full):
+    """Write attendance (joined with students/subjects/classes) as month/dept partitioned columnar files."""
+    from snapshot_export import export_snapshot
+    init_firebase()
+    result = export_snapshot(out_dir, fmt=fmt, full=full)
+    print(f"Exported {result['rows']} records and {result['deleted']} deletions to {len(result['files'])} files "
+          f"in {result['seconds']:.1f}s (next watermark {result['watermark']}).")
+
+@app.cli.command('mirror-sync')
+@click.option('--loop', is_flag=True, help='Keep syncing every SQLITE_MIRROR_INTERVAL seconds.')
+def mirror_sync_command(loop):
+    """Bring the SQLite reporting mirror (SQLITE_MIRROR) up to date with Firestore."""
+    import time
+    from sqlite_mirror import SQLITE_MIRROR, SQLiteMirror
+    if not SQLITE_MIRROR:
+        print("SQLITE_MIRROR is not set; nothing to sync.")
+        return
+    init_firebase()
+    mirror = SQLiteMirror(SQLITE_MIRROR)
+    while True:
+        applied = mirror.sync()
+        if applied is None:
+            print("Another process is syncing the mirror; skipped.")
+        else:
+            print(f"Mirror synced: {', '.join(f'{c} {n}' for c, n in applied.items())} rows applied.")
+        if not loop: break
+        time.sleep(mirror.interval)
+
+@app.cli.command('copy-to-sql')
+def copy_to_sql_command():
+    """Copy every Firestore collection into the SQL backend's tables (DATABASE_URL)."""
+    from firebase_admin import firestore
+    from sql_backend import INDEXED_FIELDS, SQLClient
+    init_firebase()
+    collections = sorted(set(INDEXED_FIELDS) | {MAINTENANCE_COLLECTION})
+    counts = SQLClient.from_env().copy_from(firestore.client(), collections)
+    print(f"Copied {', '.join(f'{c} {n}' for c, n in counts.items())}.")
+
+def create_app():
+    # App factory for WSGI servers: Firebase wiring only, zero Firestore reads at boot
+    init_firebase()
+    return app
 
 # --- Performance Caching ---
 _cache = {
@@ -136,21 +286,131 @@ _cache = {
 }
 CACHE_TIMEOUT = 300 # 5 minutes
 
+# --- Live Dashboard (opt-in) ---
+# Snapshot-listener tallies of today's attendance; SSE keeps a worker busy per open
+# dashboard, so only enable with threaded/async workers
+LIVE_DASHBOARD = os.environ.get('LIVE_DASHBOARD', '').lower() in ('1', 'true', 'yes')
+LIVE_HEARTBEAT_SECONDS = 15
+live_stats = LiveAttendanceStats() if LIVE_DASHBOARD else None
+
+# --- Write-behind (opt-in, WRITE_BEHIND=<queue file>) ---
+write_queue = get_write_queue()
+if write_queue is not None:
+    write_queue.on_commit(defaulters_index.on_commit)
+
+def save_attendance(records):
+    # Queued when write-behind is on, otherwise committed in batches. Records
+    # without an id get a generated one (no round trip) so they can be queued.
+    db_conn = get_db()
+    collection = db_conn.collection(Attendance.__collection__)
+    docs = {}
+    for rec in records:
+        if not rec.id:
+            rec.id = collection.document().id
+        docs[str(rec.id)] = rec.to_dict()
+    if not docs:
+        return
+    if write_queue is not None:
+        write_queue.set_many(Attendance.__collection__, docs)
+    else:
+        with BulkWriter() as writer:
+            for doc_id, data in docs.items():
+                writer.set(collection.document(doc_id), data)
+        defaulters_index.touch(data.get('student_id') for data in docs.values())
+    # Late/OD/Leave marks show in the status portal's history without waiting for a reseed
+    status_history.record_many(records)
+
+# --- Cascading deletes (cascade.py) ---
+# Seconds a delete route waits for its cascade before leaving it to the background
+CASCADE_WAIT = float(os.environ.get('CASCADE_WAIT', 3))
+
+# Per-key refresh locks: with threaded/async workers only one request reloads a stale entry
+_cache_locks = {}
+
+def get_cached_value(key, loader):
+    entry = _cache.get(key)
+    if entry and entry['data'] is not None and (datetime.now().timestamp() - entry['time']) <= CACHE_TIMEOUT:
+        return entry['data']
+    with _cache_locks.setdefault(key, threading.Lock()):
+        entry = _cache.get(key)
+        if entry and entry['data'] is not None and (datetime.now().timestamp() - entry['time']) <= CACHE_TIMEOUT:
+            return entry['data']
+        data = loader()
+        # Entries are replaced whole, so readers never see a half-built one
+        _cache[key] = {'data': data, 'time': datetime.now().timestamp()}
+        return data
+
 def get_cached_metadata(key, model_class):
-    now = datetime.now().timestamp()
-    if _cache[key]['data'] is None or (now - _cache[key]['time']) > CACHE_TIMEOUT:
+    def load():
         data = model_class.query.all()
         # Sort if needed
         if key == 'departments': data.sort(key=lambda x: x.name.lower())
         elif key == 'classrooms': data.sort(key=lambda x: x.name.lower())
-        _cache[key] = {'data': data, 'time': now}
-    return _cache[key]['data']
+        return data
+    return get_cached_value(key, load)
+
+# Dropdown APIs are revalidated on every use; a matching ETag costs no Firestore query
+API_CACHE_CONTROL = 'private, max-age=0, must-revalidate'
+
+def conditional_json(collections, build):
+    # ETag = collection change stamps + full path (query string included). A 304 skips
+    # both the Firestore read and the JSON serialization done by build().
+    version = collection_versions.get(*collections)
+    if version is None:
+        return jsonify(build())
+    etag = hashlib.sha1(f"{version}|{request.full_path}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = API_CACHE_CONTROL
+    return response
+
+# Rendered HTML for expensive template fragments, keyed on the data version they show
+fragment_cache = TTLCache(maxsize=64, ttl=CACHE_TIMEOUT)
+
+def render_fragment(template_name, key, collections, load_context):
+    # load_context() (the Firestore reads) only runs when the fragment is not cached
+    version = collection_versions.get(*collections)
+    if version is None:
+        return Markup(render_template(template_name, **load_context()))
+    cache_key = (template_name, key, version)
+    html = fragment_cache.get(cache_key)
+    if html is None:
+        html = Markup(render_template(template_name, **load_context()))
+        fragment_cache.set(cache_key, html)
+    return html
+
+# Stream large pages so the browser paints the head and first rows while the rest renders
+STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', '1') == '1'
+
+def render_page(template_name, **context):
+    if not STREAM_TEMPLATES:
+        return render_template(template_name, **context)
+    # The session cookie is written before the body streams, so consume flashes now
+    get_flashed_messages()
+    return Response(rechunk(stream_template(template_name, **context)), mimetype='text/html')
+
+def get_cached_classroom(class_id):
+    return next((c for c in get_cached_metadata('classrooms', Classroom) if str(c.id) == str(class_id)), None)
+
 
 # --- Routes ---
 @app.route('/health')
 def health():
     return "OK", 200
 
+@app.errorhandler(FirestoreUnavailable)
+def firestore_unavailable(e):
+    # An outage is reported as one instead of rendering pages from empty results
+    print(f"Firestore unavailable: {e}")
+    headers = {'Retry-After': str(int(BREAKER_COOLDOWN))}
+    message = 'The database is temporarily unavailable. Please try again in a moment.'
+    if request.path.startswith('/api/') or request.is_json:
+        return jsonify({'status': 'error', 'message': message}), 503, headers
+    return message, 503, headers
+
 
 @app.route('/')
 @login_required
@@ -169,18 +429,12 @@ def dashboard():
         total_teachers = User.query.where('role', 'in', ['teacher', 'in_charge', 'hod']).count()
     else:
         # Admin / HOD Full View
-        if 'global_counts' not in _cache or (datetime.now().timestamp() - _cache['global_counts']['time']) > CACHE_TIMEOUT:
-            _cache['global_counts'] = {
-                'data': {
-                    'students': Student.query.count(),
-                    'subjects': Subject.query.count(),
-                    'classes': Classroom.query.count(),
-                    'teachers': User.query.where('role', 'in', ['teacher', 'in_charge', 'hod']).count()
-                },
-                'time': datetime.now().timestamp()
-            }
-        
-        counts = _cache['global_counts']['data']
+        counts = get_cached_value('global_counts', lambda: {
+            'students': Student.query.count(),
+            'subjects': Subject.query.count(),
+            'classes': Classroom.query.count(),
+            'teachers': User.query.where('role', 'in', ['teacher', 'in_charge', 'hod']).count()
+        })
         total_students = counts['students']
         total_subjects = counts['subjects']
         total_classes = counts['classes']
@@ -195,9 +449,10 @@ def dashboard():
         top_students = Student.query.limit(10).all()
 
     report_data = []
+    # Stats for these 10 students only, from one grouped aggregation rather than per-student fetches
+    top_stats = Student.attendance_stats_many(top_students)
     for s in top_students:
-        # We only calculate stats for these 10 students now, much faster than calculating for everyone in pool
-        stats = s.get_attendance_stats()
+        stats = top_stats[str(s.id)]
         report_data.append({
             'name': getattr(s, 'name', ''),
             'roll_no': getattr(s, 'roll_no', ''),
@@ -211,46 +466,89 @@ def dashboard():
     in_charge_data = None
     hod_summary = []
 
-    attendance_today = Attendance.query.filter_by(date=today_str).all()
-    student_today_statuses = {}
-    for rec in attendance_today:
-        sid = str(getattr(rec, 'student_id', ''))
-        if not sid: continue
-        if sid not in student_today_statuses:
-            student_today_statuses[sid] = set()
-        student_today_statuses[sid].add(getattr(rec, 'status', ''))
-        
-    # Resolve student depts and classes for stats - ONLY for students marked today
-    # To be robust (handling doc ids, roll numbers, and Firestore internal ID mapping), 
-    # we'll fetch all students once and map them. This is efficient for small-medium systems.
-    all_students_pool = Student.query.all()
-    student_map = {str(s.id): s for s in all_students_pool}
-    # Also index by roll_no for any records still using it
-    for s in all_students_pool:
-        if getattr(s, 'roll_no', None):
-            student_map[str(s.roll_no)] = s
-    
-    stats_map = {} # cid -> {'present', 'absent', 'od', 'leave', 'late'}
-    attendee_dept_map = {} # sid -> dept
-    
-    for sid, statuses in student_today_statuses.items():
-        s_obj = student_map.get(sid)
-        if not s_obj: continue
-        
-        cid = str(getattr(s_obj, 'class_id', ''))
-        dept = str(getattr(s_obj, 'dept', 'Unknown'))
-        attendee_dept_map[sid] = dept
+    teacher_scope = current_user.role in ['teacher', 'in_charge'] and assigned_ids
+    dept_today = {} # dept (lowercased) -> {'present', 'absent', 'late'}
+    total_present_today = 0
+    mirror = None
+
+    if live_stats is not None:
+        # Live tallies are fed by the snapshot listener, no rescan of today's records
+        stats_map = live_stats.class_tallies()
+        class_dept_map = {str(c.id): str(getattr(c, 'dept', '')).lower().strip() for c in get_cached_metadata('classrooms', Classroom)}
+        for cid, tally in stats_map.items():
+            if teacher_scope and cid not in assigned_ids:
+                continue
+            d_today = dept_today.setdefault(class_dept_map.get(cid, ''), {'present': 0, 'absent': 0, 'late': 0})
+            d_today['present'] += tally['present']
+            d_today['absent'] += tally['absent']
+            d_today['late'] += tally['late']
+            total_present_today += tally['present']
+    else:
+        mirror = fresh_mirror()
+        if mirror is not None:
+            # (student_id, class_id, dept, statuses) resolved with one indexed join locally
+            today_rows = mirror.day_statuses(today_str)
+        else:
+            # (student_id, status) groups only; no Attendance objects are built
+            student_today_statuses = {}
+            for sid, st in Attendance.query.filter_by(date=today_str).aggregate(group_by=('student_id', 'status')):
+                sid = str(sid or '')
+                if not sid: continue
+                student_today_statuses.setdefault(sid, set()).add(st or '')
+
+            # Resolve student depts and classes for stats - ONLY for students marked today
+            # To be robust (handling doc ids, roll numbers, and Firestore internal ID mapping), 
+            # we'll stream all students once and map them.
+            student_map = {}
+            roll_map = {}
+            for s in Student.query.iter():
+                student_map[str(s.id)] = s
+                # Also index by roll_no for any records still using it
+                if getattr(s, 'roll_no', None):
+                    roll_map.setdefault(str(s.roll_no), s)
+            for roll, s in roll_map.items():
+                student_map.setdefault(roll, s)
+
+            today_rows = []
+            for sid, statuses in student_today_statuses.items():
+                s_obj = student_map.get(sid)
+                if not s_obj:
+                    today_rows.append((sid, None, None, statuses))
+                else:
+                    today_rows.append((sid, str(getattr(s_obj, 'class_id', '')), getattr(s_obj, 'dept', 'Unknown'), statuses))
+
+        stats_map = {} # cid -> {'present', 'absent', 'od', 'leave', 'late'}
         
-        if cid not in stats_map:
-            stats_map[cid] = {'present': 0, 'absent': 0, 'od': 0, 'leave': 0, 'late': 0}
+        for sid, cid, dept, statuses in today_rows:
+            if cid is None:
+                # Unresolved ids still count towards the overall summary outside teacher scope
+                if not teacher_scope and 'Absent' not in statuses:
+                    total_present_today += 1
+                continue
             
-        if 'Absent' in statuses:
-            stats_map[cid]['absent'] += 1
-        else:
-            stats_map[cid]['present'] += 1
-            if 'OD' in statuses: stats_map[cid]['od'] += 1
-            elif 'Leave' in statuses: stats_map[cid]['leave'] += 1
-            elif 'Late' in statuses: stats_map[cid]['late'] += 1
+            dept = str(dept).lower().strip()
+            
+            if cid not in stats_map:
+                stats_map[cid] = {'present': 0, 'absent': 0, 'od': 0, 'leave': 0, 'late': 0}
+                
+            if 'Absent' in statuses:
+                stats_map[cid]['absent'] += 1
+            else:
+                stats_map[cid]['present'] += 1
+                if 'OD' in statuses: stats_map[cid]['od'] += 1
+                elif 'Leave' in statuses: stats_map[cid]['leave'] += 1
+                elif 'Late' in statuses: stats_map[cid]['late'] += 1
+
+            # For teacher, dept and overall summaries only cover their assigned classes
+            if teacher_scope and cid not in assigned_ids:
+                continue
+            d_today = dept_today.setdefault(dept, {'present': 0, 'absent': 0, 'late': 0})
+            if 'Absent' in statuses:
+                d_today['absent'] += 1
+            else:
+                d_today['present'] += 1
+                total_present_today += 1
+                if 'Late' in statuses: d_today['late'] += 1
 
 
     if current_user.role == 'in_charge':
@@ -281,6 +579,7 @@ def dashboard():
         for cls in classes_to_show:
             stats = stats_map.get(cls.id, {'present': 0, 'absent': 0})
             hod_summary.append({
+                'class_id': str(cls.id),
                 'class_name': cls.name, 
                 'present': stats['present'], 
                 'absent': stats['absent']
@@ -299,59 +598,32 @@ def dashboard():
 
     dept_stats = []
     
-    # Use cached counts correctly based on visibility
+    # Per-department totals: one concurrent grouped count, cached per visibility scope
+    if current_user.role in ['teacher', 'in_charge'] and assigned_ids:
+        # For teacher, "Total" in dept only counts students in THEIR assigned classes within that dept
+        scope_key = f"dept_counts:{current_user.role}:{','.join(sorted(assigned_ids))}"
+        count_query = Student.query.where('class_id', 'in', assigned_ids)
+        count_depts = departments_to_show
+    else:
+        # For HOD/Admin, show overall dept count
+        scope_key = 'dept_counts'
+        count_query = Student.query
+        count_depts = all_departments
+    dept_counts = get_cached_value(scope_key, lambda: count_query.count_by('dept', [dd.name for dd in count_depts]))
+
     for d in departments_to_show:
-        if current_user.role in ['teacher', 'in_charge'] and assigned_ids:
-            # For teacher, "Total" in dept only counts students in THEIR assigned classes within that dept
-            total_dept_students = Student.query.filter_by(dept=d.name).where('class_id', 'in', assigned_ids).count()
-        else:
-            # For HOD/Admin, show overall dept count
-            if 'dept_counts' not in _cache or (datetime.now().timestamp() - _cache['dept_counts']['time']) > CACHE_TIMEOUT:
-                dept_counts = {}
-                for dd in all_departments:
-                    dept_counts[dd.name] = Student.query.filter_by(dept=dd.name).count()
-                _cache['dept_counts'] = {'data': dept_counts, 'time': datetime.now().timestamp()}
-            total_dept_students = _cache['dept_counts']['data'].get(d.name, 0)
-
-        dept_present = 0
-        dept_absent = 0
-        dept_late = 0
-        
-        for sid, statuses in student_today_statuses.items():
-            s_dept = str(attendee_dept_map.get(sid, '')).lower().strip()
-            if s_dept == str(d.name).lower().strip():
-                # For teacher, filter by their assigned classes
-                if current_user.role in ['teacher', 'in_charge'] and assigned_ids:
-                    s_obj = student_map.get(sid)
-                    if not s_obj or str(getattr(s_obj, 'class_id', '')) not in assigned_ids:
-                        continue
-                
-                if 'Absent' in statuses:
-                    dept_absent += 1
-                else:
-                    dept_present += 1
-                    if 'Late' in statuses: dept_late += 1
+        total_dept_students = dept_counts.get(d.name, 0)
+        d_today = dept_today.get(str(d.name).lower().strip(), {})
         
         dept_stats.append({
             'name': d.name,
             'code': d.code,
             'total_students': total_dept_students,
-            'present': dept_present,
-            'absent': dept_absent,
-            'late': dept_late
+            'present': d_today.get('present', 0),
+            'absent': d_today.get('absent', 0),
+            'late': d_today.get('late', 0)
         })
 
-    # Calculate Overall Today's Summary
-    total_present_today = 0
-    for sid, statuses in student_today_statuses.items():
-        if 'Absent' not in statuses:
-            # Check if student belongs to user scope
-            if current_user.role in ['teacher', 'in_charge'] and assigned_ids:
-                s_obj = student_map.get(sid)
-                if not s_obj or str(getattr(s_obj, 'class_id', '')) not in assigned_ids:
-                    continue
-            total_present_today += 1
-            
     today_attendance_perc = 0
     if total_students > 0:
         today_attendance_perc = min(100.0, round((total_present_today / total_students) * 100, 1))
@@ -368,8 +640,34 @@ def dashboard():
                            in_charge_data=in_charge_data,
                            hod_summary=hod_summary,
                            dept_stats=dept_stats,
+                           live_dashboard=live_stats is not None,
+                           data_as_of=mirror.as_of() if mirror is not None else None,
                            today_date=today.strftime('%d %b, %Y'))
 
+@app.route('/api/live/stream')
+@login_required
+@teacher_allowed
+def live_stream():
+    # Server-Sent Events: pushes today's per-class tallies whenever they change
+    if live_stats is None:
+        abort(404)
+    scope = None
+    if current_user.role in ['teacher', 'in_charge']:
+        scope = {str(x) for x in getattr(current_user, 'assigned_classes', []) if x}
+
+    def generate():
+        version = None
+        while True:
+            new_version = live_stats.wait_for_change(version, timeout=LIVE_HEARTBEAT_SECONDS)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(live_stats.snapshot(class_ids=scope))}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/class_incharge')
 @login_required
 def class_incharge():
@@ -418,41 +716,39 @@ def class_incharge():
     # Today's stats (Day-wise student based)
     today = datetime.utcnow().date()
     today_str = today.strftime('%Y-%m-%d')
-    attendance_today = Attendance.query.filter_by(date=today_str, class_id=selected_class_id).all()
-    
-    # student_id -> set of statuses today
-    student_today_statuses = {}
-    for rec in attendance_today:
-        sid = str(getattr(rec, 'student_id', ''))
-        if sid not in student_today_statuses:
-            student_today_statuses[sid] = set()
-        student_today_statuses[sid].add(getattr(rec, 'status', ''))
-
-    stats = {'present': 0, 'absent': 0, 'od': 0, 'leave': 0, 'late': 0}
-    for sid, statuses in student_today_statuses.items():
-        if 'Absent' in statuses:
-            stats['absent'] += 1
-        else:
-            stats['present'] += 1
-            if 'OD' in statuses: stats['od'] += 1
-            elif 'Leave' in statuses: stats['leave'] += 1
-            elif 'Late' in statuses: stats['late'] += 1
+    if live_stats is not None:
+        # {student_id: {subject_id: status}} and the day-wise tally straight from the live service
+        stats, today_status_map = live_stats.class_today(selected_class_id)
+    else:
+        today_groups = Attendance.query.filter_by(date=today_str, class_id=selected_class_id) \
+            .aggregate(group_by=('student_id', 'subject_id', 'status'))
         
+        # student_id -> set of statuses today
+        student_today_statuses = {}
+        for sid, subid, st in today_groups:
+            student_today_statuses.setdefault(str(sid or ''), set()).add(st or '')
+
+        stats = {'present': 0, 'absent': 0, 'od': 0, 'leave': 0, 'late': 0}
+        for sid, statuses in student_today_statuses.items():
+            if 'Absent' in statuses:
+                stats['absent'] += 1
+            else:
+                stats['present'] += 1
+                if 'OD' in statuses: stats['od'] += 1
+                elif 'Leave' in statuses: stats['leave'] += 1
+                elif 'Late' in statuses: stats['late'] += 1
+        
+        # Pre-map today's attendance for quick lookup
+        today_status_map = {} # {student_id: {subject_id: status}}
+        for sid, subid, st in today_groups:
+            today_status_map.setdefault(str(sid or ''), {})[str(subid or '')] = (st or '').strip()
+
     # Overall student stats + Subject-wise stats
     rep_data = []
-    
-    # Pre-map today's attendance for quick lookup
-    today_status_map = {} # {student_id: {subject_id: status}}
-    for rec in attendance_today:
-        sid = str(getattr(rec, 'student_id', ''))
-        subid = str(getattr(rec, 'subject_id', ''))
-        status = getattr(rec, 'status', '').strip()
-        if sid not in today_status_map:
-            today_status_map[sid] = {}
-        today_status_map[sid][subid] = status
+    overall_stats = Student.attendance_stats_many(students)
 
     for s in students:
-        overall_res = s.get_attendance_stats()
+        overall_res = overall_stats[str(s.id)]
         
         # Determine subject-wise status for today
         subject_today_data = {}
@@ -473,7 +769,7 @@ def class_incharge():
             'subject_today': subject_today_data
         })
 
-    return render_template('class_incharge.html', 
+    return render_page('class_incharge.html', 
                            cls=cls, 
                            students=rep_data, 
                            stats=stats,
@@ -493,11 +789,8 @@ def login():
             return render_template('login.html')
 
         try:
-            # 2. Fetch user safely (try both username and email fields)
-            user = User.query.filter_by(username=username).first()
-            if not user:
-                # allow login using email if someone types it
-                user = User.query.filter_by(email=username).first()
+            # 2. Fetch user safely (username or email via the lowercase login-key index)
+            user = User.find_by_login(username)
             
             # debug output to console (helpful during development)
             if not user:
@@ -574,6 +867,7 @@ def teachers():
 @login_required
 @admin_required
 def bulk_upload_teachers():
+    import pandas as pd # heavy (numpy/openpyxl); only the import/export routes load it
     if 'file' not in request.files:
         flash('No file part', 'danger')
         return redirect(url_for('teachers'))
@@ -607,41 +901,42 @@ def bulk_upload_teachers():
             all_classes_map = {str(c.name).strip().lower(): str(c.id) for c in Classroom.query.all()}
             success_count = 0
             
-            for _, row in df.iterrows():
-                name = str(row['Name']).strip()
-                email = str(row['Email']).strip().lower()
-                phone = str(row.get('Phone', '')).strip() if 'Phone' in df.columns else None
-                password = str(row.get('Password', 'teacher123')).strip()
-                classes_str = str(row.get('Classes', '')).strip() if 'Classes' in df.columns else ""
-                
-                # Resolve class names to IDs
-                assigned_classes = []
-                if classes_str and classes_str.lower() != 'nan':
-                    # Support comma or semicolon separated names
-                    class_names = [n.strip().lower() for n in classes_str.replace(';', ',').split(',') if n.strip()]
-                    for name_item in class_names:
-                        cid = all_classes_map.get(name_item)
-                        if cid:
-                            assigned_classes.append(cid)
+            with BulkWriter() as writer:
+                for _, row in df.iterrows():
+                    name = str(row['Name']).strip()
+                    email = str(row['Email']).strip().lower()
+                    phone = str(row.get('Phone', '')).strip() if 'Phone' in df.columns else None
+                    password = str(row.get('Password', 'teacher123')).strip()
+                    classes_str = str(row.get('Classes', '')).strip() if 'Classes' in df.columns else ""
                 
-                if not name or not email or email in existing_users:
-                    continue
+                    # Resolve class names to IDs
+                    assigned_classes = []
+                    if classes_str and classes_str.lower() != 'nan':
+                        # Support comma or semicolon separated names
+                        class_names = [n.strip().lower() for n in classes_str.replace(';', ',').split(',') if n.strip()]
+                        for name_item in class_names:
+                            cid = all_classes_map.get(name_item)
+                            if cid:
+                                assigned_classes.append(cid)
                 
-                hashed_pw = generate_password_hash(password, method='pbkdf2:sha256')
-                new_teacher = User(
-                    name=name, 
-                    email=email, 
-                    username=email.strip().lower(), 
-
-                    password=hashed_pw, 
-                    role='teacher', 
-                    phone=phone,
-                    assigned_classes=assigned_classes
-                )
-                new_teacher.save()
-                existing_users.add(email)
-                success_count += 1
+                    if not name or not email or email in existing_users:
+                        continue
                 
+                    hashed_pw = generate_password_hash(password, method='pbkdf2:sha256')
+                    new_teacher = User(
+                        name=name, 
+                        email=email, 
+                        username=email.strip().lower(), 
+
+                        password=hashed_pw, 
+                        role='teacher', 
+                        phone=phone,
+                        assigned_classes=assigned_classes
+                    )
+                    writer.save(new_teacher)
+                    existing_users.add(email)
+                    success_count += 1
+            print(f"Teacher import: {writer.summary()}")
             flash(f'Successfully imported {success_count} teachers!', 'success')
         except Exception as e:
             flash(f'Error processing file: {e}', 'danger')
@@ -674,8 +969,10 @@ def classes():
 def delete_class(id):
     cls = Classroom.query.get_or_404(id)
     if cls:
-        cls.delete()
-        flash('Class deleted!', 'info')
+        # With its students, their logins and attendance (cascade.py)
+        job_id, done = cascade_jobs.start('class', cls.id, label=cls.name, user_id=current_user.id, wait=CASCADE_WAIT)
+        flash('Class deleted!' if done else f'Deleting class {cls.name} and its records in the background '
+              f'(job {job_id}, progress at {url_for("api_cascade_job", job_id=job_id)}).', 'info')
     return redirect(url_for('classes'))
 
 @app.route('/edit_class/<id>', methods=['POST'])
@@ -685,12 +982,15 @@ def delete_class(id):
 def edit_class(id):
     try:
         cls = Classroom.query.get_or_404(id)
+        old_name = getattr(cls, 'name', None)
         cls.update(
             name=request.form.get('name'),
             dept=request.form.get('dept'),
             current_semester=request.form.get('current_semester'),
             year=request.form.get('year')
         )
+        if cls.name != old_name:
+            denormalize.fan_out('classroom', cls)
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({'status': 'success', 'message': 'Class updated!'})
         flash('Class updated!', 'success')
@@ -703,8 +1003,10 @@ def edit_class(id):
 @app.route('/api/get_classes/<dept>')
 @login_required
 def api_get_classes(dept):
-    classes = Classroom.query.filter_by(dept=dept).all()
-    return jsonify([{'id': c.id, 'name': c.name} for c in classes])
+    def build():
+        classes = Classroom.query.filter_by(dept=dept).all()
+        return [{'id': c.id, 'name': c.name} for c in classes]
+    return conditional_json(['classrooms'], build)
 
 @app.route('/api/get_semesters/<class_id>')
 
@@ -729,41 +1031,47 @@ def get_class_details(class_id):
 
 @login_required
 def get_students_by_class(class_id):
-    students = Student.query.filter_by(class_id=class_id).all()
-    return jsonify([{
-        'id': s.id,
-        'name': s.name,
-        'roll_no': s.roll_no
-    } for s in students])
+    def build():
+        students = Student.query.filter_by(class_id=class_id).all()
+        return [{
+            'id': s.id,
+            'name': s.name,
+            'roll_no': s.roll_no
+        } for s in students]
+    return conditional_json(['students'], build)
 
 @app.route('/api/get_all_classes')
 @login_required
 def get_all_classes():
-    classes = Classroom.query.all()
-    return jsonify([{'id': c.id, 'name': c.name, 'dept': c.dept} for c in classes])
+    def build():
+        classes = Classroom.query.all()
+        return [{'id': c.id, 'name': c.name, 'dept': c.dept} for c in classes]
+    return conditional_json(['classrooms'], build)
 
 @app.route('/api/get_subjects_by_semester/<semester_id>/<dept>')
 @login_required
 def get_subjects_by_semester(semester_id, dept):
-    # Fetch all subjects for this semester (trying both string and int)
-    subjects_for_sem = Subject.query.filter_by(semester=semester_id).all()
-    if not subjects_for_sem:
-        try:
-            subjects_for_sem = Subject.query.filter_by(semester=int(semester_id)).all()
-        except (ValueError, TypeError):
-            subjects_for_sem = []
-    
-    # Filter by department in Python (case-insensitive and stripped)
-    filtered = [
-        s for s in subjects_for_sem 
-        if str(getattr(s, 'dept', '')).lower().strip() == dept.lower().strip()
-    ]
-            
-    return jsonify([{
-        'id': s.id,
-        'name': s.name,
-        'code': s.code
-    } for s in filtered])
+    def build():
+        # Fetch all subjects for this semester (trying both string and int)
+        subjects_for_sem = Subject.query.filter_by(semester=semester_id).all()
+        if not subjects_for_sem:
+            try:
+                subjects_for_sem = Subject.query.filter_by(semester=int(semester_id)).all()
+            except (ValueError, TypeError):
+                subjects_for_sem = []
+        
+        # Filter by department in Python (case-insensitive and stripped)
+        filtered = [
+            s for s in subjects_for_sem 
+            if str(getattr(s, 'dept', '')).lower().strip() == dept.lower().strip()
+        ]
+                
+        return [{
+            'id': s.id,
+            'name': s.name,
+            'code': s.code
+        } for s in filtered]
+    return conditional_json(['subjects'], build)
 
 @app.route('/delete_teacher/<id>')
 
@@ -786,6 +1094,7 @@ def edit_teacher(id):
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
         
     teacher = User.query.get_or_404(id)
+    old_name = getattr(teacher, 'name', None)
     update_data = {
         'name': request.form.get('name'),
         'email': request.form.get('email'),
@@ -797,6 +1106,8 @@ def edit_teacher(id):
         update_data['password'] = generate_password_hash(request.form.get('password'), method='pbkdf2:sha256')
     
     teacher.update(**update_data)
+    if teacher.name != old_name:
+        denormalize.fan_out('teacher', teacher)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'status': 'success', 'message': 'Teacher updated successfully!'})
@@ -885,6 +1196,7 @@ def students():
         # Create Student Record
         new_student = Student(name=name, roll_no=roll_no, dept=dept, phone=phone, semester=semester, class_id=class_id)
         new_student.save()
+        student_index.upsert(new_student)
         
         # Create User Login for Student
         default_pw = generate_password_hash('student123', method='pbkdf2:sha256')
@@ -894,13 +1206,19 @@ def students():
         flash(f'Student {name} added! Login: {roll_no} / student123', 'success')
         return redirect(url_for('students'))
     
-    all_students = Student.query.all()
-    # Sort students by roll no
-    all_students.sort(key=lambda x: x.roll_no.lower())
     all_classes = Classroom.query.all()
     all_depts = Department.query.all()
-    class_map = {str(c.id): c.name for c in all_classes}
-    return render_template('students.html', students=all_students, classes=all_classes, class_map=class_map, departments=all_depts)
+
+    def load_rows():
+        all_students = Student.query.all()
+        # Sort students by roll no
+        all_students.sort(key=lambda x: x.roll_no.lower())
+        class_map = {str(c.id): c.name for c in all_classes}
+        return {'students': all_students, 'class_map': class_map}
+
+    # The rows carry admin-only edit/delete buttons: one cached copy per role
+    student_rows = render_fragment('student_rows.html', f"all:{current_user.role}", ['students', 'classrooms'], load_rows)
+    return render_page('students.html', student_rows=student_rows, classes=all_classes, departments=all_depts)
 
 @app.route('/delete_student/<id>')
 
@@ -909,12 +1227,11 @@ def students():
 def delete_student(id):
     student = Student.query.get_or_404(id)
     if student:
-        # Also delete the associated user account
-        user = User.query.filter_by(student_id=student.id).first()
-        if user:
-            user.delete()
-        student.delete()
-        flash('Student deleted!', 'info')
+        # With the student's login and attendance records (cascade.py)
+        job_id, done = cascade_jobs.start('student', student.id, label=student.roll_no, user_id=current_user.id,
+                                          wait=CASCADE_WAIT)
+        flash('Student deleted!' if done else f'Deleting student {student.roll_no} in the background '
+              f'(job {job_id}, progress at {url_for("api_cascade_job", job_id=job_id)}).', 'info')
     return redirect(url_for('students'))
 
 @app.route('/edit_student/<id>', methods=['POST'])
@@ -923,6 +1240,7 @@ def delete_student(id):
 @admin_required
 def edit_student(id):
     student = Student.query.get_or_404(id)
+    before = copy.copy(student)
     class_id = request.form.get('class_id')
     semester = request.form.get('semester', student.semester)
     if class_id:
@@ -939,6 +1257,10 @@ def edit_student(id):
         'class_id': class_id
     }
     student.update(**update_data)
+    student_index.upsert(student)
+    defaulters_index.touch([student.id]) # class, department or roll number may have changed
+    if denormalize.display_changed('student', before, student):
+        denormalize.fan_out('student', student, on_done=status_history.invalidate)
     
     # Update corresponding User account
     user = User.query.filter_by(student_id=student.id).first()
@@ -975,6 +1297,7 @@ def get_student(id):
 @login_required
 @admin_required
 def bulk_upload_students():
+    import pandas as pd
     if 'file' not in request.files:
         flash('No file part', 'danger')
         return redirect(url_for('students'))
@@ -1014,118 +1337,110 @@ def bulk_upload_students():
             existing_users = {str(u.username).strip(): u for u in User.query.all()}
             
             db_conn = get_db()
-            batch = db_conn.batch()
-            batch_ops = 0
             
             success_count = 0
             skipped_count = 0
             
-            for _, row in df.iterrows():
-                name = str(row['Name']).strip()
-                roll_no = str(row['Roll No']).strip()
-                dept = str(row['Dept']).strip()
-                email = str(row.get('Email', '')).strip()
-                phone = str(row.get('Phone', '')) if 'Phone' in df.columns else None
-                class_name = str(row.get('Class_Name', '')).strip()
+            with BulkWriter() as writer:
+                for _, row in df.iterrows():
+                    name = str(row['Name']).strip()
+                    roll_no = str(row['Roll No']).strip()
+                    dept = str(row['Dept']).strip()
+                    email = str(row.get('Email', '')).strip()
+                    phone = str(row.get('Phone', '')) if 'Phone' in df.columns else None
+                    class_name = str(row.get('Class_Name', '')).strip()
                 
-                if not roll_no or roll_no.lower() == 'nan' or not name or name.lower() == 'nan':
-                    print(f"DEBUG: Skipping {name}/{roll_no} - missing name or roll_no")
-                    skipped_count += 1
-                    continue
+                    if not roll_no or roll_no.lower() == 'nan' or not name or name.lower() == 'nan':
+                        print(f"DEBUG: Skipping {name}/{roll_no} - missing name or roll_no")
+                        skipped_count += 1
+                        continue
                 
-                if roll_no in existing_roll_nos:
-                    print(f"DEBUG: Skipping {name}/{roll_no} - already exists in database")
-                    skipped_count += 1
-                    continue
-
-                cls = all_classes.get(class_name)
-                if not cls:
-                    # Try case-insensitive match
-                    cls = next((c for n, c in all_classes.items() if n.lower() == class_name.lower()), None)
+                    if roll_no in existing_roll_nos:
+                        print(f"DEBUG: Skipping {name}/{roll_no} - already exists in database")
+                        skipped_count += 1
+                        continue
+
+                    cls = all_classes.get(class_name)
+                    if not cls:
+                        # Try case-insensitive match
+                        cls = next((c for n, c in all_classes.items() if n.lower() == class_name.lower()), None)
                 
-                if not cls:
-                    print(f"DEBUG: Creating missing class {class_name} for student {name}")
-                    # Auto-create classroom if missing (Rectify)
-                    try:
-                        new_cls_ref = db_conn.collection(Classroom.__collection__).document()
+                    # The row's class, student and user writes go in one batch
+                    writer.reserve(3)
+                    if not cls:
+                        print(f"DEBUG: Creating missing class {class_name} for student {name}")
+                        # Auto-create classroom if missing (Rectify)
+                        try:
+                            new_cls_ref = db_conn.collection(Classroom.__collection__).document()
                         
-                        # Infer year/semester (I=1/1, II=2/3, III=3/5, IV=4/7)
-                        year, sem = "1", "1"
-                        if "IV" in class_name: year, sem = "4", "7"
-                        elif "III" in class_name: year, sem = "3", "5"
-                        elif "II" in class_name: year, sem = "2", "3"
+                            # Infer year/semester (I=1/1, II=2/3, III=3/5, IV=4/7)
+                            year, sem = "1", "1"
+                            if "IV" in class_name: year, sem = "4", "7"
+                            elif "III" in class_name: year, sem = "3", "5"
+                            elif "II" in class_name: year, sem = "2", "3"
                         
-                        cls = Classroom(
-                            id=new_cls_ref.id,
-                            name=class_name,
-                            dept=dept,
-                            year=year,
-                            current_semester=sem
-                        )
-                        batch.set(new_cls_ref, cls.to_dict())
-                        batch_ops += 1
-                        all_classes[class_name] = cls # Add to cache for next rows
-                    except Exception as e:
-                        print(f"Error creating class {class_name}: {e}")
-                        skipped_count += 1
-                        continue
+                            cls = Classroom(
+                                id=new_cls_ref.id,
+                                name=class_name,
+                                dept=dept,
+                                year=year,
+                                current_semester=sem
+                            )
+                            writer.set(new_cls_ref, cls.to_dict())
+                            all_classes[class_name] = cls # Add to cache for next rows
+                        except Exception as e:
+                            print(f"Error creating class {class_name}: {e}")
+                            skipped_count += 1
+                            continue
 
-                try:
-                    # 1. Pre-generate Student ID for linking
-                    student_ref = db_conn.collection(Student.__collection__).document()
-                    new_student = Student(
-                        id=student_ref.id, 
-                        name=name, 
-                        roll_no=roll_no, 
-                        dept=dept, 
-                        phone=phone, 
-                        semester=cls.current_semester, 
-                        class_id=cls.id
-                    )
-                    
-                    # Add student to batch
-                    batch.set(student_ref, new_student.to_dict())
-                    batch_ops += 1
-
-                    # 2. Check User association
-                    user = existing_users.get(roll_no)
-                    if user:
-                        user_ref = db_conn.collection(User.__collection__).document(str(user.id))
-                        # Update existing user
-                        update_data = {'student_id': new_student.id, 'name': name}
-                        if phone: update_data['phone'] = phone
-                        batch.update(user_ref, update_data)
-                    else:
-                        # Create new user login
-                        user_ref = db_conn.collection(User.__collection__).document()
-                        default_pw = generate_password_hash('student123', method='pbkdf2:sha256')
-                        new_user = User(
-                            name=name,
-                            username=roll_no, 
-                            email=email if email else None,
-                            password=default_pw, 
-                            role='student', 
-                            student_id=new_student.id, 
-                            phone=phone
+                    try:
+                        # 1. Pre-generate Student ID for linking
+                        student_ref = db_conn.collection(Student.__collection__).document()
+                        new_student = Student(
+                            id=student_ref.id, 
+                            name=name, 
+                            roll_no=roll_no, 
+                            dept=dept, 
+                            phone=phone, 
+                            semester=cls.current_semester, 
+                            class_id=cls.id
                         )
-                        batch.set(user_ref, new_user.to_dict())
                     
-                    batch_ops += 1
-                    success_count += 1
-                    existing_roll_nos.add(roll_no) # Prevent internal duplicates in same file
-
-                    # Firestore batch limit is 500
-                    if batch_ops >= 450:
-                        batch.commit()
-                        batch = db_conn.batch()
-                        batch_ops = 0
+                        # Add student to batch
+                        writer.set(student_ref, new_student.to_dict())
+
+                        # 2. Check User association
+                        user = existing_users.get(roll_no)
+                        if user:
+                            user_ref = db_conn.collection(User.__collection__).document(str(user.id))
+                            # Update existing user
+                            update_data = {'student_id': new_student.id, 'name': name}
+                            if phone: update_data['phone'] = phone
+                            writer.update(user_ref, update_data)
+                            user_cache.pop(str(user.id))
+                        else:
+                            # Create new user login
+                            user_ref = db_conn.collection(User.__collection__).document()
+                            default_pw = generate_password_hash('student123', method='pbkdf2:sha256')
+                            new_user = User(
+                                name=name,
+                                username=roll_no, 
+                                email=email if email else None,
+                                password=default_pw, 
+                                role='student', 
+                                student_id=new_student.id, 
+                                phone=phone
+                            )
+                            writer.set(user_ref, new_user.to_dict())
+                    
+                        success_count += 1
+                        existing_roll_nos.add(roll_no) # Prevent internal duplicates in same file
 
-                except Exception as e:
-                    print(f"Error processing {name}/{roll_no}: {e}")
-                    skipped_count += 1
-            
-            if batch_ops > 0:
-                batch.commit()
+                    except Exception as e:
+                        print(f"Error processing {name}/{roll_no}: {e}")
+                        skipped_count += 1
+            print(f"Student import: {writer.summary()}")
+            student_index.invalidate()
             
             if success_count > 0:
                 flash(f'Successfully imported {success_count} students!', 'success')
@@ -1225,6 +1540,7 @@ def subjects():
 @login_required
 @admin_required
 def bulk_upload_subjects():
+    import pandas as pd
     if 'file' not in request.files:
         flash('No file part', 'danger')
         return redirect(url_for('subjects'))
@@ -1257,27 +1573,28 @@ def bulk_upload_subjects():
             teachers_map = {str(getattr(u, 'email', '')).strip().lower(): u.id for u in User.query.filter_by(role='teacher').all() if getattr(u, 'email', None)}
             success_count = 0
             
-            for _, row in df.iterrows():
-                name = str(row['Name']).strip()
-                code = str(row['Code']).strip()
-                dept = str(row['Dept']).strip()
-                semester = str(row['Semester']).strip()
-                teacher_email = str(row.get('Teacher_Email', '')).strip().lower()
+            with BulkWriter() as writer:
+                for _, row in df.iterrows():
+                    name = str(row['Name']).strip()
+                    code = str(row['Code']).strip()
+                    dept = str(row['Dept']).strip()
+                    semester = str(row['Semester']).strip()
+                    teacher_email = str(row.get('Teacher_Email', '')).strip().lower()
                 
-                if not name or not code:
-                    continue
-                
-                teacher_id = teachers_map.get(teacher_email)
-                new_subject = Subject(
-                    name=name, 
-                    code=code, 
-                    dept=dept, 
-                    semester=semester, 
-                    teacher_id=teacher_id
-                )
-                new_subject.save()
-                success_count += 1
+                    if not name or not code:
+                        continue
                 
+                    teacher_id = teachers_map.get(teacher_email)
+                    new_subject = Subject(
+                        name=name, 
+                        code=code, 
+                        dept=dept, 
+                        semester=semester, 
+                        teacher_id=teacher_id
+                    )
+                    writer.save(new_subject)
+                    success_count += 1
+            print(f"Subject import: {writer.summary()}")
             flash(f'Successfully imported {success_count} subjects!', 'success')
         except Exception as e:
             flash(f'Error processing file: {e}', 'danger')
@@ -1308,13 +1625,13 @@ def download_subject_template():
 @login_required
 @admin_required
 def delete_subject(id):
-    try:
-        subject = Subject.query.get_or_404(id)
-        if subject:
-            subject.delete()
-            flash('Subject deleted!', 'info')
-    except Exception as e:
-        flash(f'Error deleting subject: {str(e)}', 'danger')
+    subject = Subject.query.get_or_404(id)
+    if subject:
+        # With its attendance records (cascade.py)
+        job_id, done = cascade_jobs.start('subject', subject.id, label=subject.name, user_id=current_user.id,
+                                          wait=CASCADE_WAIT)
+        flash('Subject deleted!' if done else f'Deleting subject {subject.name} and its records in the background '
+              f'(job {job_id}, progress at {url_for("api_cascade_job", job_id=job_id)}).', 'info')
     return redirect(url_for('subjects'))
 
 @app.route('/edit_subject/<id>', methods=['POST'])
@@ -1323,6 +1640,7 @@ def delete_subject(id):
 @admin_required
 def edit_subject(id):
     subject = Subject.query.get_or_404(id)
+    before = copy.copy(subject)
     subject.name = request.form.get('name')
     subject.code = request.form.get('code')
     subject.dept = request.form.get('dept')
@@ -1331,6 +1649,8 @@ def edit_subject(id):
     subject.teacher_id = teacher_id if teacher_id else None
     
     subject.save()
+    if denormalize.display_changed('subject', before, subject):
+        denormalize.fan_out('subject', subject)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'status': 'success', 'message': 'Subject updated successfully!'})
@@ -1387,11 +1707,9 @@ def attendance():
         students = Student.query.filter_by(class_id=class_id).all()
         student_ids = {str(s.id) for s in students}
         
-        # Use Firestore Batch Write for performance
-        db_conn = get_db()
-        batch = db_conn.batch()
-        count = 0
-        
+        records = []
+        classroom = get_cached_classroom(class_id)
+
         # Valid status options
         VALID_STATUSES = ['Present', 'Absent', 'OD', 'Leave', 'Late']
         
@@ -1405,17 +1723,15 @@ def attendance():
                     class_id=str(class_id),
                     teacher_id=str(current_user.id),
                     date=date_str, # Store as string YYYY-MM-DD
-                    status=status
+                    status=status,
+                    **denormalize.display_fields(student, subject, classroom, current_user)
                 )
-                # Prepare batch write
-                doc_ref = db_conn.collection(Attendance.__collection__).document()
-                batch.set(doc_ref, new_record.to_dict())
-                count += 1
+                records.append(new_record)
 
-        if count > 0:
-            batch.commit()
+        # One batch write, or one local append with write-behind
+        save_attendance(records)
 
-        flash(f'Attendance marked for {count} students!', 'success')
+        flash(f'Attendance marked for {len(records)} students!', 'success')
         return redirect(url_for('dashboard'))
 
     return render_template('attendance.html', 
@@ -1441,13 +1757,15 @@ def get_students_by_subject(subject_id):
 
 @login_required
 def api_subjects_by_semester(semester_id):
-    subjects = Subject.query.filter_by(semester=semester_id).all()
-    return jsonify([{
-        'id': s.id,
-        'name': s.name,
-        'code': s.code,
-        'dept': s.dept
-    } for s in subjects])
+    def build():
+        subjects = Subject.query.filter_by(semester=semester_id).all()
+        return [{
+            'id': s.id,
+            'name': s.name,
+            'code': s.code,
+            'dept': s.dept
+        } for s in subjects]
+    return conditional_json(['subjects'], build)
 
 @app.route('/admin/attendance-shortcut')
 @login_required
@@ -1490,13 +1808,21 @@ def attendance_history():
         available_dates = sorted(list({str(getattr(r, 'date', '')) for r in all_recs if getattr(r, 'date', None)}), reverse=True)
         
         history = []
+        teacher_names = {}
         for r in records:
             sub = all_subjects.get(str(r.subject_id))
+            # Denormalized display fields first; older records fall back to lookups
+            marked_by = getattr(r, 'teacher_name', None)
+            if not marked_by and r.teacher_id:
+                if r.teacher_id not in teacher_names:
+                    teacher = User.get_cached(r.teacher_id)
+                    teacher_names[r.teacher_id] = teacher.name if teacher else None
+                marked_by = teacher_names[r.teacher_id]
             history.append({
-                'subject_name': sub.name if sub else ('General/Gate' if str(r.subject_id) == 'GLOBAL' else 'Other Session'),
-                'subject_code': sub.code if sub else (str(r.subject_id) if str(r.subject_id) == 'GLOBAL' else 'N/A'),
+                'subject_name': getattr(r, 'subject_name', None) or (sub.name if sub else ('General/Gate' if str(r.subject_id) == 'GLOBAL' else 'Other Session')),
+                'subject_code': getattr(r, 'subject_code', None) or (sub.code if sub else (str(r.subject_id) if str(r.subject_id) == 'GLOBAL' else 'N/A')),
                 'status': r.status,
-                'marked_by': User.query.get(r.teacher_id).name if r.teacher_id and User.query.get(r.teacher_id) else 'System'
+                'marked_by': marked_by or 'System'
             })
             
         return render_template('daily_attendance.html', 
@@ -1581,6 +1907,7 @@ def reports():
 
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    history = request.args.get('history') == '1' # add closed semesters from the archive
 
     # Base Student Query - Use server-side filtering where possible
     s_query = Student.query
@@ -1598,10 +1925,9 @@ def reports():
                 s_query = s_query.where('class_id', 'in', assigned_ids)
             # Else we filter in python for > 10 classes
     
-    all_students_pool = s_query.all()
     students = []
     
-    for s in all_students_pool:
+    for s in s_query.iter():
         # Semester Filter (Python side as it's less common to index)
         if semester:
             s_sem = str(getattr(s, 'semester', ''))
@@ -1666,60 +1992,33 @@ def reports():
     all_teachers = User.query.filter_by(role='teacher').all() 
     departments = [d.name for d in get_cached_metadata('departments', Department)]
 
-    # Optimization: Perform total aggregation in a single query instead of O(N) queries
-    # Fetch all relevant attendance records for the students being displayed
-    rep_attendance_query = Attendance.query
-    if subject_id: rep_attendance_query = rep_attendance_query.filter_by(subject_id=subject_id)
-    if class_id: rep_attendance_query = rep_attendance_query.filter_by(class_id=class_id)
-    
-    relevant_attendance = rep_attendance_query.all()
-    # student_id -> {date -> set of statuses}
-    student_days_map = {}
-    student_lates_map = {}
-    
-    for rec in relevant_attendance:
-        sid = getattr(rec, 'student_id', None)
-        if not sid: continue
-        sid_str = str(sid)
-        if sid_str not in student_days_map:
-            student_days_map[sid_str] = {}
-            student_lates_map[sid_str] = 0
-        
-        dt = getattr(rec, 'date', None)
-        if not dt: continue
-        
-        if dt not in student_days_map[sid_str]:
-            student_days_map[sid_str][dt] = set()
-            
-        st = getattr(rec, 'status', 'Present')
-        student_days_map[sid_str][dt].add(st)
-        if st == 'Late':
-            student_lates_map[sid_str] += 1
+    # student_id -> (total_days, present, absent, od, leave, lates), day-wise: a day with any
+    # Absent counts absent, otherwise present (+ OD, else Leave)
+    mirror = fresh_mirror()
+    if mirror is not None:
+        # Indexed GROUP BY on the local mirror instead of streaming every matching record
+        student_counts = mirror.student_day_counts(subject_id=subject_id, class_id=class_id)
+    else:
+        rep_attendance_query = Attendance.query
+        if subject_id: rep_attendance_query = rep_attendance_query.filter_by(subject_id=subject_id)
+        if class_id: rep_attendance_query = rep_attendance_query.filter_by(class_id=class_id)
+
+        # One (student, date, status) grouped aggregation instead of materializing every record
+        status_counts = {} # student_id -> {(date, status): records}
+        for (sid, dt, st), r in rep_attendance_query.aggregate(group_by=('student_id', 'date', 'status')).items():
+            if not sid or not dt: continue
+            counts = status_counts.setdefault(str(sid), {})
+            counts[(dt, st or 'Present')] = counts.get((dt, st or 'Present'), 0) + r['count']
+        student_counts = {sid: day_counts(counts) for sid, counts in status_counts.items()}
+    if history:
+        # Closed semesters are no longer in attendance_records; their rollups hold the same counts
+        for sid, counts in archived_day_counts(class_id=class_id, subject_id=subject_id).items():
+            student_counts[sid] = add_counts(student_counts.get(sid), counts)
 
     report_data = []
-    for s in students:
-        s_id_str = str(s.id)
-        days = student_days_map.get(s_id_str, {})
-        total_days = len(days)
     for s in students: # Iterate over the already filtered 'students' list
-        s_id_str = str(s.id)
-        days = student_days_map.get(s_id_str, {})
-        total_days = len(days)
-        
-        present_count = 0
-        absent_count = 0
-        od_count = 0
-        leave_count = 0
-        
-        for dt, statuses in days.items():
-            if 'Absent' in statuses:
-                absent_count += 1
-            else:
-                present_count += 1
-                if 'OD' in statuses: od_count += 1
-                elif 'Leave' in statuses: leave_count += 1
-        
-        total_lates_all = student_lates_map.get(s_id_str, 0)
+        total_days, present_count, absent_count, od_count, leave_count, total_lates_all = \
+            student_counts.get(str(s.id), (0, 0, 0, 0, 0, 0))
         penalty = total_lates_all // 3
         effective_present = max(0, present_count - penalty)
         
@@ -1742,7 +2041,7 @@ def reports():
     teacher_map = {str(t.id): t.name for t in all_teachers}
     student_map = {str(s.id): s.name for s in students}
 
-    return render_template('reports.html', 
+    return render_page('reports.html', 
                          report=report_data, 
                          subjects=all_subjects, 
                          classes=all_classes,
@@ -1752,40 +2051,50 @@ def reports():
                          class_map=class_map,
                          subject_map=subject_map,
                          teacher_map=teacher_map,
-                         student_map=student_map)
+                         student_map=student_map,
+                         data_as_of=mirror.as_of() if mirror is not None else None)
 
 @app.route('/export_excel')
 @login_required
 @teacher_allowed
 def export_excel():
+    import pandas as pd
     subject_id = request.args.get('subject_id')
     dept = request.args.get('dept')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
 
-    # Fetch all data and filter in Python for simplicity in migration
-    att_list = Attendance.query.all()
+    history = request.args.get('history') == '1'
+
+    # Subject and date bounds go to the query (dates are stored as 'YYYY-MM-DD' strings)
+    att_query = Attendance.query
+    if subject_id: att_query = att_query.filter_by(subject_id=subject_id)
+    if start_date: att_query = att_query.where('date', '>=', start_date)
+    if end_date: att_query = att_query.where('date', '<=', end_date)
+    records = ((att.student_id, att.subject_id, att.date, att.status) for att in att_query.iter())
+    if history:
+        archived = ((d.get('student_id'), d.get('subject_id'), d.get('date'), d.get('status'))
+                    for _, d in archived_records(subject_id, start_date, end_date))
+        records = itertools.chain(archived, records)
+
+    subject_names = {str(s.id): s.name for s in get_cached_metadata('subjects', Subject)}
+    students = {} # student_id -> Student or None, one lookup per student instead of per record
     results = []
-    
-    for att in att_list:
-        # Apply filters
-        if subject_id and str(att.subject_id) != str(subject_id): continue
-        if start_date and att.date.date() < datetime.strptime(start_date, '%Y-%m-%d').date(): continue
-        if end_date and att.date.date() > datetime.strptime(end_date, '%Y-%m-%d').date(): continue
-        
-        student = Student.query.get(att.student_id)
+    for student_id, record_subject, record_date, status in records:
+        key = str(student_id)
+        if key not in students:
+            students[key] = Student.query.get(key)
+        student = students[key]
         if not student: continue
         if dept and student.dept != dept: continue
-        
-        subject = Subject.query.get(att.subject_id)
-        
+
         results.append({
             'Student Name': student.name,
             'Roll No': student.roll_no,
             'Department': student.dept,
-            'Subject': subject.name if subject else 'Unknown',
-            'Date': att.date,
-            'Status': att.status
+            'Subject': subject_names.get(str(record_subject), 'Unknown'),
+            'Date': record_date,
+            'Status': status
         })
 
     if not results:
@@ -1819,6 +2128,7 @@ def export_excel():
 @login_required
 @teacher_allowed
 def export_summary_excel():
+    from summary_export import build_summary_workbook, stream_attendance_columns
     # Use the same logic as reports() to calculate the summary
     dept = request.args.get('dept', '')
     class_id = request.args.get('class_id', '')
@@ -1826,95 +2136,44 @@ def export_summary_excel():
     subject_id = request.args.get('subject_id', '')
     
     # 1. Filter Students
-    all_students = Student.query.all()
+    assigned = None
+    if current_user.role == 'teacher':
+        assigned = {str(x) for x in current_user.assigned_classes if x is not None}
+    s_query = Student.query
+    if class_id:
+        s_query = s_query.filter_by(class_id=class_id)
     filtered_students = []
-    for s in all_students:
+    for s in s_query.iter():
         if dept and str(getattr(s, 'dept', '')).lower().strip() != dept.lower().strip(): continue
-        if class_id and str(getattr(s, 'class_id', '')) != str(class_id): continue
         if semester and str(getattr(s, 'semester', '')) != str(semester): continue
-        
-        if current_user.role == 'teacher':
-            assigned = [str(x) for x in current_user.assigned_classes if x is not None]
-            if str(getattr(s, 'class_id', '')) not in assigned: continue
+        if assigned is not None and str(getattr(s, 'class_id', '')) not in assigned: continue
         filtered_students.append(s)
     
     if not filtered_students:
         flash("No students found for export.", "warning")
         return redirect(url_for('reports'))
 
-    # 2. Fetch Attendance and Aggregate
-    att_query = Attendance.query
-    if subject_id: att_query = att_query.filter_by(subject_id=subject_id)
-    if class_id: att_query = att_query.filter_by(class_id=class_id)
-    
-    relevant_attendance = att_query.all()
-    # student_id -> {date -> set of statuses}
-    student_days_map = {}
-    student_lates_map = {}
-    
-    for rec in relevant_attendance:
-        sid = str(getattr(rec, 'student_id', ''))
-        if not sid: continue
-        if sid not in student_days_map:
-            student_days_map[sid] = {}
-            student_lates_map[sid] = 0
-        
-        dt = getattr(rec, 'date', None)
-        if not dt: continue
-        
-        if dt not in student_days_map[sid]:
-            student_days_map[sid][dt] = set()
-            
-        st = getattr(rec, 'status', 'Present')
-        student_days_map[sid][dt].add(st)
-        if st == 'Late':
-            student_lates_map[sid] += 1
-
-    # 3. Build Results
-    results = []
-    for s in filtered_students:
-        s_id_str = str(s.id)
-        days = student_days_map.get(s_id_str, {})
-        total_days = len(days)
-        
-        present_count = 0
-        absent_count = 0
-        od_count = 0
-        leave_count = 0
-        
-        for dt, statuses in days.items():
-            if 'Absent' in statuses:
-                absent_count += 1
-            else:
-                present_count += 1
-                if 'OD' in statuses: od_count += 1
-                elif 'Leave' in statuses: leave_count += 1
-        
-        total_lates_all = student_lates_map.get(s_id_str, 0)
-        penalty = total_lates_all // 3
-        effective_present = max(0, present_count - penalty)
-        
-        perc = min(100.0, round((effective_present / total_days * 100), 2)) if total_days > 0 else 0.0
-        
-        results.append({
-            'Roll No': s.roll_no,
-            'Name': s.name,
-            'Department': s.dept,
-            'Total Days': total_days,
-            'Present Days': effective_present,
-            'Absent Days': absent_count,
-            'OD': od_count,
-            'Leave': leave_count,
-            'Late': total_lates_all,
-            'Penalty (Leaves)': penalty,
-            'Final Percentage': f"{perc}%"
-        })
-
-    df = pd.DataFrame(results)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Summary')
-    output.seek(0)
+    # 2. Stream only the needed attendance columns; aggregation happens in pandas
+    mirror = fresh_mirror()
+    if mirror is not None:
+        columns = mirror.attendance_columns(subject_id=subject_id, class_id=class_id,
+                                            class_ids=sorted(assigned) if assigned is not None else None)
+    else:
+        filters = []
+        if subject_id: filters.append(('subject_id', '==', subject_id))
+        if class_id:
+            filters.append(('class_id', '==', class_id))
+        elif assigned is not None and 0 < len(assigned) <= 10:
+            filters.append(('class_id', 'in', sorted(assigned)))
+        columns = stream_attendance_columns(filters)
+    if request.args.get('history') == '1':
+        for _, data in archived_records(subject_id or None, class_ids=[class_id] if class_id else None):
+            for c in columns:
+                columns[c].append(data.get(c))
+
+    subject_labels = {str(s.id): getattr(s, 'code', None) or s.name for s in get_cached_metadata('subjects', Subject)}
+    class_labels = {str(c.id): c.name for c in get_cached_metadata('classrooms', Classroom)}
+    output = build_summary_workbook(filtered_students, columns, subject_labels, class_labels)
     
     return send_file(
         output,
@@ -2113,10 +2372,23 @@ def departments():
 def delete_department(id):
     dept = Department.query.get_or_404(id)
     if dept:
-        dept.delete()
-        flash('Department deleted!', 'info')
+        # With its classes, subjects, students and their records (cascade.py)
+        job_id, done = cascade_jobs.start('department', dept.id, label=dept.name, user_id=current_user.id,
+                                          wait=CASCADE_WAIT)
+        flash('Department deleted!' if done else f'Deleting department {dept.name} and its records in the background '
+              f'(job {job_id}, progress at {url_for("api_cascade_job", job_id=job_id)}).', 'info')
     return redirect(url_for('departments'))
 
+@app.route('/api/cascade_jobs/<job_id>')
+@login_required
+@admin_required
+def api_cascade_job(job_id):
+    # Progress of a background delete: state, planned and removed counts per collection
+    job = cascade_jobs.status(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown job'}), 404
+    return jsonify(job)
+
 @app.route('/edit_department/<id>', methods=['POST'])
 @login_required
 @admin_required
@@ -2218,91 +2490,43 @@ def status_portal(status_type):
     marked_records = Attendance.query.filter_by(date=selected_date, status=display_status).all()
     marked_student_ids = [str(getattr(r, 'student_id', '')) for r in marked_records]
     
-    # Fetch all students and filter in Python for robustness (handling case/whitespace)
     students = []
     
     # Show results if any filter is applied OR show already marked students by default
     if search_query or dept_filter or class_filter:
-        # Optimization: If class_filter is present, only fetch students of that class
+        # Served from the in-memory search index instead of scanning the collection
         if class_filter:
             # Security: If teacher, ensure they only search their assigned classes
             if assigned_class_ids and str(class_filter) not in assigned_class_ids:
-                pool = []
+                scope = []
             else:
-                pool = Student.query.filter_by(class_id=class_filter).all()
+                scope = [class_filter]
         elif assigned_class_ids:
             # Teacher searching globally - restrict pool to their assigned classes
-            # Use query if under 30 classes, else filter in Python
-            if len(assigned_class_ids) <= 30:
-                pool = Student.query.where('class_id', 'in', assigned_class_ids).all()
-            else:
-                pool = [s for s in Student.query.all() if str(getattr(s, 'class_id', '')) in assigned_class_ids]
+            scope = assigned_class_ids
         else:
-            pool = Student.query.all()
-            
-        for s in pool:
-            # Dept Filter (case-insensitive and trimmed)
-            if dept_filter:
-                s_dept = str(getattr(s, 'dept', '')).lower().strip()
-                if s_dept != dept_filter.lower().strip():
-                    continue
-            
-            # Search Query (Name or Roll No)
-            if search_query:
-                query_l = search_query.lower()
-                s_name = str(getattr(s, 'name', '')).lower()
-                s_roll = str(getattr(s, 'roll_no', '')).lower()
-                if query_l not in s_name and query_l not in s_roll:
-                    continue
-            
-            students.append(s)
+            scope = None
+        students = student_index.search(search_query, class_ids=scope, dept=dept_filter)
     else:
         # Default view: show already marked students
-        if marked_student_ids:
-            all_s = Student.query.all()
-            for s in all_s:
-                sid = str(s.id)
-                if sid in marked_student_ids:
-                    # Filter for teachers: only show their assigned students in default view too
-                    s_class_id = str(getattr(s, 'class_id', ''))
-                    if assigned_class_ids and s_class_id not in assigned_class_ids:
-                        continue
-                    students.append(s)
+        for sid in dict.fromkeys(marked_student_ids):
+            s = student_index.get(sid)
+            if not s: continue
+            # Filter for teachers: only show their assigned students in default view too
+            s_class_id = str(getattr(s, 'class_id', ''))
+            if assigned_class_ids and s_class_id not in assigned_class_ids:
+                continue
+            students.append(s)
     
-    # Sort students: Dept wise then by roll no
-    students.sort(key=lambda x: (str(getattr(x, 'dept', '')).lower(), str(getattr(x, 'roll_no', 'zzzz')).lower()))
+        # Sort students: Dept wise then by roll no
+        students.sort(key=lambda x: (str(getattr(x, 'dept', '')).lower(), str(getattr(x, 'roll_no', 'zzzz')).lower()))
 
-    # Fetch history logs (Last 30 Days)
-    from datetime import timedelta
-    one_month_ago = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
-    db_status = display_status
-    
-    history_records = Attendance.query.filter_by(status=db_status).where('date', '>=', one_month_ago).all()
-    history_records.sort(key=lambda x: getattr(x, 'date', ''), reverse=True)
-    
-    # Resolve student info for history
-    history_data = []
-    # Pre-fetch students and classes to avoid N queries
-    all_students_map = {str(s.id): s for s in Student.query.all()}
+    # History logs (last 30 days) from the rolling per-status window
     all_classes_map = {str(c.id): getattr(c, 'name', 'Unknown') for c in all_classrooms}
-    
-    for rec in history_records:
-        sid = str(getattr(rec, 'student_id', ''))
-        student = all_students_map.get(sid)
-        if student:
-            # Filter history for teachers: only show records of their assigned classes
-            s_class_id = str(getattr(student, 'class_id', ''))
-            if assigned_class_ids and s_class_id not in assigned_class_ids:
-                continue
-                
-            history_data.append({
-                'name': student.name,
-                'roll_no': student.roll_no,
-                'dept': student.dept,
-                'class_name': all_classes_map.get(s_class_id, 'Unknown'),
-                'date': rec.date,
-                'id': rec.id
-            })
+    history_data = status_history.recent(display_status, limit=100,
+                                         class_ids=set(assigned_class_ids) if assigned_class_ids else None)
+    for entry in history_data:
+        entry['class_name'] = all_classes_map.get(entry['class_id'], 'Unknown')
 
     return render_template('status_portal.html', 
                          students=students, 
@@ -2315,7 +2539,60 @@ def status_portal(status_type):
                          class_filter=class_filter,
                          selected_date=selected_date,
                          marked_student_ids=marked_student_ids,
-                         history_data=history_data[:100]) # Limit to 100 recent for performance
+                         history_data=history_data)
+
+@app.route('/api/students/search')
+@login_required
+def api_search_students():
+    # Typeahead for the status portals (gate staff included), served from the search index
+    if current_user.role not in ['admin', 'hod', 'teacher', 'in_charge', 'security']:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    query = request.args.get('q', '').strip()
+    class_id = request.args.get('class_id', '')
+    dept = request.args.get('dept', '')
+    limit = min(request.args.get('limit', 20, type=int) or 20, 100)
+    if not (query or class_id or dept):
+        return jsonify([])
+
+    scope = None
+    if current_user.role in ['teacher', 'in_charge']:
+        scope = [str(x) for x in getattr(current_user, 'assigned_classes', []) if x]
+    if class_id:
+        scope = [class_id] if scope is None or class_id in scope else []
+    matches = student_index.search(query, class_ids=scope, dept=dept, limit=limit)
+    return jsonify([{
+        'id': s.id,
+        'name': getattr(s, 'name', ''),
+        'roll_no': getattr(s, 'roll_no', ''),
+        'dept': getattr(s, 'dept', ''),
+        'class_id': getattr(s, 'class_id', '')
+    } for s in matches])
+
+@app.route('/api/defaulters')
+@login_required
+def api_defaulters():
+    # Students below the threshold, lowest first, from the shortage index (defaulters.py)
+    if current_user.role not in ['admin', 'hod', 'teacher', 'in_charge']:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    if not defaulters_index.enabled:
+        return jsonify({'status': 'error', 'message': 'Defaulters index is disabled'}), 503
+    threshold = request.args.get('threshold', DEFAULTER_THRESHOLD, type=float)
+    class_id = request.args.get('class_id', '')
+    dept = request.args.get('dept', '')
+    limit = min(request.args.get('limit', 500, type=int) or 500, 2000)
+
+    scope = None
+    if current_user.role in ['teacher', 'in_charge']:
+        scope = [str(x) for x in getattr(current_user, 'assigned_classes', []) if x]
+    if class_id:
+        scope = [class_id] if scope is None or class_id in scope else []
+    found = defaulters_index.defaulters(threshold, class_ids=scope, dept=dept, limit=limit) \
+        if scope != [] else []
+    return jsonify({
+        'threshold': threshold,
+        'count': len(found),
+        'students': found
+    })
 
 @app.route('/mark_status_global/<status_type>/<student_id>', methods=['POST'])
 @login_required
@@ -2342,6 +2619,11 @@ def mark_status_global(status_type, student_id):
     dept = request.args.get('dept', '')
     class_id = request.args.get('class_id', '')
     date_str = request.args.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
+    try:
+        # Goes into the record id (GLOBAL_<date>_<student>) and the date-range queries
+        datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError:
+        abort(400)
     
     # Ensure status is properly capitalized for database (Late, OD, Leave)
     db_status = status_type.title() if status_type in ['LATE', 'LEAVE'] else status_type
@@ -2354,18 +2636,24 @@ def mark_status_global(status_type, student_id):
     ).first()
     
     if existing:
-        existing.status = db_status
-        existing.save()
+        record = existing
+        record.status = db_status
+        for field, value in denormalize.display_fields(
+                student=student, classroom=get_cached_classroom(getattr(existing, 'class_id', None))).items():
+            setattr(record, field, value)
     else:
-        new_rec = Attendance(
+        record = Attendance(
+            id=Attendance.global_doc_id(student.id, date_str),
             student_id=student.id,
             subject_id='GLOBAL',
             class_id=getattr(student, 'class_id', 'Unknown'),
             teacher_id=current_user.id,
             date=date_str,
-            status=db_status
+            status=db_status,
+            **denormalize.display_fields(student, classroom=get_cached_classroom(getattr(student, 'class_id', None)),
+                                         teacher=current_user)
         )
-        new_rec.save()
+    save_attendance([record])
         
     flash(f'Marked {student.name} as {db_status} for {date_str} (Global Entry)!', 'success')
     return redirect(url_for('status_portal', 
@@ -2375,6 +2663,92 @@ def mark_status_global(status_type, student_id):
                           class_id=class_id, 
                           date=date_str))
 
+BULK_MARK_LIMIT = 450 # students per request
+
+@app.route('/api/portal/<status_type>/bulk_mark', methods=['POST'])
+@login_required
+def api_bulk_mark_status(status_type):
+    # Gate mode: mark a whole queue of roll numbers / scanned ids in one batch and
+    # answer with JSON instead of redirecting back through the portal
+    status_type = status_type.upper()
+    if status_type == 'ML':
+        status_type = 'LEAVE'
+    if status_type not in ['OD', 'LEAVE', 'LATE']:
+        abort(404)
+
+    allowed_roles = ['admin', 'hod', 'teacher', 'in_charge']
+    if status_type == 'LATE':
+        allowed_roles.append('security')
+    if current_user.role not in allowed_roles:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+
+    payload = request.get_json(silent=True) or request.form
+    date_str = payload.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
+    try:
+        # Goes into the record ids (GLOBAL_<date>_<student>) and the date-range queries
+        datetime.strptime(str(date_str), '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Date must be YYYY-MM-DD'}), 400
+    keys = payload.get('students') or []
+    if isinstance(keys, str):
+        # Scanner / pasted input: one roll number per line, or comma separated
+        keys = keys.replace(',', '\n').split()
+    keys = [str(k).strip() for k in keys if str(k).strip()]
+    if not keys:
+        return jsonify({'status': 'error', 'message': 'No students given'}), 400
+    if len(keys) > BULK_MARK_LIMIT:
+        return jsonify({'status': 'error', 'message': f'At most {BULK_MARK_LIMIT} students per request'}), 400
+
+    db_status = status_type.title() if status_type in ['LATE', 'LEAVE'] else status_type
+    assigned_class_ids = None
+    if current_user.role in ['teacher', 'in_charge']:
+        assigned_class_ids = {str(x) for x in getattr(current_user, 'assigned_classes', []) if x}
+
+    to_mark, not_found = {}, []
+    for key in keys:
+        student = student_index.resolve(key)
+        if student is None or (assigned_class_ids is not None
+                               and str(getattr(student, 'class_id', '')) not in assigned_class_ids):
+            not_found.append(key)
+            continue
+        to_mark.setdefault(str(student.id), student)
+
+    # One read for the day's GLOBAL records: older ones were written with random ids
+    existing = {}
+    if to_mark:
+        for rec in Attendance.query.filter_by(subject_id='GLOBAL', date=date_str).all():
+            existing[str(getattr(rec, 'student_id', ''))] = rec
+
+    records, marked, already = [], [], []
+    for sid, student in to_mark.items():
+        rec = existing.get(sid)
+        if rec is not None and getattr(rec, 'status', None) == db_status:
+            already.append(student.roll_no)
+            continue
+        new_rec = Attendance(
+            id=rec.id if rec is not None else Attendance.global_doc_id(sid, date_str),
+            student_id=sid,
+            subject_id='GLOBAL',
+            class_id=getattr(student, 'class_id', 'Unknown'),
+            teacher_id=current_user.id,
+            date=date_str,
+            status=db_status,
+            **denormalize.display_fields(student, classroom=get_cached_classroom(getattr(student, 'class_id', None)),
+                                         teacher=current_user)
+        )
+        records.append(new_rec)
+        marked.append((new_rec.id, student))
+    if marked:
+        save_attendance(records)
+
+    return jsonify({
+        'status': 'success',
+        'date': date_str,
+        'marked': [student.roll_no for _, student in marked],
+        'already': already,
+        'not_found': not_found
+    })
+
 @app.route('/security_portal', methods=['GET', 'POST'])
 @login_required
 @security_required
@@ -2388,4 +2762,10 @@ def security_mark_late(student_id):
     return redirect(url_for('mark_status_global', status_type='LATE', student_id=student_id, search=request.args.get('search', '')))
 
 if __name__ == '__main__':
+    create_app()
+    create_default_admin()
+    try:
+        normalize_users()
+    except Exception as e:
+        print(f"Error normalizing users: {e}")
     app.run(debug=True, port=5001)
@@ -0,0 +1,256 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from defaulters import defaulters_index
+from models import IN_QUERY_LIMIT, Attendance, BulkWriter, Classroom, day_counts, get_db, utc_stamp
+from status_history import status_history
+
+# Cold storage for closed semesters. `flask close-semester` moves a class's attendance
+# up to the end of a semester out of attendance_records into one gzip'd JSON blob per
+# class per semester, and writes its final rollup (per-student day-wise counts, overall
+# and per subject) to `attendance_rollups`:
+#
+#   <archive>/attendance/<class_id>/sem-<semester>.json.gz
+#
+# Live pages then read only the current term. Reports and exports asked for history
+# (history=1) add the rollups, and the Excel export reads the blobs themselves.
+#
+# The blob is written first and the rollup last, after the hot records are deleted: a
+# close that fails part-way leaves the blob complete and is finished by running it
+# again. Reruns merge with the existing blob, so records marked late for a closed
+# semester are picked up by closing it again.
+#
+#   ATTENDANCE_ARCHIVE   directory for the blobs, or gs://<bucket>/<prefix> for a Cloud
+#                        Storage bucket (default: archive/ next to the app)
+
+ATTENDANCE_ARCHIVE = os.environ.get('ATTENDANCE_ARCHIVE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+ROLLUPS_COLLECTION = 'attendance_rollups'
+ARCHIVE_FORMAT = 1
+BLOB_CACHE_SIZE = 8 # decoded blobs kept per process; a class-semester is a few MB of JSON
+
+ATTENDANCE = Attendance.__collection__
+
+
+class LocalArchiveStore:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path) # atomic: a crashed close leaves the previous blob
+
+
+class BucketArchiveStore:
+    def __init__(self, url):
+        from firebase_admin import storage
+        bucket, _, prefix = url[len('gs://'):].partition('/')
+        self.bucket = storage.bucket(bucket)
+        self.prefix = prefix.strip('/')
+
+    def _blob(self, key):
+        return self.bucket.blob(f"{self.prefix}/{key}" if self.prefix else key)
+
+    def read(self, key):
+        blob = self._blob(key)
+        return blob.download_as_bytes() if blob.exists() else None
+
+    def write(self, key, data):
+        self._blob(key).upload_from_string(data, content_type='application/gzip')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = (BucketArchiveStore(ATTENDANCE_ARCHIVE) if ATTENDANCE_ARCHIVE.startswith('gs://')
+                          else LocalArchiveStore(ATTENDANCE_ARCHIVE))
+    return _store
+
+
+def set_store(store):
+    global _store
+    _store = store
+    _blob_cache.clear()
+
+
+def blob_key(class_id, semester):
+    return f"attendance/{class_id}/sem-{semester}.json.gz"
+
+
+def rollup_id(class_id, semester):
+    return f"{class_id}_{semester}"
+
+
+def _encode(payload):
+    # Dates are stored as strings; default=str covers timestamps on older records
+    return gzip.compress(json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def _decode(data):
+    return json.loads(gzip.decompress(data).decode('utf-8'))
+
+
+_blob_cache = OrderedDict()
+_blob_cache_lock = threading.Lock()
+
+
+def read_blob(key, version=None):
+    """Records of one archive blob as {record id: data}; cached per rollup version."""
+    with _blob_cache_lock:
+        cached = _blob_cache.get(key)
+        if cached is not None and cached[0] == version:
+            _blob_cache.move_to_end(key)
+            return cached[1]
+    data = get_store().read(key)
+    records = {} if data is None else {r.pop('id'): r for r in _decode(data)['records']}
+    with _blob_cache_lock:
+        _blob_cache[key] = (version, records)
+        while len(_blob_cache) > BLOB_CACHE_SIZE:
+            _blob_cache.popitem(last=False)
+    return records
+
+
+def _status_counts(records, subject_id=None):
+    # student_id -> {(date, status): records}, the input day_counts() expects
+    counts = {}
+    for data in records:
+        sid, dt = data.get('student_id'), data.get('date')
+        if not sid or not dt: continue
+        if subject_id is not None and str(data.get('subject_id')) != subject_id: continue
+        key = (str(dt), data.get('status') or 'Present')
+        student = counts.setdefault(str(sid), {})
+        student[key] = student.get(key, 0) + 1
+    return counts
+
+
+def rollup(class_id, semester, records, class_data=None):
+    """Final counts of a closed class-semester from its archived records."""
+    records = list(records.values())
+    dates = sorted(str(r['date']) for r in records if r.get('date'))
+    subjects = sorted({str(r['subject_id']) for r in records if r.get('subject_id')})
+    return {
+        'class_id': str(class_id),
+        'semester': str(semester),
+        'class_name': (class_data or {}).get('name'),
+        'dept': (class_data or {}).get('dept'),
+        'first_date': dates[0] if dates else None,
+        'last_date': dates[-1] if dates else None,
+        'records': len(records),
+        'blob': blob_key(class_id, semester),
+        'format': ARCHIVE_FORMAT,
+        # student_id -> [total_days, present, absent, od, leave, lates]
+        'students': {sid: list(day_counts(c)) for sid, c in _status_counts(records).items()},
+        'subjects': {sub: {sid: list(day_counts(c)) for sid, c in _status_counts(records, sub).items()}
+                     for sub in subjects},
+        'closed_at': utc_stamp(),
+    }
+
+
+def close_semester(class_id, until, semester=None):
+    """Archive class `class_id`'s attendance dated up to `until` ('YYYY-MM-DD') as
+    `semester` (default: the class's current_semester). Returns the rollup written, or
+    None when the class does not exist."""
+    db_conn = get_db()
+    class_snap = db_conn.collection(Classroom.__collection__).document(str(class_id)).get()
+    if not class_snap.exists:
+        return None
+    class_data = class_snap.to_dict() or {}
+    if semester is None:
+        semester = class_data.get('current_semester') or class_data.get('semester')
+    if semester in (None, ''):
+        raise ValueError(f"Class {class_id} has no current_semester; pass the semester to close")
+
+    key = blob_key(class_id, semester)
+    records = dict(read_blob(key))
+    hot, students = [], set()
+    query = (db_conn.collection(ATTENDANCE).where('class_id', '==', str(class_id))
+             .where('date', '<=', until))
+    for snap in query.stream():
+        records[snap.id] = snap.to_dict()
+        hot.append(snap.reference)
+        students.add(records[snap.id].get('student_id'))
+
+    payload = {'format': ARCHIVE_FORMAT, 'class_id': str(class_id), 'semester': str(semester), 'until': until,
+               'records': [{'id': doc_id, **data} for doc_id, data in sorted(records.items())]}
+    get_store().write(key, _encode(payload))
+
+    if hot:
+        with BulkWriter() as writer:
+            for ref in hot:
+                writer.delete(ref)
+        status_history.invalidate()
+        defaulters_index.touch(students) # standings cover the current term only
+
+    result = rollup(class_id, semester, records, class_data)
+    result['until'] = until
+    db_conn.collection(ROLLUPS_COLLECTION).document(rollup_id(class_id, semester)).set(result)
+    with _blob_cache_lock:
+        _blob_cache.pop(key, None)
+    print(f"Closed semester {semester} of class {class_id}: {len(hot)} records moved, "
+          f"{len(records)} archived in {key}")
+    return result
+
+
+def rollups(class_ids=None):
+    """Rollup documents of closed semesters, for the given classes or all of them."""
+    query = get_db().collection(ROLLUPS_COLLECTION)
+    if class_ids is None:
+        return [snap.to_dict() for snap in query.stream()]
+    ids = sorted({str(c) for c in class_ids if c})
+    found = []
+    for i in range(0, len(ids), IN_QUERY_LIMIT):
+        found.extend(snap.to_dict() for snap in query.where('class_id', 'in', ids[i:i + IN_QUERY_LIMIT]).stream())
+    return found
+
+
+def archived_day_counts(class_id=None, subject_id=None):
+    """{student_id: (total_days, present, absent, od, leave, lates)} summed over closed
+    semesters, in the shape reports() builds from live records."""
+    totals = {}
+    for doc in rollups([class_id] if class_id else None):
+        counts = doc.get('subjects', {}).get(str(subject_id), {}) if subject_id else doc.get('students', {})
+        for sid, c in counts.items():
+            totals[sid] = add_counts(totals.get(sid), c)
+    return totals
+
+
+def add_counts(a, b):
+    if not a: return tuple(b)
+    if not b: return tuple(a)
+    return tuple(x + y for x, y in zip(a, b))
+
+
+def archived_records(subject_id=None, start_date=None, end_date=None, class_ids=None):
+    """Yield (record id, data) for archived attendance matching the filters. Blobs whose
+    date range falls outside start_date..end_date are not read."""
+    for doc in rollups(class_ids):
+        if start_date and doc.get('last_date') and doc['last_date'] < start_date: continue
+        if end_date and doc.get('first_date') and doc['first_date'] > end_date: continue
+        for doc_id, data in read_blob(doc['blob'], doc.get('closed_at')).items():
+            if subject_id and str(data.get('subject_id')) != str(subject_id): continue
+            dt = str(data.get('date') or '')
+            if start_date and dt < start_date: continue
+            if end_date and dt > end_date: continue
+            yield doc_id, data
@@ -0,0 +1,161 @@
+"""Semester archive: closing a term moves its attendance to cold blobs without changing any report.
+
+Seeds the in-memory Firestore stand-in from benchmarks/dataset.py, closes every class's
+semester half-way through the --history-days of attendance (blobs go to a temporary
+directory) and checks:
+
+  * close    - the closed records leave attendance_records and land in one blob and one
+    rollup per class; reports the compressed size next to the records' JSON size.
+  * counts   - live counts plus the rollups equal the day-wise counts before the close,
+    per student, overall and for one subject.
+  * reports  - /reports reads only the current term (timed before and after), and the
+    summary export with history=1 matches the one taken before the close.
+  * export   - /export_excel with history=1 has every row it had before the close; without
+    it, only the current term's.
+  * rerun    - closing again moves nothing and changes no rollup; a record marked late for
+    the closed semester is merged into its blob and rollup.
+
+The run exits non-zero when a check fails.
+
+    python benchmarks/archive.py [--students-per-class 60] [--history-days 60]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+import archive
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+from models import day_counts
+
+ATTENDANCE = models.Attendance.__collection__
+
+
+def live_counts(client, subject_id=None):
+    # Day-wise counts per student from attendance_records, as reports() computes them
+    status_counts = {}
+    for d in client.dump().get(ATTENDANCE, {}).values():
+        if subject_id and d['subject_id'] != subject_id: continue
+        counts = status_counts.setdefault(d['student_id'], {})
+        key = (d['date'], d.get('status') or 'Present')
+        counts[key] = counts.get(key, 0) + 1
+    return {sid: day_counts(c) for sid, c in status_counts.items()}
+
+
+def summary_frame(http, query=''):
+    response = http.get(f'/export_summary_excel?{query}')
+    return pd.read_excel(io.BytesIO(response.data), sheet_name=None)
+
+
+def excel_rows(http, query=''):
+    response = http.get(f'/export_excel?{query}')
+    if response.status_code != 200 or not response.data.startswith(b'PK'):
+        return 0 # redirected: no rows
+    return len(pd.read_excel(io.BytesIO(response.data)))
+
+
+def timed(http, url, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        assert http.get(url).status_code == 200
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students-per-class', type=int, default=60)
+    parser.add_argument('--history-days', type=int, default=60)
+    args = parser.parse_args()
+
+    data = build_dataset(departments=2, classes_per_dept=2, students_per_class=args.students_per_class,
+                         teachers=2, security=1, history_days=args.history_days, today_marked=0)
+    meta = data.pop('_meta')
+    client = LocalFirestoreClient()
+    client.load(data)
+    models.set_db(client)
+    archive.set_store(archive.LocalArchiveStore(tempfile.mkdtemp(prefix='attendance-archive-')))
+    import app as app_module
+    http = app_module.create_app().test_client()
+    http.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+
+    records = data[ATTENDANCE]
+    dates = sorted({d['date'] for d in records.values()})
+    until = dates[len(dates) // 2]
+    subject_id = next(iter(records.values()))['subject_id']
+    closed = {doc_id for doc_id, d in records.items() if d['date'] <= until}
+    current = {doc_id for doc_id, d in records.items() if d['date'] > until}
+
+    before = {'counts': live_counts(client), 'subject': live_counts(client, subject_id),
+              'summary': summary_frame(http), 'rows': excel_rows(http),
+              'reports': timed(http, '/reports')}
+
+    # close
+    results = [archive.close_semester(cid, until) for cid in data['classrooms']]
+    left = set(client.dump()[ATTENDANCE])
+    raw = sum(len(json.dumps({'id': doc_id, **records[doc_id]})) for doc_id in closed)
+    stored = sum(len(archive.get_store().read(r['blob'])) for r in results)
+    close_ok = (left == current and sum(r['records'] for r in results) == len(closed)
+                and len(archive.rollups()) == len(data['classrooms']))
+    close_detail = (f"{len(closed)} records up to {until} in {len(results)} blobs, {len(left)} left live; "
+                    f"{stored / 1024:.0f} KB compressed from {raw / 1024:.0f} KB of JSON")
+
+    # counts
+    def merged(live, archived):
+        return {sid: archive.add_counts(live.get(sid), archived.get(sid)) for sid in set(live) | set(archived)}
+    overall = merged(live_counts(client), archive.archived_day_counts())
+    by_subject = merged(live_counts(client, subject_id), archive.archived_day_counts(subject_id=subject_id))
+    counts_ok = overall == before['counts'] and by_subject == before['subject']
+    counts_detail = f"{len(overall)} students overall and {len(by_subject)} for subject {subject_id} unchanged"
+
+    # reports
+    after_reports = timed(http, '/reports')
+    history_page = http.get('/reports?history=1')
+    summary = summary_frame(http, 'history=1')
+    same_summary = summary.keys() == before['summary'].keys() and all(
+        summary[name].equals(before['summary'][name]) for name in summary)
+    reports_ok = same_summary and history_page.status_code == 200
+    reports_detail = (f"/reports {before['reports'] * 1000:.0f} ms -> {after_reports * 1000:.0f} ms; "
+                      f"history summary {'matches' if same_summary else 'DIFFERS from'} the pre-close export")
+
+    # export
+    with_history, live_only = excel_rows(http, 'history=1'), excel_rows(http)
+    export_ok = with_history == before['rows'] and live_only == len(current)
+    export_detail = f"{with_history}/{before['rows']} rows with history, {live_only} without"
+
+    # rerun
+    first = {r['blob']: r['students'] for r in results}
+    again = [archive.close_semester(cid, until) for cid in data['classrooms']]
+    unchanged = all(r['students'] == first[r['blob']] for r in again) and set(client.dump()[ATTENDANCE]) == current
+    late = dict(records[next(iter(closed))], status='Absent', date=dates[0])
+    client.collection(ATTENDANCE).document('late_mark').set(late)
+    merged_result = archive.close_semester(late['class_id'], until)
+    previous = next(r for r in results if r['class_id'] == late['class_id'])
+    rerun_ok = (unchanged and merged_result['records'] == previous['records'] + 1
+                and 'late_mark' not in client.dump()[ATTENDANCE]
+                and 'late_mark' in archive.read_blob(merged_result['blob'], merged_result['closed_at']))
+    rerun_detail = f"second close moved nothing; late record merged ({previous['records']} -> {merged_result['records']})"
+
+    checks = [('close', (close_ok, close_detail)),
+              ('counts', (counts_ok, counts_detail)),
+              ('reports', (reports_ok, reports_detail)),
+              ('export', (export_ok, export_detail)),
+              ('rerun', (rerun_ok, rerun_detail))]
+    failed = False
+    for name, (ok, detail) in checks:
+        print(f"{name:<8} {'ok' if ok else 'FAILED':<7} {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
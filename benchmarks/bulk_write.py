@@ -0,0 +1,224 @@
+"""BulkWriter: serial 450-write batches vs parallel 500-write batches, and its guarantees.
+
+Runs against the in-memory Firestore stand-in with a simulated --latency-ms round
+trip per call.
+
+  * throughput - writes --docs documents the way the bulk paths used to (a batch
+    committed every 450 writes, one at a time) and with BulkWriter at several
+    max_in_flight settings; reports wall time, batches and per-batch latency.
+  * limit      - no batch the stand-in receives holds more than 500 writes, and every
+    document is stored.
+  * reserve    - groups of writes kept together with reserve() never span two batches.
+  * retry      - two failed commits are retried and every document is stored.
+  * outage     - when commits keep failing close() raises FirestoreUnavailable and
+    reports the writes that were not stored.
+  * import     - POST /students/bulk_upload with --import-rows students (most with an
+    existing login, some in a new class) stores every student, user and class.
+
+The run exits non-zero when a check fails.
+
+    python benchmarks/bulk_write.py [--docs 5000] [--latency-ms 60]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+from models import BulkWriter, FirestoreUnavailable, commit_batch
+
+COLLECTION = 'bulk_probe'
+
+
+def count_commits(client):
+    # Document ids of every commit the client receives
+    commits = []
+    original = client._commit
+    client._commit = lambda ops, timeout=None: (commits.append([ref.id for _, ref, _, _ in ops]),
+                                                original(ops, timeout))
+    return commits
+
+
+def fresh(latency=0.0):
+    client = LocalFirestoreClient(latency=latency)
+    models.set_db(client)
+    return client
+
+
+def stored(client, collection=COLLECTION):
+    return len(client.dump().get(collection, {}))
+
+
+def serial(client, n):
+    # The pattern BulkWriter replaces: commit every 450 writes, waiting for each
+    collection = client.collection(COLLECTION)
+    batch, ops, latencies = client.batch(), 0, []
+    for i in range(n):
+        batch.set(collection.document(f"d{i}"), {'n': i})
+        ops += 1
+        if ops >= 450 or i == n - 1:
+            start = time.perf_counter()
+            commit_batch(batch, COLLECTION)
+            latencies.append(time.perf_counter() - start)
+            batch, ops = client.batch(), 0
+    return latencies
+
+
+def throughput(args):
+    latency = args.latency_ms / 1000.0
+    print(f"{'mode':<24} {'seconds':>8} {'batches':>8} {'p50 ms':>8} {'max ms':>8}")
+    client = fresh(latency)
+    start = time.perf_counter()
+    latencies = sorted(serial(client, args.docs))
+    print(f"{'serial, 450 per batch':<24} {time.perf_counter() - start:>8.2f} {len(latencies):>8} "
+          f"{latencies[len(latencies) // 2] * 1000:>8.0f} {latencies[-1] * 1000:>8.0f}")
+    ok = stored(client) == args.docs
+    for in_flight in (1, 4, 8):
+        client = fresh(latency)
+        collection = client.collection(COLLECTION)
+        with BulkWriter(max_in_flight=in_flight) as writer:
+            for i in range(args.docs):
+                writer.set(collection.document(f"d{i}"), {'n': i})
+        s = writer.stats()
+        print(f"{f'BulkWriter, {in_flight} in flight':<24} {s['seconds']:>8.2f} {s['batches']:>8} "
+              f"{s['p50_ms']:>8.0f} {s['max_ms']:>8.0f}")
+        ok = ok and stored(client) == args.docs and s['writes'] == args.docs
+    return ok, f"{args.docs} documents stored by every mode"
+
+
+def limit(n):
+    client = fresh()
+    # Updates and deletes go to documents that exist beforehand: batches commit in any order
+    client.load({COLLECTION: {**{f"u{i}": {'n': i} for i in range(0, n, 3)},
+                              **{f"x{i}": {'n': i} for i in range(0, n, 7)}}})
+    commits = count_commits(client)
+    collection = client.collection(COLLECTION)
+    # A mix of sets, updates and deletes: each counts (a delete with its tombstone)
+    with BulkWriter() as writer:
+        for i in range(n):
+            writer.set(collection.document(f"d{i}"), {'n': i})
+        for i in range(0, n, 3):
+            writer.update(collection.document(f"u{i}"), {'seen': True})
+        for i in range(0, n, 7):
+            writer.delete(collection.document(f"x{i}"))
+    sizes = [len(ids) for ids in commits]
+    docs = client.dump()[COLLECTION]
+    expected = n + len(range(0, n, 3))
+    ok = (max(sizes) <= models.BATCH_LIMIT and sum(sizes) == writer.written and len(docs) == expected
+          and all(docs[f"u{i}"].get('seen') for i in range(0, n, 3)))
+    return ok, f"{writer.written} writes in {len(sizes)} batches, largest {max(sizes)}, {len(docs)}/{expected} stored"
+
+
+def reserve(groups):
+    client = fresh()
+    commits = count_commits(client)
+    collection = client.collection(COLLECTION)
+    with BulkWriter() as writer:
+        for g in range(groups):
+            writer.reserve(3)
+            for part in range(3):
+                writer.set(collection.document(f"g{g}_{part}"), {'group': g})
+    split = 0
+    for ids in commits:
+        counts = {}
+        for doc_id in ids:
+            group = doc_id.split('_')[0]
+            counts[group] = counts.get(group, 0) + 1
+        split += sum(1 for c in counts.values() if c != 3)
+    ok = split == 0 and stored(client) == groups * 3
+    return ok, f"{groups} groups of 3 in {len(commits)} batches, {split} split across batches"
+
+
+def retry(n):
+    client = fresh()
+    client.inject_faults(times=2, kind='commit')
+    collection = client.collection(COLLECTION)
+    with BulkWriter() as writer:
+        for i in range(n):
+            writer.set(collection.document(f"d{i}"), {'n': i})
+    return stored(client) == n and not client._faults, f"{stored(client)}/{n} stored after 2 failed commits"
+
+
+def outage(n):
+    client = fresh()
+    client.inject_faults(times=None, kind='commit')
+    collection = client.collection(COLLECTION)
+    writer = BulkWriter()
+    for i in range(n):
+        writer.set(collection.document(f"d{i}"), {'n': i})
+    try:
+        writer.close()
+        raised = None
+    except Exception as e:
+        raised = type(e).__name__
+    client.clear_faults()
+    ok = raised == FirestoreUnavailable.__name__ and writer.failed == n and stored(client) == 0
+    return ok, f"close() raised {raised}, {writer.failed}/{n} writes reported failed"
+
+
+def student_import(rows):
+    data = build_dataset(departments=1, classes_per_dept=1, students_per_class=1, teachers=1,
+                         security=1, history_days=0)
+    meta = data.pop('_meta')
+    # Most rows match an existing login (an update); every 20th creates one (a set, and a
+    # deliberately slow password hash)
+    new_logins = range(0, rows, 20)
+    for i in range(rows):
+        if i in new_logins: continue
+        data['users'][f"pre{i}"] = {'name': f"Pre {i}", 'username': f"IMP{i:05d}", 'role': 'student',
+                                    'login_keys': [f"imp{i:05d}"]}
+    client = LocalFirestoreClient()
+    client.load(data)
+    models.set_db(client)
+    commits = count_commits(client)
+    import app as app_module
+    http = app_module.create_app().test_client()
+    http.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+    class_name = next(iter(data['classrooms'].values()))['name']
+    lines = ['Name,Roll No,Dept,Email,Class_Name']
+    for i in range(rows):
+        # Every 50th student lands in a class that does not exist yet
+        cls = f"New Class {i // 50}" if i % 50 == 0 else class_name
+        lines.append(f"Student {i},IMP{i:05d},Computer Science,,{cls}")
+    before = {c: stored(client, c) for c in ('students', 'users', 'classrooms')}
+    http.post('/students/bulk_upload', data={'file': (io.BytesIO('\n'.join(lines).encode()), 'import.csv')},
+              content_type='multipart/form-data')
+    after = {c: stored(client, c) - before[c] for c in before}
+    linked = sum(1 for u in client.dump()['users'].values() if str(u.get('username', '')).startswith('IMP')
+                 and u.get('student_id'))
+    expected = {'students': rows, 'users': len(new_logins), 'classrooms': len(range(0, rows, 50))}
+    sizes = [len(ids) for ids in commits]
+    ok = after == expected and linked == rows and max(sizes) <= models.BATCH_LIMIT
+    return ok, (f"{after['students']} students, {after['users']} new users, {after['classrooms']} classes, "
+                f"{linked} logins linked, {len(sizes)} batches (largest {max(sizes)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=60)
+    parser.add_argument('--import-rows', type=int, default=700)
+    args = parser.parse_args()
+
+    models.RETRY_BASE_DELAY = 0.01 # keep the retry checks short
+    checks = [('throughput', throughput(args)),
+              ('limit', limit(1300)),
+              ('reserve', reserve(400)),
+              ('retry', retry(1200)),
+              ('outage', outage(1200)),
+              ('import', student_import(args.import_rows))]
+    failed = False
+    for name, (ok, detail) in checks:
+        print(f"{name:<11} {'ok' if ok else 'FAILED':<7} {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
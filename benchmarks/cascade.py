@@ -0,0 +1,187 @@
+"""Cascading deletes: what a class, student or department delete leaves behind, and how long it takes.
+
+Seeds the in-memory Firestore stand-in from benchmarks/dataset.py (with a simulated
+--latency-ms round trip per call) and checks:
+
+  * student    - GET /delete_student/<id> removes the student, its login and every
+    attendance record (by id and by roll number), archives them, writes tombstones and finishes before the redirect.
+  * class      - the class's students, logins and attendance are gone, teachers no
+    longer list the class, and the job's progress is readable from /api/cascade_jobs
+    with every record planned once.
+  * department - its classes, subjects, students and attendance are all gone; reports
+    the wall time next to deleting the same records one document at a time.
+  * orphans    - `purge-orphans` removes attendance and logins of students deleted
+    before cascades existed, and nothing else: records keyed by a live student's roll
+    number stay.
+
+The run exits non-zero when a check fails.
+
+    python benchmarks/cascade.py [--students-per-class 60] [--history-days 30] [--latency-ms 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+
+
+def seed(args, latency):
+    data = build_dataset(departments=3, classes_per_dept=2, students_per_class=args.students_per_class,
+                         teachers=6, security=1, history_days=args.history_days)
+    meta = data.pop('_meta')
+    # Every student gets a login, as the student import creates them
+    for stid, st in data['students'].items():
+        data['users'][f"login_{stid}"] = {'name': st['name'], 'username': st['roll_no'], 'role': 'student',
+                                          'student_id': stid, 'login_keys': [st['roll_no'].lower()]}
+    # Older records reference the student by roll number: one per student
+    rekeyed = set()
+    for rec in data['attendance_records'].values():
+        if rec['student_id'] not in rekeyed and rec['student_id'] in data['students']:
+            rekeyed.add(rec['student_id'])
+            rec['student_id'] = data['students'][rec['student_id']]['roll_no']
+    client = LocalFirestoreClient(latency=latency)
+    client.load(data)
+    models.set_db(client)
+    return client, data, meta
+
+
+def keys(dump, student_ids):
+    # student_id values of these students' records: doc ids and roll numbers
+    return set(student_ids) | {dump['students'][sid]['roll_no'] for sid in student_ids if sid in dump['students']}
+
+
+def referencing(dump, field, ids):
+    ids = set(ids)
+    return [doc_id for doc_id, d in dump.get('attendance_records', {}).items() if d.get(field) in ids]
+
+
+def check_student(client, http):
+    dump = client.dump()
+    student_id = next(iter(dump['students']))
+    student_keys = keys(dump, [student_id])
+    records = referencing(dump, 'student_id', student_keys)
+    start = time.perf_counter()
+    http.get(f'/delete_student/{student_id}')
+    elapsed = time.perf_counter() - start
+    dump = client.dump()
+    archived = [d for d in dump.get('archived_docs', {}).values() if d['cascade'] == f"student/{student_id}"]
+    tombstones = [d for d in dump.get('deleted_docs', {}).values() if d['collection'] == 'attendance_records'
+                  and d['doc_id'] in records]
+    logins = [u for u in dump['users'].values() if u.get('student_id') == student_id]
+    ok = (student_id not in dump['students'] and not logins and not referencing(dump, 'student_id', student_keys)
+          and len(archived) == len(records) + 2 and len(tombstones) == len(records))
+    return ok, f"{len(records)} records, login and student removed and archived in {elapsed * 1000:.0f} ms"
+
+
+def check_class(client, http):
+    import cascade
+    dump = client.dump()
+    class_id = next(iter(dump['classrooms']))
+    students = [sid for sid, s in dump['students'].items() if s['class_id'] == class_id]
+    teachers = [uid for uid, u in dump['users'].items() if class_id in (u.get('assigned_classes') or [])]
+    records = set(referencing(dump, 'class_id', [class_id])) | set(referencing(dump, 'student_id', keys(dump, students)))
+    job_id, done = cascade.cascade_jobs.start('class', class_id, wait=60)
+    job = http.get(f'/api/cascade_jobs/{job_id}').get_json()
+    dump = client.dump()
+    ok = (done and job['state'] == 'done' and class_id not in dump['classrooms']
+          and not any(sid in dump['students'] for sid in students)
+          and not any(u.get('student_id') in students for u in dump['users'].values())
+          and not referencing(dump, 'class_id', [class_id])
+          and not any(class_id in (dump['users'][t].get('assigned_classes') or []) for t in teachers)
+          and job['removed'].get('attendance_records') == len(records)
+          and job['planned'].get('students') == len(students)
+          and job['planned'].get('attendance_records') == len(records))
+    return ok, (f"{len(students)} students, {len(records)} records, {len(teachers)} teachers updated; "
+                f"job {job['state']}, planned {job['planned']}")
+
+
+def serial_delete(client, collection_ids):
+    # The old way: one delete (and tombstone) round trip per document
+    for collection, ids in collection_ids.items():
+        for doc_id in ids:
+            ref = client.collection(collection).document(doc_id)
+            ref.delete()
+            models.write_tombstone(collection, doc_id)
+
+
+def check_department(client, latency):
+    import cascade
+    dump = client.dump()
+    dept_id, dept = next(iter(dump['departments'].items()))
+    classes = [cid for cid, c in dump['classrooms'].items() if c['dept'] == dept['name']]
+    students = [sid for sid, s in dump['students'].items() if s['dept'] == dept['name']]
+    subjects = [sid for sid, s in dump['subjects'].items() if s['dept'] == dept['name']]
+    student_keys = keys(dump, students)
+    records = set(referencing(dump, 'class_id', classes)) | set(referencing(dump, 'student_id', student_keys))
+    logins = [uid for uid, u in dump['users'].items() if u.get('student_id') in students]
+
+    # Same documents, deleted one at a time, on a copy of the data
+    copy = LocalFirestoreClient(latency=latency)
+    copy.load(dump)
+    models.set_db(copy)
+    start = time.perf_counter()
+    serial_delete(copy, {'attendance_records': records, 'users': logins, 'students': students,
+                         'subjects': subjects, 'classrooms': classes, 'departments': [dept_id]})
+    serial = time.perf_counter() - start
+
+    models.set_db(client)
+    start = time.perf_counter()
+    job_id, done = cascade.cascade_jobs.start('department', dept_id, wait=600)
+    elapsed = time.perf_counter() - start
+    dump = client.dump()
+    left = (referencing(dump, 'class_id', classes) + referencing(dump, 'student_id', student_keys)
+            + [c for c in classes if c in dump['classrooms']] + [s for s in students if s in dump['students']]
+            + [s for s in subjects if s in dump['subjects']])
+    ok = done and not left and dept_id not in dump['departments']
+    docs = len(records) + len(logins) + len(students) + len(subjects) + len(classes) + 1
+    return ok, f"{docs} documents in {elapsed:.2f}s (one at a time: {serial:.2f}s), {len(left)} left behind"
+
+
+def check_orphans(client):
+    import cascade
+    dump = client.dump()
+    # A student deleted the old way: its records and login stay behind
+    student_id = next(iter(dump['students']))
+    records = referencing(dump, 'student_id', keys(dump, [student_id]))
+    client.collection('students').document(student_id).delete()
+    total = len(client.dump()['attendance_records'])
+    job_id = cascade.cascade_jobs.create('orphans', 'sweep')
+    removed = cascade.cascade_jobs.run(job_id, cascade.plan_orphans)
+    dump = client.dump()
+    ok = (removed == {'attendance_records': len(records), 'users': 1}
+          and len(dump['attendance_records']) == total - len(records))
+    return ok, f"removed {removed}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students-per-class', type=int, default=60)
+    parser.add_argument('--history-days', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000.0
+    client, data, meta = seed(args, latency)
+    import app as app_module
+    http = app_module.create_app().test_client()
+    http.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+
+    checks = [('student', check_student(client, http)),
+              ('class', check_class(client, http)),
+              ('department', check_department(client, latency)),
+              ('orphans', check_orphans(client))]
+    failed = False
+    for name, (ok, detail) in checks:
+        print(f"{name:<11} {'ok' if ok else 'FAILED':<7} {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Synthetic college dataset for the offline benchmarks (local_firestore JSON dump format)."""
+import json
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+STAFF_PASSWORD = 'bench123'
+DEPARTMENTS = ['Computer Science', 'Electronics', 'Mechanical', 'Commerce', 'Mathematics',
+               'Physics', 'Chemistry', 'English']
+STATUS_WEIGHTS = [('Present', 80), ('Absent', 10), ('Late', 5), ('OD', 3), ('Leave', 2)]
+
+
+def _status(rng):
+    return rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+
+
+def build_dataset(departments=5, classes_per_dept=4, students_per_class=60, subjects_per_class=5,
+                  teachers=40, security=4, history_days=0, today_marked=0.5, seed=7):
+    """Return {collection: {doc_id: data}} plus a `_meta` entry describing the logins.
+
+    history_days adds that many past days of per-subject attendance; today_marked is the
+    fraction of classes that already have today's first-period attendance.
+    """
+    rng = random.Random(seed)
+    # One hash for every staff account: pbkdf2 is deliberately slow
+    password = generate_password_hash(STAFF_PASSWORD, method='pbkdf2:sha256')
+    data = {name: {} for name in ('departments', 'classrooms', 'students', 'subjects', 'users', 'attendance_records')}
+
+    data['users']['admin'] = {'name': 'Bench Admin', 'username': 'admin@bench.edu', 'email': 'admin@bench.edu',
+                              'login_keys': ['admin@bench.edu'], 'password': password, 'role': 'admin',
+                              'assigned_classes': []}
+
+    class_ids = []
+    class_subjects = {}
+    for d in range(departments):
+        dept = DEPARTMENTS[d % len(DEPARTMENTS)] + ('' if d < len(DEPARTMENTS) else f' {d}')
+        data['departments'][f"dept{d}"] = {'name': dept, 'code': dept[:3].upper()}
+        for c in range(classes_per_dept):
+            cid = f"cls{d}_{c}"
+            sem = str(c * 2 + 1)
+            data['classrooms'][cid] = {'name': f"{['I', 'II', 'III', 'IV'][c % 4]}-{dept[:3].upper()}-{c}",
+                                       'dept': dept, 'year': str(c % 4 + 1), 'current_semester': sem}
+            class_ids.append(cid)
+            class_subjects[cid] = []
+            for k in range(subjects_per_class):
+                sid = f"sub{d}_{c}_{k}"
+                data['subjects'][sid] = {'name': f"Subject {d}.{c}.{k}", 'code': f"S{d}{c}{k}",
+                                         'dept': dept, 'semester': sem, 'teacher_id': None}
+                class_subjects[cid].append(sid)
+            for n in range(students_per_class):
+                stid = f"st{d}_{c}_{n}"
+                roll = f"R{d:02d}{c:02d}{n:04d}"
+                data['students'][stid] = {'name': f"Student {d}-{c}-{n}", 'roll_no': roll, 'dept': dept,
+                                          'phone': None, 'semester': sem, 'class_id': cid}
+
+    teacher_logins = []
+    for t in range(teachers):
+        email = f"teacher{t}@bench.edu"
+        assigned = rng.sample(class_ids, k=min(2, len(class_ids)))
+        data['users'][f"teacher{t}"] = {'name': f"Teacher {t}", 'username': email, 'email': email,
+                                        'login_keys': [email], 'password': password,
+                                        'role': 'teacher', 'assigned_classes': assigned}
+        teacher_logins.append({'username': email, 'classes': assigned})
+    security_logins = []
+    for g in range(security):
+        email = f"gate{g}@bench.edu"
+        data['users'][f"gate{g}"] = {'name': f"Gate {g}", 'username': email, 'email': email,
+                                     'login_keys': [email], 'password': password, 'role': 'security',
+                                     'assigned_classes': []}
+        security_logins.append({'username': email})
+
+    today = datetime.utcnow().date()
+    students_by_class = {}
+    for stid, st in data['students'].items():
+        students_by_class.setdefault(st['class_id'], []).append(stid)
+
+    def mark(cid, subject_id, day):
+        for stid in students_by_class[cid]:
+            data['attendance_records'][f"att{len(data['attendance_records'])}"] = {
+                'student_id': stid, 'subject_id': subject_id, 'class_id': cid, 'teacher_id': 'teacher0',
+                'date': day.strftime('%Y-%m-%d'), 'status': _status(rng)}
+
+    for offset in range(history_days, 0, -1):
+        day = today - timedelta(days=offset)
+        if day.weekday() == 6: continue
+        for cid in class_ids:
+            mark(cid, rng.choice(class_subjects[cid]), day)
+    for cid in class_ids[:int(len(class_ids) * today_marked)]:
+        mark(cid, class_subjects[cid][0], today)
+
+    data['_meta'] = {'password': STAFF_PASSWORD, 'admin': 'admin@bench.edu', 'teachers': teacher_logins,
+                     'security': security_logins, 'class_subjects': class_subjects,
+                     'students_by_class': students_by_class}
+    return data
+
+
+def write_dataset(path, **kwargs):
+    data = build_dataset(**kwargs)
+    meta = data.pop('_meta')
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return meta
@@ -0,0 +1,185 @@
+"""Defaulters index: /api/defaulters from the shortage index vs recomputing every percentage.
+
+Seeds the in-memory Firestore stand-in from benchmarks/dataset.py (with a simulated
+--latency-ms round trip per call), builds the index and checks:
+
+  * rebuild  - every student's stored percentage equals get_attendance_stats(), and its
+    absent count the days with an Absent record.
+  * api      - /api/defaulters for the whole college, a department and a class returns
+    exactly the students a full recompute finds below --threshold, lowest first; reports
+    its time next to the recompute.
+  * marking  - after POST /attendance marks a class absent, its students' entries are
+    refreshed in the background and match a recompute.
+  * queued   - with write-behind, entries are refreshed once the flusher commits.
+  * scope    - a teacher only sees assigned classes; a deleted student leaves the index.
+
+The run exits non-zero when a check fails.
+
+    python benchmarks/defaulters.py [--students-per-class 60] [--history-days 30] [--latency-ms 20] [--threshold 85]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from defaulters import STANDING_COLLECTION, defaulters_index
+from local_firestore import LocalFirestoreClient
+from models import Student
+
+
+def recompute(threshold, class_id=None, dept=None):
+    # The old way: every student's percentage from raw records
+    query = Student.query
+    if class_id: query = query.filter_by(class_id=class_id)
+    if dept: query = query.filter_by(dept=dept)
+    students = query.all()
+    stats = Student.attendance_stats_many(students)
+    found = [(stats[str(s.id)][2], str(s.roll_no).lower(), str(s.id)) for s in students
+             if stats[str(s.id)][0] and stats[str(s.id)][2] < threshold]
+    return [sid for _, _, sid in sorted(found)]
+
+
+def stored(client):
+    return client.dump().get(STANDING_COLLECTION, {})
+
+
+def matches_recompute(client, student_ids):
+    standings = stored(client)
+    students = [Student.query.get(sid) for sid in student_ids]
+    stats = Student.attendance_stats_many([s for s in students if s])
+    return all(standings.get(sid, {}).get('perc') == (stats[sid][2] if stats[sid][0] else None) for sid in stats)
+
+
+def absent_days(client):
+    days = {}
+    for d in client.dump()['attendance_records'].values():
+        if d.get('status') == 'Absent':
+            days.setdefault(d['student_id'], set()).add(d['date'])
+    return {sid: len(dates) for sid, dates in days.items()}
+
+
+def check_rebuild(client):
+    start = time.perf_counter()
+    n = defaulters_index.rebuild()
+    elapsed = time.perf_counter() - start
+    absent = absent_days(client)
+    ok = (matches_recompute(client, list(client.dump()['students']))
+          and all(d['absent'] == absent.get(sid, 0) for sid, d in stored(client).items()))
+    return ok, f"{n} students indexed in {elapsed:.2f}s"
+
+
+def check_api(client, http, threshold):
+    dump = client.dump()
+    class_id, cls = next(iter(dump['classrooms'].items()))
+    details, ok = [], True
+    for label, params in (('all', {}), ('dept', {'dept': cls['dept']}), ('class', {'class_id': class_id})):
+        start = time.perf_counter()
+        expected = recompute(threshold, **params)
+        slow = time.perf_counter() - start
+        start = time.perf_counter()
+        response = http.get('/api/defaulters', query_string={'threshold': threshold, **params}).get_json()
+        fast = time.perf_counter() - start
+        got = [d['student_id'] for d in response['students']]
+        percs = [d['perc'] for d in response['students']]
+        ok = ok and got == expected and percs == sorted(percs)
+        details.append(f"{label} {len(got)} in {fast * 1000:.0f} ms (recompute {slow * 1000:.0f} ms)")
+    return ok, '; '.join(details)
+
+
+def check_marking(client, http, meta):
+    dump = client.dump()
+    class_id = next(iter(dump['classrooms']))
+    subject_id = meta['class_subjects'][class_id][0]
+    students = meta['students_by_class'][class_id]
+    before = {sid: stored(client)[sid]['perc'] for sid in students}
+    day = (datetime.utcnow().date() + timedelta(days=1)).strftime('%Y-%m-%d')
+    form = {'subject_id': subject_id, 'class_id': class_id, 'date': day,
+            **{f'status_{sid}': 'Absent' for sid in students}}
+    http.post('/attendance', data=form)
+    start = time.perf_counter()
+    settled = defaulters_index.wait(30)
+    elapsed = time.perf_counter() - start
+    after = {sid: stored(client)[sid]['perc'] for sid in students}
+    dropped = sum(1 for sid in students if after[sid] < before[sid])
+    ok = settled and dropped == len(students) and matches_recompute(client, students)
+    return ok, f"{dropped}/{len(students)} entries lowered {elapsed * 1000:.0f} ms after the response"
+
+
+def check_queued(client, meta):
+    from write_behind import WriteBehindQueue
+    models.set_write_overlay(None)
+    queue = WriteBehindQueue(os.path.join(tempfile.mkdtemp(), 'queue.db'))
+    queue.start = lambda: None # flushed by hand below
+    queue.on_commit(defaulters_index.on_commit)
+    class_id = list(meta['students_by_class'])[1]
+    students = meta['students_by_class'][class_id]
+    day = (datetime.utcnow().date() + timedelta(days=2)).strftime('%Y-%m-%d')
+    queue.set_many(models.Attendance.__collection__, {
+        f"q_{sid}": {'student_id': sid, 'subject_id': meta['class_subjects'][class_id][0], 'class_id': class_id,
+                     'date': day, 'status': 'Absent'} for sid in students})
+    before = {sid: stored(client)[sid]['perc'] for sid in students}
+    defaulters_index.wait(30)
+    unchanged = before == {sid: stored(client)[sid]['perc'] for sid in students}
+    committed = queue.flush()
+    settled = defaulters_index.wait(30)
+    ok = unchanged and settled and matches_recompute(client, students)
+    return ok, f"{committed} queued marks: index unchanged while queued, refreshed after the flush"
+
+
+def check_scope(client, meta):
+    import app as app_module
+    import cascade
+    teacher = meta['teachers'][0]
+    http = app_module.create_app().test_client()
+    http.post('/login', data={'username': teacher['username'], 'password': meta['password']})
+    everyone = http.get('/api/defaulters?threshold=101').get_json()['students']
+    outside = next(c for c in client.dump()['classrooms'] if c not in teacher['classes'])
+    blocked = http.get(f'/api/defaulters?threshold=101&class_id={outside}').get_json()['count']
+    student_id = everyone[0]['student_id']
+    cascade.cascade_jobs.start('student', student_id, wait=60)
+    defaulters_index.wait(30)
+    ok = ({d['class_id'] for d in everyone} <= set(teacher['classes']) and blocked == 0
+          and student_id not in stored(client))
+    return ok, (f"teacher sees {len(everyone)} students in {len(teacher['classes'])} classes, 0 elsewhere; "
+                f"deleted student removed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students-per-class', type=int, default=60)
+    parser.add_argument('--history-days', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--threshold', type=float, default=85)
+    args = parser.parse_args()
+
+    data = build_dataset(departments=3, classes_per_dept=2, students_per_class=args.students_per_class,
+                         teachers=4, security=1, history_days=args.history_days, today_marked=0)
+    meta = data.pop('_meta')
+    client = LocalFirestoreClient(latency=args.latency_ms / 1000.0)
+    client.load(data)
+    models.set_db(client)
+    import app as app_module
+    http = app_module.create_app().test_client()
+    http.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+
+    checks = [('rebuild', check_rebuild(client)),
+              ('api', check_api(client, http, args.threshold)),
+              ('marking', check_marking(client, http, meta)),
+              ('queued', check_queued(client, meta)),
+              ('scope', check_scope(client, meta))]
+    failed = False
+    for name, (ok, detail) in checks:
+        print(f"{name:<8} {'ok' if ok else 'FAILED':<7} {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Fault injection: retries, deadlines and the circuit breaker around Firestore calls.
+
+Runs against the in-memory Firestore stand-in seeded from benchmarks/dataset.py and
+injects failures with LocalFirestoreClient.inject_faults().
+
+  * retry      - a query failing twice with ServiceUnavailable is retried; all() returns
+    every document.
+  * outage     - a query that keeps failing raises FirestoreUnavailable instead of
+    returning [], and count() does not fall back to a full scan.
+  * breaker    - after the threshold the collection fails fast without calling Firestore;
+    after the cooldown one probe call closes it again. Other collections are unaffected.
+  * deadline   - a call slower than the deadline raises FirestoreUnavailable within it.
+  * commit     - a batch commit failing twice is retried and stored once.
+  * http       - during an outage an API route answers 503 with Retry-After.
+
+The run exits non-zero when a check fails.
+
+    python benchmarks/faults.py [--students 120]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+from models import Attendance, FirestoreUnavailable, Student, commit_batch
+
+STUDENTS = Student.__collection__
+DEADLINE = models.FIRESTORE_DEADLINE
+
+
+def fresh(data, latency=0.0):
+    client = LocalFirestoreClient(latency=latency)
+    client.load(data)
+    models.set_db(client) # also resets the breakers
+    return client
+
+
+def count_calls(client):
+    calls = []
+    original = client._before_call
+    client._before_call = lambda collection, kind, timeout=None: (calls.append((collection, kind)),
+                                                                   original(collection, kind, timeout))
+    return calls
+
+
+def retry(data, expected):
+    client = fresh(data)
+    client.inject_faults(times=2, kind='query', collection=STUDENTS)
+    got = len(Student.query.all())
+    return got == expected and not client._faults, f"{got}/{expected} students after 2 failed queries"
+
+
+def outage(data):
+    client = fresh(data)
+    client.inject_faults(times=None, collection=STUDENTS)
+    calls = count_calls(client)
+    results, tries = {}, {}
+    for name, call in (('all', lambda: Student.query.all()),
+                       ('count', lambda: Student.query.filter_by(status='Active').count())):
+        models.breakers.reset()
+        del calls[:]
+        try:
+            results[name] = call()
+        except FirestoreUnavailable:
+            results[name] = 'unavailable'
+        tries[name] = len(calls)
+    # A full-scan fallback in count() would show up as calls beyond its own retries
+    ok = results == {'all': 'unavailable', 'count': 'unavailable'} and tries['count'] <= models.RETRY_ATTEMPTS
+    return ok, (f"all() -> {results['all']} after {tries['all']} calls, "
+                f"count() -> {results['count']} after {tries['count']} calls")
+
+
+def breaker(data):
+    client = fresh(data)
+    client.inject_faults(times=None, collection=STUDENTS)
+    calls = count_calls(client)
+    failed = 0
+    # Each call retries; the breaker opens once BREAKER_THRESHOLD failures pile up
+    while not models.breakers.is_open(STUDENTS) and failed < 10:
+        try:
+            Student.query.all()
+        except FirestoreUnavailable:
+            failed += 1
+    before = len(calls)
+    start = time.perf_counter()
+    try:
+        Student.query.all()
+        fast = False
+    except FirestoreUnavailable:
+        fast = len(calls) == before
+    elapsed = (time.perf_counter() - start) * 1000
+    others = len(Attendance.query.limit(5).all()) # a different collection still works
+
+    client.clear_faults()
+    models.breakers.cooldown = 0.2
+    time.sleep(0.25)
+    try:
+        recovered = len(Student.query.all()) > 0 and not models.breakers.is_open(STUDENTS)
+    finally:
+        models.breakers.cooldown = models.BREAKER_COOLDOWN
+    ok = fast and others == 5 and recovered
+    return ok, (f"open after {before} calls, rejected in {elapsed:.2f} ms without calling Firestore, "
+                f"{'closed' if recovered else 'still open'} after the probe")
+
+
+def deadline(data):
+    fresh(data, latency=0.8)
+    models.FIRESTORE_DEADLINE = 0.5
+    start = time.perf_counter()
+    try:
+        Student.query.all()
+        outcome = 'returned'
+    except FirestoreUnavailable as e:
+        outcome = type(e.__cause__).__name__
+    finally:
+        models.FIRESTORE_DEADLINE = DEADLINE
+    elapsed = time.perf_counter() - start
+    return outcome == 'DeadlineExceeded' and elapsed < 0.8, f"{outcome} after {elapsed * 1000:.0f} ms (800 ms calls, 500 ms deadline)"
+
+
+def commit(data):
+    client = fresh(data)
+    client.inject_faults(times=2, kind='commit')
+    batch = client.batch()
+    for i in range(20):
+        batch.set(client.collection('fault_probe').document(f"p{i}"), {'n': i})
+    commit_batch(batch, 'fault_probe')
+    stored = len(client.dump().get('fault_probe', {}))
+    return stored == 20 and not client._faults, f"{stored}/20 documents after 2 failed commits"
+
+
+def http(data, meta):
+    client = fresh(data)
+    import app as app_module
+    flask_app = app_module.create_app()
+    http_client = flask_app.test_client()
+    http_client.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+    class_id = next(iter(data['classrooms']))
+    client.inject_faults(times=None, collection=STUDENTS)
+    response = http_client.get(f'/api/get_students_by_class/{class_id}')
+    client.clear_faults()
+    models.breakers.reset()
+    ok = response.status_code == 503 and response.headers.get('Retry-After') and response.is_json
+    return ok, f"{response.status_code} with Retry-After {response.headers.get('Retry-After')}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=120)
+    args = parser.parse_args()
+
+    # Keep the backoff short so the run takes seconds, not the production schedule
+    models.RETRY_BASE_DELAY = 0.01
+    data = build_dataset(departments=1, classes_per_dept=2, students_per_class=args.students // 2,
+                         teachers=1, security=1, history_days=2)
+    meta = data.pop('_meta')
+    checks = [('retry', retry(data, len(data[STUDENTS]))),
+              ('outage', outage(data)),
+              ('breaker', breaker(data)),
+              ('deadline', deadline(data)),
+              ('commit', commit(data)),
+              ('http', http(data, meta))]
+    failed = False
+    for name, (ok, detail) in checks:
+        print(f"{name:<9} {'ok' if ok else 'FAILED':<7} {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
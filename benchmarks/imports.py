@@ -0,0 +1,75 @@
+"""Worker import-time profile and per-worker RSS, lazy vs eager heavy imports.
+
+Each scenario runs in a fresh interpreter. The top of the `-X importtime` report for
+`import app` shows what every gunicorn worker still pays at boot; the "eager" rows add
+the modules app.py used to import up front (pandas, firebase_admin.firestore).
+
+    python benchmarks/imports.py [--top 15]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ('lazy: import app', 'import app'),
+    ('lazy + first export (pandas)', 'import app; import pandas'),
+    ('eager: app + pandas + firestore', 'import app; import pandas; import firebase_admin.firestore'),
+]
+
+PROBE = """
+import json, resource, time
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+with open('/proc/self/statm') as f:
+    rss_pages = int(f.read().split()[1])
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_pages * resource.getpagesize() / 2**20}}))
+"""
+
+
+def run_probe(stmt):
+    out = subprocess.run([sys.executable, '-c', PROBE.format(stmt=stmt)], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def importtime_report(stmt, top):
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', stmt], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level; keep app's direct imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth != 1:
+            continue
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<34} {'import s':>9} {'RSS MB':>8}")
+    for label, stmt in SCENARIOS:
+        runs = [run_probe(stmt) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r['seconds'])
+        print(f"{label:<34} {best['seconds']:>9.3f} {best['rss_mb']:>8.1f}")
+
+    print(f"\n-X importtime, top {args.top} direct imports of `import app` (cumulative ms):")
+    for cumulative_us, self_us, name in importtime_report('import app', args.top):
+        print(f"  {cumulative_us / 1000:>8.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
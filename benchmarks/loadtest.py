@@ -0,0 +1,140 @@
+"""Dashboard load test under each gunicorn worker class (requests/sec and p95 latency).
+
+Starts gunicorn with gunicorn.conf.py against the in-memory Firestore stand-in
+(seeded from benchmarks/dataset.py, with simulated per-call latency), logs in as
+admin from every client thread and hammers GET / for a fixed duration.
+
+    python benchmarks/loadtest.py [--worker-classes sync gthread gevent] [--clients 32]
+"""
+import argparse
+import http.cookiejar
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.dataset import write_dataset
+
+
+def percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def login(base, username, password):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+    opener.open(f"{base}/login", body, timeout=30).read()
+    return opener
+
+
+def wait_healthy(base, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            if urllib.request.urlopen(f"{base}/health", timeout=1).status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('gunicorn did not become healthy')
+
+
+def hammer(base, meta, path, clients, duration):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    # Log everyone in first (pbkdf2 is slow on purpose), then start the clock together
+    openers = [login(base, meta['admin'], meta['password']) for _ in range(clients)]
+    ready = threading.Barrier(clients + 1)
+    window = {}
+
+    def client(opener):
+        local, failed = [], 0
+        ready.wait()
+        while time.monotonic() < window['stop_at']:
+            start = time.perf_counter()
+            try:
+                opener.open(f"{base}{path}", timeout=60).read()
+                local.append(time.perf_counter() - start)
+            except OSError:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(o,)) for o in openers]
+    for t in threads: t.start()
+    started = time.monotonic()
+    window['stop_at'] = started + duration
+    ready.wait()
+    for t in threads: t.join()
+    elapsed = time.monotonic() - started
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': percentile(latencies, 95) * 1000,
+    }
+
+
+def run_worker_class(worker_class, data_path, meta, args, port):
+    env = dict(os.environ,
+               FIRESTORE_BACKEND='memory', LOCAL_FIRESTORE_DATA=data_path,
+               LOCAL_FIRESTORE_LATENCY_MS=str(args.latency_ms),
+               GUNICORN_WORKER_CLASS=worker_class, WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.threads), PORT=str(port))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py')],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=None if args.verbose else subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_healthy(base, proc)
+        # Warm the per-worker metadata caches before measuring
+        hammer(base, meta, '/', min(args.clients, 4), 2)
+        return hammer(base, meta, '/', args.clients, args.duration)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated Firestore round trip per call')
+    parser.add_argument('--students-per-class', type=int, default=60)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--verbose', action='store_true', help='show gunicorn logs')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, 'dataset.json')
+        meta = write_dataset(data_path, students_per_class=args.students_per_class)
+
+        print(f"{'worker class':<12} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for i, worker_class in enumerate(args.worker_classes):
+            if worker_class == 'gevent' and importlib.util.find_spec('gevent') is None:
+                print(f"{worker_class:<12} skipped (gevent not installed)")
+                continue
+            r = run_worker_class(worker_class, data_path, meta, args, args.port + i)
+            print(f"{worker_class:<12} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.1f} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Morning-rush load test (8:45-9:15): teachers submitting attendance while the gate marks lates.
+
+Runs fully offline and in-process: the Flask app talks to local_firestore with a
+simulated round-trip latency, and every actor is a thread with its own logged-in
+test client. The mix is
+  * teachers   - POST /attendance for one of their classes (a whole class per submit)
+  * security   - GET /portal/LATE?search=<roll prefix>, then POST /mark_status_global/LATE/<id>
+
+Per route it reports throughput, p50/p95/p99 latency and Firestore ops per request.
+With --budget, the run exits non-zero when a route's p95/p99 exceeds its budget.
+
+    python benchmarks/morning_rush.py --teachers 100 --security 6 --duration 30 \\
+        --budget benchmarks/morning_rush_budget.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.ops = defaultdict(Counter)
+        self.errors = Counter()
+
+    def call(self, route, client, method, url, **kwargs):
+        db_client = models.get_db()
+        start = time.perf_counter()
+        with db_client.track_ops() as ops:
+            response = getattr(client, method)(url, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if response.status_code >= 400:
+                self.errors[route] += 1
+            self.latencies[route].append(elapsed)
+            self.ops[route].update(ops)
+        return response
+
+
+def login(flask_app, username, password):
+    client = flask_app.test_client()
+    client.post('/login', data={'username': username, 'password': password})
+    return client
+
+
+def teacher_actor(rec, client, teacher, meta, stop_at, rng):
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    while time.monotonic() < stop_at:
+        class_id = rng.choice(teacher['classes'])
+        form = {'class_id': class_id, 'subject_id': rng.choice(meta['class_subjects'][class_id]), 'date': today}
+        for sid in meta['students_by_class'][class_id]:
+            form[f'status_{sid}'] = 'Absent' if rng.random() < 0.08 else 'Present'
+        rec.call('POST /attendance', client, 'post', '/attendance', data=form)
+
+
+def security_actor(rec, client, students, stop_at, rng):
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    while time.monotonic() < stop_at:
+        sid, roll = rng.choice(students)
+        rec.call('GET /portal/LATE', client, 'get', f'/portal/LATE?search={roll[:6]}&date={today}')
+        rec.call('POST /mark_status_global', client, 'post', f'/mark_status_global/LATE/{sid}?date={today}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--teachers', type=int, default=60)
+    parser.add_argument('--security', type=int, default=4)
+    parser.add_argument('--departments', type=int, default=6)
+    parser.add_argument('--classes-per-dept', type=int, default=6)
+    parser.add_argument('--students-per-class', type=int, default=60)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated Firestore round trip per call')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--budget', help='JSON {route: {"p95_ms": x, "p99_ms": y}}; exit 1 on regression')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    data = build_dataset(departments=args.departments, classes_per_dept=args.classes_per_dept,
+                         students_per_class=args.students_per_class, teachers=args.teachers,
+                         security=args.security, today_marked=0.0, seed=args.seed)
+    meta = data.pop('_meta')
+    db_client = LocalFirestoreClient()
+    db_client.load(data)
+    models.set_db(db_client)
+
+    import app as app_module
+    flask_app = app_module.create_app()
+
+    # Logins happen before the clock starts: pbkdf2 is slow by design
+    teacher_clients = [(login(flask_app, t['username'], meta['password']), t) for t in meta['teachers']]
+    gate_clients = [login(flask_app, g['username'], meta['password']) for g in meta['security']]
+    students = [(sid, st['roll_no']) for sid, st in data['students'].items()]
+
+    db_client.latency = args.latency_ms / 1000.0
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    stop_at = time.monotonic() + args.duration
+    threads = [threading.Thread(target=teacher_actor, args=(rec, c, t, meta, stop_at, random.Random(rng.random())))
+               for c, t in teacher_clients]
+    threads += [threading.Thread(target=security_actor, args=(rec, c, students, stop_at, random.Random(rng.random())))
+                for c in gate_clients]
+    started = time.monotonic()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.monotonic() - started
+
+    results = {}
+    print(f"{'route':<28} {'reqs':>6} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  ops/req")
+    for route, lat in sorted(rec.latencies.items()):
+        ops_per_req = {k: round(v / len(lat), 1) for k, v in sorted(rec.ops[route].items())}
+        results[route] = {
+            'requests': len(lat), 'errors': rec.errors[route], 'rps': len(lat) / elapsed,
+            'p50_ms': statistics.median(lat) * 1000, 'p95_ms': percentile(lat, 95) * 1000,
+            'p99_ms': percentile(lat, 99) * 1000, 'ops_per_request': ops_per_req,
+        }
+        r = results[route]
+        print(f"{route:<28} {r['requests']:>6} {r['errors']:>4} {r['rps']:>7.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}  {ops_per_req}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.budget:
+        with open(args.budget) as f:
+            budget = json.load(f)
+        failures = []
+        for route, limits in budget.items():
+            r = results.get(route)
+            if r is None:
+                failures.append(f"{route}: no requests recorded")
+                continue
+            for metric, limit in limits.items():
+                if r[metric] > limit:
+                    failures.append(f"{route}: {metric} {r[metric]:.1f} > budget {limit}")
+        if failures:
+            print("\nLatency budget exceeded:\n  " + "\n  ".join(failures))
+            sys.exit(1)
+        print("\nAll routes within budget.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Peak memory of FirestoreQuery.all() vs the lazy iter() / iter(prefetch=True).
+
+Seeds the SQL backend (a temporary SQLite file, so rows really stream from a
+cursor) with --records attendance documents, then builds the same
+{student_id: records} tally three ways and reports the traced peak allocation
+and wall time of each. all() holds every model object at once; iter() holds one
+chunk of --chunk objects, so its peak stays flat as --records grows.
+
+    python benchmarks/query_stream.py [--records 100000] [--chunk 500]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from models import Attendance
+from sql_backend import SQLClient
+
+
+def seed(client, n_records, n_students):
+    # One record per student per day, every 11th one Absent
+    docs = {}
+    for i in range(n_records):
+        day = date(2026, 7, 1) + timedelta(days=i // n_students)
+        docs[f"a{i}"] = {'student_id': f"st{i % n_students}", 'subject_id': f"sub{i % 6}",
+                         'class_id': f"cls{i % n_students // 60}", 'date': day.isoformat(),
+                         'status': 'Absent' if i % 11 == 0 else 'Present', 'teacher_id': 't0'}
+    client.load({Attendance.__collection__: docs})
+
+
+def tally(records):
+    counts = {}
+    for rec in records:
+        counts[rec.student_id] = counts.get(rec.student_id, 0) + 1
+    return counts
+
+
+def measure(label, build):
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - base
+    print(f"{label:<22} {peak / 2**20:>10.1f} {elapsed * 1000:>10.0f}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--chunk', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = SQLClient(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(client, args.records, args.students)
+        models.set_db(client)
+
+        tracemalloc.start()
+        print(f"{'mode':<22} {'peak MiB':>10} {'ms':>10}")
+        expected = measure('all()', lambda: tally(Attendance.query.all()))
+        lazy = measure('iter()', lambda: tally(Attendance.query.iter(chunk_size=args.chunk)))
+        prefetched = measure('iter(prefetch=True)',
+                             lambda: tally(Attendance.query.iter(chunk_size=args.chunk, prefetch=True)))
+        tracemalloc.stop()
+        assert expected == lazy == prefetched, "streamed tallies differ from all()"
+        client.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
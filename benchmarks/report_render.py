@@ -0,0 +1,72 @@
+"""Bytes on the wire and time to first byte for a 5,000-row report page.
+
+Seeds the in-memory Firestore stand-in with one class of --students students and
+renders /reports?class_id=... (and /students) with buffered vs streamed templates
+under identity, gzip and (if installed) brotli encodings.
+
+    python benchmarks/report_render.py [--students 5000] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+
+
+def measure(http, url, encoding):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    start = time.perf_counter()
+    response = http.get(url, headers=headers, buffered=False)
+    body = iter(response.response)
+    first = next(body, b'')
+    ttfb = time.perf_counter() - start
+    size = len(first) + sum(len(chunk) for chunk in body)
+    total = time.perf_counter() - start
+    response.close()
+    assert response.status_code == 200, response.status_code
+    return ttfb, total, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    data = build_dataset(departments=1, classes_per_dept=1, students_per_class=args.students,
+                         teachers=1, security=1, history_days=3)
+    meta = data.pop('_meta')
+    client = LocalFirestoreClient()
+    client.load(data)
+    models.set_db(client)
+
+    import app as app_module
+    import compression
+    flask_app = app_module.create_app()
+    http = flask_app.test_client()
+    http.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+    class_id = next(iter(data['classrooms']))
+
+    encodings = [None, 'gzip'] + (['br'] if compression.brotli is not None else [])
+    print(f"{'page':<10} {'render':<9} {'encoding':<9} {'KB':>8} {'TTFB ms':>9} {'total ms':>9}")
+    for page, url in (('reports', f'/reports?class_id={class_id}'), ('students', '/students')):
+        for stream in (False, True):
+            app_module.STREAM_TEMPLATES = stream
+            for encoding in encodings:
+                measure(http, url, encoding) # warm caches (metadata, fragments, templates)
+                runs = [measure(http, url, encoding) for _ in range(args.runs)]
+                ttfb = statistics.median(r[0] for r in runs) * 1000
+                total = statistics.median(r[1] for r in runs) * 1000
+                print(f"{page:<10} {'stream' if stream else 'buffered':<9} {encoding or 'identity':<9} "
+                      f"{runs[0][2] / 1024:>8.1f} {ttfb:>9.1f} {total:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Columnar snapshot export vs XLSX: throughput, bytes on disk and an incremental run.
+
+Seeds the in-memory Firestore stand-in with --days of history, then
+  * exports a full snapshot as Parquet and as Arrow IPC,
+  * writes the same joined rows to one XLSX sheet (what export_excel produces),
+  * adds one more day of attendance, deletes a few records and runs an incremental
+    Parquet export, which must list exactly those records as deleted,
+  * memory-maps the Arrow files and counts Absent rows per department.
+
+    python benchmarks/snapshot_export.py [--days 120]
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+import snapshot_export
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+
+
+def dir_size(path, pattern):
+    return sum(os.path.getsize(p) for p in glob.glob(os.path.join(path, '**', pattern), recursive=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--departments', type=int, default=8)
+    args = parser.parse_args()
+
+    data = build_dataset(departments=args.departments, classes_per_dept=4, students_per_class=60,
+                         teachers=1, security=1, history_days=args.days, today_marked=0.0)
+    meta = data.pop('_meta')
+    client = LocalFirestoreClient()
+    client.load(data)
+    models.set_db(client)
+    records = len(data['attendance_records'])
+    print(f"{records} attendance records, {len(data['students'])} students")
+    print(f"{'export':<22} {'seconds':>8} {'rows/s':>10} {'MB':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for fmt in ('parquet', 'arrow'):
+            out = os.path.join(tmp, fmt)
+            r = snapshot_export.export_snapshot(out, fmt=fmt)
+            results[fmt] = out
+            print(f"{fmt + ' (full)':<22} {r['seconds']:>8.2f} {r['rows'] / r['seconds']:>10.0f} "
+                  f"{dir_size(out, '*.' + fmt) / 2**20:>8.2f}")
+
+        # XLSX of the same joined rows, as export_excel writes them
+        import pandas as pd
+        start = time.perf_counter()
+        students, subjects, _ = snapshot_export.load_dimensions()
+        rows = []
+        for rec in data['attendance_records'].values():
+            st, sub = students.get(rec['student_id'], {}), subjects.get(rec['subject_id'], {})
+            rows.append({'Student Name': st.get('name'), 'Roll No': st.get('roll_no'), 'Department': st.get('dept'),
+                         'Subject': sub.get('name', 'Unknown'), 'Date': rec['date'], 'Status': rec['status']})
+        xlsx = os.path.join(tmp, 'report.xlsx')
+        with pd.ExcelWriter(xlsx, engine='openpyxl') as writer:
+            pd.DataFrame(rows).to_excel(writer, index=False, sheet_name='Attendance Report')
+        seconds = time.perf_counter() - start
+        print(f"{'xlsx (openpyxl)':<22} {seconds:>8.2f} {records / seconds:>10.0f} {os.path.getsize(xlsx) / 2**20:>8.2f}")
+
+        # One more day of marks, written through the model so they carry updated_at
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        batch = client.batch()
+        for cid, student_ids in meta['students_by_class'].items():
+            for sid in student_ids:
+                rec = models.Attendance(student_id=sid, subject_id=meta['class_subjects'][cid][0], class_id=cid,
+                                        teacher_id='teacher0', date=today, status='Present')
+                batch.set(client.collection('attendance_records').document(), rec.to_dict())
+                if len(batch) >= 450:
+                    batch.commit()
+                    batch = client.batch()
+        batch.commit()
+        # ... and a few records removed, each leaving its tombstone
+        removed = sorted(data['attendance_records'])[:25]
+        for record_id in removed:
+            client.collection('attendance_records').document(record_id).delete()
+            models.write_tombstone('attendance_records', record_id)
+        r = snapshot_export.export_snapshot(results['parquet'], fmt='parquet')
+        print(f"{'parquet (incremental)':<22} {r['seconds']:>8.2f} {r['rows'] / max(r['seconds'], 1e-9):>10.0f} "
+              f"{'':>8}  {r['rows']} new rows, {r['deleted']} deleted")
+        import pyarrow.parquet as pq
+        listed = {record_id for path in glob.glob(os.path.join(results['parquet'], snapshot_export.DELETED_DIR, '*'))
+                  for record_id in pq.read_table(path).column('record_id').to_pylist()}
+        if listed != set(removed):
+            sys.exit(f"incremental export listed {len(listed)} deleted records, expected {len(removed)}")
+
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        start = time.perf_counter()
+        absent = {}
+        for path in glob.glob(os.path.join(results['arrow'], '**', '*.arrow'), recursive=True):
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+                dept = table.column('dept')[0].as_py()
+                absent[dept] = absent.get(dept, 0) + pc.sum(pc.equal(table.column('status'), 'Absent')).as_py()
+        print(f"mmap query: Absent rows per dept over the Arrow snapshot in {time.perf_counter() - start:.3f} s "
+              f"({sum(absent.values())} rows)")
+
+
+if __name__ == '__main__':
+    main()
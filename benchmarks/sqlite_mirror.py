@@ -0,0 +1,99 @@
+"""Reporting pages served from Firestore vs the SQLite mirror: time, document reads, agreement.
+
+Seeds the in-memory Firestore stand-in with --days of history, runs a full mirror
+sync, then renders /reports, /export_summary_excel and the dashboard once reading
+Firestore and once reading the mirror (report bodies must match). Finally marks one
+more class, deletes a student and times the incremental sync.
+
+    python benchmarks/sqlite_mirror.py [--days 90]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import build_dataset
+from local_firestore import LocalFirestoreClient
+
+
+def timed_get(client, http, url, runs):
+    times, reads, body = [], 0, b''
+    for _ in range(runs):
+        with client.track_ops() as ops:
+            start = time.perf_counter()
+            response = http.get(url)
+            body = response.get_data()
+            times.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+        reads = ops['read']
+    return statistics.median(times), reads, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--departments', type=int, default=6)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    data = build_dataset(departments=args.departments, classes_per_dept=4, students_per_class=60,
+                         teachers=1, security=1, history_days=args.days, today_marked=0.8)
+    meta = data.pop('_meta')
+    client = LocalFirestoreClient()
+    client.load(data)
+    models.set_db(client)
+    print(f"{len(data['attendance_records'])} attendance records, {len(data['students'])} students")
+
+    import app as app_module
+    import sqlite_mirror
+    with tempfile.TemporaryDirectory() as tmp:
+        mirror = sqlite_mirror.SQLiteMirror(os.path.join(tmp, 'mirror.db'))
+        start = time.perf_counter()
+        mirror.sync()
+        print(f"full sync: {time.perf_counter() - start:.2f} s, "
+              f"{os.path.getsize(mirror.path) / 2**20:.1f} MB")
+
+        flask_app = app_module.create_app()
+        http = flask_app.test_client()
+        http.post('/login', data={'username': meta['admin'], 'password': meta['password']})
+        class_id = next(iter(data['classrooms']))
+        pages = (('reports (all)', '/reports'), ('reports (class)', f'/reports?class_id={class_id}'),
+                 ('summary xlsx', '/export_summary_excel'), ('dashboard', '/'))
+
+        print(f"{'page':<17} {'firestore ms':>13} {'reads':>8} {'mirror ms':>10} {'reads':>8}")
+        for name, url in pages:
+            app_module.fresh_mirror = lambda: None
+            fs_time, fs_reads, fs_body = timed_get(client, http, url, args.runs)
+            app_module.fresh_mirror = lambda: mirror
+            m_time, m_reads, m_body = timed_get(client, http, url, args.runs)
+            note = ''
+            if not url.startswith('/export'):
+                strip = lambda b: re.sub(rb'<[^<]*data as of [^<]*</(p|div)>', b'', b, flags=re.I)
+                note = 'identical' if strip(fs_body) == strip(m_body) else 'DIFFERENT'
+            print(f"{name:<17} {fs_time * 1000:>13.0f} {fs_reads:>8} {m_time * 1000:>10.0f} {m_reads:>8}  {note}")
+
+        # Incremental: one more class marked today, one student deleted (tombstone)
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        cid = next(iter(meta['students_by_class']))
+        for sid in meta['students_by_class'][cid]:
+            models.Attendance(student_id=sid, subject_id=meta['class_subjects'][cid][0], class_id=cid,
+                              teacher_id='teacher0', date=today, status='Present').save()
+        models.Student.query.get(meta['students_by_class'][cid][0]).delete()
+        start = time.perf_counter()
+        applied = mirror.sync()
+        gone = mirror.conn().execute('SELECT COUNT(*) FROM students WHERE id = ?',
+                                     (meta['students_by_class'][cid][0],)).fetchone()[0] == 0
+        print(f"incremental sync: {(time.perf_counter() - start) * 1000:.0f} ms, rows applied {applied}, "
+              f"deleted student removed: {gone}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Worker startup benchmark: time to first healthy /health with 1k and 50k users.
+
+Runs offline against local_firestore with a simulated per-call latency and compares
+the old import-time normalization loop with the current lazy boot. The one-shot
+`maintain` normalization is timed separately since it now runs once per deploy.
+
+    python benchmarks/startup.py [--users 1000 50000] [--latency-ms 5]
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models
+from local_firestore import LocalFirestoreClient
+
+
+def seed_users(client, n):
+    users = client.collection('users')
+    batch = client.batch()
+    for i in range(n):
+        # Mixed-case credentials so normalization has real work to do
+        batch.set(users.document(f"u{i}"), {
+            'name': f"Teacher {i}", 'username': f"Teacher{i}@College.edu", 'email': f"Teacher{i}@College.edu",
+            'password': 'x', 'role': 'admin' if i == 0 else 'teacher', 'assigned_classes': []
+        })
+        if len(batch) >= 500:
+            batch.commit()
+            batch = client.batch()
+    batch.commit()
+
+
+def legacy_boot(app_module):
+    # The pre-factory import-time work: default admin check + per-user save loop
+    app_module.create_default_admin()
+    for u in models.User.query.all():
+        changed = False
+        for field in ('email', 'username'):
+            value = getattr(u, field, None)
+            if value and value != value.strip().lower():
+                setattr(u, field, value.strip().lower())
+                changed = True
+        if changed:
+            u.save()
+
+
+def fresh_app():
+    sys.modules.pop('app', None)
+    return importlib.import_module('app')
+
+
+def run(n, latency):
+    results = {}
+    for mode in ('legacy', 'lazy'):
+        client = LocalFirestoreClient()
+        seed_users(client, n)
+        client.latency = latency
+        client.reset_ops()
+        models.set_db(client)
+        models.user_cache.clear()
+
+        start = time.perf_counter()
+        app_module = fresh_app()
+        flask_app = app_module.create_app()
+        if mode == 'legacy':
+            legacy_boot(app_module)
+        status = flask_app.test_client().get('/health').status_code
+        elapsed = time.perf_counter() - start
+        assert status == 200
+        results[mode] = (elapsed, client.op_totals())
+
+        if mode == 'lazy':
+            start = time.perf_counter()
+            updated = app_module.normalize_users()
+            results['maintain'] = (time.perf_counter() - start, {'updated': updated})
+            start = time.perf_counter()
+            app_module.normalize_users()
+            results['maintain (rerun)'] = (time.perf_counter() - start, {})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 50000])
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated Firestore round trip per call')
+    args = parser.parse_args()
+
+    print(f"{'users':>7} {'boot path':<18} {'seconds':>9}  firestore ops")
+    for n in args.users:
+        for mode, (seconds, ops) in run(n, args.latency_ms / 1000.0).items():
+            print(f"{n:>7} {mode:<18} {seconds:>9.3f}  {ops}")
+
+
+if __name__ == '__main__':
+    main()
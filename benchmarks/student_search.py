@@ -0,0 +1,73 @@
+"""Typeahead latency of the student search index at 50k students.
+
+Seeds the in-memory Firestore stand-in, builds the index once and times
+/api/students/search for name fragments, roll prefixes and class-scoped queries
+(target: p95 under 10 ms), plus the index build itself.
+
+    python benchmarks/student_search.py [--students 50000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+from benchmarks.dataset import STAFF_PASSWORD, build_dataset
+from local_firestore import LocalFirestoreClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    classes = 8 * 10
+    data = build_dataset(departments=8, classes_per_dept=10, students_per_class=max(1, args.students // classes),
+                         teachers=1, security=1)
+    data.pop('_meta')
+    client = LocalFirestoreClient()
+    client.load(data)
+    models.set_db(client)
+
+    import app as app_module
+    from student_search import student_index
+    flask_app = app_module.create_app()
+    http = flask_app.test_client()
+    http.post('/login', data={'username': 'gate0@bench.edu', 'password': STAFF_PASSWORD})
+
+    start = time.perf_counter()
+    student_index.search('x')
+    print(f"index build: {len(data['students'])} students in {time.perf_counter() - start:.2f} s")
+
+    rng = random.Random(3)
+    students = list(data['students'].values())
+    class_ids = list(data['classrooms'])
+    kinds = {
+        'name fragment': lambda: f"ent {rng.randint(0, 7)}-{rng.randint(0, 9)}",
+        'roll prefix': lambda: rng.choice(students)['roll_no'][:rng.randint(4, 8)],
+        'exact roll': lambda: rng.choice(students)['roll_no'],
+        '2-char query': lambda: rng.choice(students)['roll_no'][1:3],
+    }
+    print(f"{'query kind':<22} {'p50 ms':>8} {'p95 ms':>8}")
+    for kind, make in list(kinds.items()) + [('class-scoped name', None)]:
+        timings = []
+        for _ in range(args.queries):
+            if make is None:
+                url = f"/api/students/search?q=student&class_id={rng.choice(class_ids)}"
+            else:
+                url = f"/api/students/search?q={make()}"
+            t0 = time.perf_counter()
+            assert http.get(url).status_code == 200
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        print(f"{kind:<22} {statistics.median(timings):>8.2f} {timings[int(len(timings) * 0.95)]:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
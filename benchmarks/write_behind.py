@@ -0,0 +1,202 @@
+"""Write-behind queue: submit throughput vs synchronous batches, and crash recovery.
+
+Runs against the in-memory Firestore stand-in with a simulated --latency-ms round
+trip per call.
+
+  * throughput - --teachers threads each submit --submits classes of --class-size
+    records, once committing a batch per submit (today's attendance() POST) and once
+    appending to the write-behind queue; reports submits/s, p50/p95 submit latency and
+    the number of Firestore commits each mode issued.
+  * crash      - a child process queues records and is killed before they are flushed;
+    a fresh queue on the same file must commit every one of them.
+  * replay     - a child commits a batch and is killed before deleting its rows; the
+    replayed batch must leave exactly the same documents. Both crash checks share a
+    SQLite-backed store (sql_backend) between the child and this process.
+  * outage     - the stand-in fails the first --failures commits; the flusher must back
+    off, retry and commit everything, with queued records readable meanwhile (all(),
+    count() and aggregate()).
+
+The run exits non-zero when a check fails.
+
+    python benchmarks/write_behind.py [--teachers 50] [--submits 4] [--latency-ms 40]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import models
+import write_behind
+from local_firestore import LocalFirestoreClient
+from sql_backend import SQLClient
+
+COLLECTION = 'attendance_records'
+
+
+def records(teacher, submit, class_size):
+    return {f"t{teacher}s{submit}r{i}": {'student_id': f"st{teacher}_{i}", 'subject_id': f"sub{submit}",
+                                        'class_id': f"cls{teacher}", 'date': '2026-10-19', 'status': 'Present',
+                                        'updated_at': models.utc_stamp()}
+            for i in range(class_size)}
+
+
+def count_commits(client):
+    # Batch sizes of every commit the client receives
+    commits = []
+    original = client._commit
+    client._commit = lambda ops, timeout=None: (commits.append(len(ops)), original(ops, timeout))
+    return commits
+
+
+def run_submits(args, submit):
+    latencies = []
+    lock = threading.Lock()
+
+    def teacher(t):
+        for s in range(args.submits):
+            docs = records(t, s, args.class_size)
+            start = time.perf_counter()
+            submit(docs)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=teacher, args=(t,)) for t in range(args.teachers)]
+    start = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def report(label, latencies, wall, commits):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    print(f"{label:<14} {len(latencies) / wall:>10.1f} {statistics.median(ordered) * 1000:>9.1f} "
+          f"{p95 * 1000:>9.1f} {commits:>9}")
+
+
+def throughput(args, tmp):
+    latency = args.latency_ms / 1000.0
+    print(f"{'mode':<14} {'submits/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'commits':>9}")
+
+    client = LocalFirestoreClient(latency=latency)
+    models.set_db(client)
+    commits = count_commits(client)
+
+    def sync_submit(docs):
+        batch = client.batch()
+        for doc_id, data in docs.items():
+            batch.set(client.collection(COLLECTION).document(doc_id), data)
+        batch.commit()
+
+    latencies, wall = run_submits(args, sync_submit)
+    report('sync batch', latencies, wall, len(commits))
+
+    client = LocalFirestoreClient(latency=latency)
+    models.set_db(client)
+    commits = count_commits(client)
+    queue = write_behind.WriteBehindQueue(os.path.join(tmp, 'throughput.db'), interval=0.05)
+    latencies, wall = run_submits(args, lambda docs: queue.set_many(COLLECTION, docs))
+    drain_start = time.perf_counter()
+    while queue.size():
+        time.sleep(0.01)
+    drained = time.perf_counter() - drain_start
+    report('write-behind', latencies, wall, len(commits))
+    expected = args.teachers * args.submits * args.class_size
+    stored = len(client.dump().get(COLLECTION, {}))
+    print(f"  drained {drained * 1000:.0f} ms after the last submit; batch sizes max {max(commits)}, "
+          f"mean {statistics.mean(commits):.0f}")
+    return stored == expected, f"write-behind stored {stored}/{expected} records"
+
+
+CHILD = """
+import os, sys
+sys.path.insert(0, {root!r})
+import models, write_behind
+from sql_backend import SQLClient
+models.set_db(SQLClient({store!r}))
+queue = write_behind.WriteBehindQueue({path!r})
+queue.start = lambda: None # no flusher: the process dies with everything queued
+docs = {{f"crash{{i}}": {{'student_id': f"st{{i}}", 'status': 'Absent', 'date': '2026-10-19'}} for i in range({n})}}
+queue.set_many('attendance_records', docs)
+if {commit_first}:
+    rows = queue.conn().execute('SELECT seq, collection, doc_id, data, merge, attempts FROM pending').fetchall()
+    queue._commit(rows[:500])
+os._exit(9) # killed: no flush, no atexit
+"""
+
+
+def crash(tmp, n, commit_first):
+    path = os.path.join(tmp, f"crash_{int(commit_first)}.db")
+    store = f"sqlite:///{os.path.join(tmp, f'store_{int(commit_first)}.db')}"
+    child = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT, path=path, store=store, n=n,
+                                                               commit_first=commit_first)])
+    client = SQLClient(store)
+    models.set_db(client)
+    before = client.collection(COLLECTION).count().get()[0][0].value
+    queue = write_behind.WriteBehindQueue(path)
+    left = queue.size()
+    queue.flush()
+    docs = {doc.id: doc.to_dict() for doc in client.collection(COLLECTION).stream()}
+    client.engine.dispose()
+    ok = child.returncode == 9 and left == n and len(docs) == n and queue.size() == 0 \
+        and before == (min(n, 500) if commit_first else 0) and all(d['status'] == 'Absent' for d in docs.values())
+    return ok, f"{left} rows survived the kill ({before} already committed), {len(docs)}/{n} documents after recovery"
+
+
+def outage(tmp, failures):
+    client = LocalFirestoreClient()
+    client.inject_faults(times=failures, kind='commit')
+    models.set_db(client)
+    queue = write_behind.WriteBehindQueue(os.path.join(tmp, 'outage.db'), interval=0.05, retry_max=0.5)
+    models.set_write_overlay(queue.pending)
+    try:
+        docs = records(0, 0, 60)
+        start = time.perf_counter()
+        queue.set_many(COLLECTION, docs)
+        query = lambda: models.Attendance.query.filter_by(class_id='cls0')
+        readable = len(query().all())
+        # count() and aggregate() as the dashboard and class pages use them
+        counted = query().count()
+        grouped = sum(r['count'] for r in query().aggregate(group_by=('student_id', 'status')).values())
+        while queue.size() and time.perf_counter() - start < 30:
+            time.sleep(0.05)
+        stored = len(client.dump().get(COLLECTION, {}))
+    finally:
+        models.set_write_overlay(None)
+    ok = readable == counted == grouped == 60 and stored == 60 and not client._faults
+    return ok, (f"{readable}/60 readable while queued (count {counted}, aggregate {grouped}), {stored}/60 stored after {failures} failed commits "
+                f"({time.perf_counter() - start:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--submits', type=int, default=4)
+    parser.add_argument('--class-size', type=int, default=60)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--crash-records', type=int, default=1200)
+    parser.add_argument('--failures', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checks = [('throughput', throughput(args, tmp)),
+                  ('crash', crash(tmp, args.crash_records, commit_first=False)),
+                  ('replay', crash(tmp, args.crash_records, commit_first=True)),
+                  ('outage', outage(tmp, args.failures))]
+    failed = False
+    for name, (ok, detail) in checks:
+        print(f"{name:<11} {'ok' if ok else 'FAILED':<7} {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
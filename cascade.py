@@ -0,0 +1,290 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from defaulters import defaulters_index
+from models import (IN_QUERY_LIMIT, Attendance, BulkWriter, Classroom, Department, Student, Subject, User,
+                    get_db, user_cache, utc_stamp)
+from status_history import status_history
+from student_search import student_index
+
+# Cascading deletes. Deleting a department, class, student or subject also removes what
+# hangs off it, instead of leaving orphans for every later scan to skip:
+#
+#   department -> its classes, subjects and students (matched on the department name)
+#   class      -> its students and attendance; the class id leaves teachers' assigned_classes
+#   student    -> its attendance and login
+#   subject    -> its attendance
+#
+# Dependents are found with equality / 'in' queries on indexed fields and removed by a
+# BulkWriter (parallel batches, each delete with its tombstone). With CASCADE_ARCHIVE on
+# (the default) every removed document is first copied to `archived_docs`, so a mistaken
+# delete can be restored. The document deleted by the admin goes last: a job that fails
+# part-way leaves it in place and can simply be started again.
+#
+# Jobs run on one background thread per process. Their progress is kept in the
+# `cascade_jobs` collection, so whichever worker serves the poll can report it.
+#
+#   CASCADE_ARCHIVE   1 (default) = copy removed documents to archived_docs first; 0 = delete only
+
+CASCADE_ARCHIVE = os.environ.get('CASCADE_ARCHIVE', '1') == '1'
+JOBS_COLLECTION = 'cascade_jobs'
+ARCHIVE_COLLECTION = 'archived_docs'
+
+MODELS = {'department': Department, 'class': Classroom, 'student': Student, 'subject': Subject}
+# Order of removal: leaves first, the documents they point at after them
+STAGES = (User.__collection__, Student.__collection__, Subject.__collection__, Classroom.__collection__,
+          Department.__collection__)
+ATTENDANCE = Attendance.__collection__
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # One worker: cascades are rare and must not compete with request reads
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cascade')
+    return _executor
+
+
+def _chunks(values):
+    values = sorted({str(v) for v in values if v})
+    return [values[i:i + IN_QUERY_LIMIT] for i in range(0, len(values), IN_QUERY_LIMIT)]
+
+
+def _where_in(collection, field, values, op='in'):
+    # Snapshots matching `field op values`, in chunks of Firestore's 'in' limit
+    query = get_db().collection(collection)
+    for chunk in _chunks(values):
+        yield from query.where(field, op, chunk).stream()
+
+
+class Plan:
+    """What one cascade removes. Departments, classes, subjects, students and logins are
+    collected up front ({collection: {doc_id: snapshot}}); attendance, which can run to
+    millions of records, is kept as queries and streamed while it is deleted."""
+    def __init__(self, kind, target):
+        self.kind = kind
+        self.target = target
+        self.docs = {collection: {} for collection in STAGES}
+        self.attendance = [] # (field, ids) filters, or a callable yielding snapshots
+        self.teachers = {}   # user id -> assigned_classes without the deleted classes
+
+    def add(self, collection, snapshots):
+        added = []
+        for snap in snapshots:
+            if snap.id not in self.docs[collection]:
+                self.docs[collection][snap.id] = snap
+                added.append(snap.id)
+        return added
+
+    def attendance_streams(self):
+        query = get_db().collection(ATTENDANCE)
+        for source in self.attendance:
+            if callable(source):
+                yield source
+                continue
+            field, ids = source
+            for chunk in _chunks(ids):
+                yield lambda chunk=chunk, field=field: query.where(field, 'in', chunk).stream()
+
+    def counts(self):
+        counts = {collection: len(docs) for collection, docs in self.docs.items() if docs}
+        filters = [source for source in self.attendance if not callable(source)]
+        if filters:
+            # Native count per filter. The filters overlap (a class's records also match its
+            # students' ids), so the largest one stands for the records removed and their sum,
+            # which counts a record once per filter it matches, is kept as an upper bound
+            query = get_db().collection(ATTENDANCE)
+            per_filter = [sum(query.where(field, 'in', chunk).count().get()[0][0].value for chunk in _chunks(ids))
+                          for field, ids in filters]
+            counts[ATTENDANCE] = max(per_filter)
+            if len(per_filter) > 1:
+                counts[f"{ATTENDANCE}_max"] = sum(per_filter)
+        if self.teachers:
+            counts['teachers_updated'] = len(self.teachers)
+        return counts
+
+
+def _attendance_keys(snapshots):
+    # Values a record's student_id may hold for these students: doc id or, in older data, roll number
+    keys = set()
+    for snap in snapshots:
+        keys |= Student(id=snap.id, **(snap.to_dict() or {}))._attendance_keys()
+    return keys
+
+
+def plan(kind, target_id):
+    """Collect the target (kind: department, class, student or subject) and its dependents."""
+    model = MODELS[kind]
+    db_conn = get_db()
+    snap = db_conn.collection(model.__collection__).document(str(target_id)).get()
+    if not snap.exists:
+        return None
+    result = Plan(kind, target_id)
+    result.add(model.__collection__, [snap])
+
+    class_ids, subject_ids = set(), set()
+    if kind == 'department':
+        name = (snap.to_dict() or {}).get('name')
+        if name:
+            class_ids.update(result.add(Classroom.__collection__, _where_in(Classroom.__collection__, 'dept', [name])))
+            subject_ids.update(result.add(Subject.__collection__, _where_in(Subject.__collection__, 'dept', [name])))
+            result.add(Student.__collection__, _where_in(Student.__collection__, 'dept', [name]))
+    elif kind == 'class':
+        class_ids.add(str(target_id))
+    elif kind == 'subject':
+        subject_ids.add(str(target_id))
+
+    result.add(Student.__collection__, _where_in(Student.__collection__, 'class_id', class_ids))
+    student_ids = set(result.docs[Student.__collection__])
+    result.add(User.__collection__, _where_in(User.__collection__, 'student_id', student_ids))
+    student_keys = _attendance_keys(result.docs[Student.__collection__].values())
+    result.attendance = [(field, ids) for field, ids in (('class_id', class_ids), ('student_id', student_keys),
+                                                         ('subject_id', subject_ids)) if ids]
+
+    for teacher in _where_in(User.__collection__, 'assigned_classes', class_ids, op='array_contains_any'):
+        if teacher.id in result.docs[User.__collection__]: continue
+        assigned = (teacher.to_dict() or {}).get('assigned_classes') or []
+        result.teachers[teacher.id] = [cid for cid in assigned if str(cid) not in class_ids]
+    return result
+
+
+def plan_orphans():
+    """Collect what earlier single-document deletes left behind: attendance records and
+    student logins whose student no longer exists. Reads those collections in full."""
+    db_conn = get_db()
+    # Records keyed by a live student's roll number still belong to it
+    student_ids = _attendance_keys(db_conn.collection(Student.__collection__).select(['roll_no']).stream())
+    result = Plan('orphans', 'sweep')
+    result.add(User.__collection__,
+               (snap for snap in db_conn.collection(User.__collection__).where('role', '==', 'student').stream()
+                if (snap.to_dict() or {}).get('student_id') and str(snap.to_dict()['student_id']) not in student_ids))
+    result.attendance = [lambda: (snap for snap in db_conn.collection(ATTENDANCE).stream()
+                                  if str((snap.to_dict() or {}).get('student_id')) not in student_ids)]
+    return result
+
+
+class CascadeJobs:
+    def __init__(self, archive=CASCADE_ARCHIVE):
+        self.archive = archive
+
+    def _job_ref(self, job_id):
+        return get_db().collection(JOBS_COLLECTION).document(job_id)
+
+    def _update(self, job_id, **fields):
+        try:
+            self._job_ref(job_id).set({**fields, 'updated_at': utc_stamp()}, merge=True)
+        except Exception as e:
+            print(f"Cascade job {job_id} progress write error: {e}")
+
+    def create(self, kind, target_id, label=None, user_id=None):
+        job_id = uuid.uuid4().hex[:20]
+        self._job_ref(job_id).set({'kind': kind, 'target_id': str(target_id), 'label': label,
+                                   'requested_by': user_id, 'state': 'queued', 'archive': self.archive,
+                                   'planned': {}, 'removed': {}, 'created_at': utc_stamp(),
+                                   'updated_at': utc_stamp()})
+        return job_id
+
+    def start(self, kind, target_id, label=None, user_id=None, wait=0):
+        """Run the cascade in the background. Returns (job id, finished): waits up to
+        `wait` seconds, so small cascades are done before the caller redirects."""
+        if kind not in MODELS:
+            raise ValueError(f"Unknown cascade kind {kind!r}")
+        job_id = self.create(kind, target_id, label, user_id)
+        future = _get_executor().submit(self.run, job_id, lambda: plan(kind, target_id))
+        try:
+            future.result(timeout=wait)
+        except TimeoutError:
+            return job_id, False
+        return job_id, True
+
+    def status(self, job_id):
+        snap = self._job_ref(job_id).get()
+        return {'id': job_id, **snap.to_dict()} if snap.exists else None
+
+    def run(self, job_id, make_plan):
+        """Plan and apply one cascade; returns the removed counts (also recorded on the
+        job), or None when it failed."""
+        self._update(job_id, state='planning')
+        try:
+            result = make_plan()
+            if result is None:
+                self._update(job_id, state='done', finished_at=utc_stamp())
+                return {}
+            self._update(job_id, state='running', planned=result.counts())
+            removed = self.apply(result, lambda done: self._update(job_id, removed=done))
+        except Exception as e:
+            print(f"Cascade job {job_id} failed: {e}")
+            self._update(job_id, state='failed', error=str(e), finished_at=utc_stamp())
+            return None
+        self._update(job_id, state='done', removed=removed, finished_at=utc_stamp())
+        return removed
+
+    def _remove(self, writer, collection, snap, cause):
+        if self.archive:
+            # Copy and delete in one batch: nothing is lost between the two
+            writer.reserve(3)
+            writer.set(get_db().collection(ARCHIVE_COLLECTION).document(f"{collection}_{snap.id}"),
+                       {'collection': collection, 'doc_id': snap.id, 'data': snap.to_dict(),
+                        'cascade': cause, 'archived_at': utc_stamp()})
+        writer.delete(snap.reference)
+
+    def apply(self, result, progress=None):
+        db_conn = get_db()
+        cause = f"{result.kind}/{result.target}"
+        removed = {}
+        marked = set() # students whose attendance was removed
+        # Each stage commits before the next starts, so the target goes only once
+        # everything pointing at it is gone. Attendance streams query by query: a record
+        # matching two filters is already deleted when the second one runs.
+        if result.attendance:
+            removed[ATTENDANCE] = 0
+            for stream in result.attendance_streams():
+                with BulkWriter() as writer:
+                    for snap in stream():
+                        marked.add((snap.to_dict() or {}).get('student_id'))
+                        self._remove(writer, ATTENDANCE, snap, cause)
+                        removed[ATTENDANCE] += 1
+                if progress: progress(dict(removed))
+            status_history.invalidate()
+        if result.teachers:
+            with BulkWriter() as writer:
+                for user_id, assigned in result.teachers.items():
+                    writer.update(db_conn.collection(User.__collection__).document(user_id),
+                                  {'assigned_classes': assigned, 'updated_at': utc_stamp()})
+            removed['teachers_updated'] = len(result.teachers)
+            for user_id in result.teachers: user_cache.pop(str(user_id))
+        for collection in STAGES:
+            docs = result.docs[collection]
+            if not docs: continue
+            with BulkWriter() as writer:
+                for snap in docs.values():
+                    self._remove(writer, collection, snap, cause)
+            removed[collection] = len(docs)
+            if progress: progress(dict(removed))
+        self._forget(result)
+        # Deleted students leave the shortage index; others who lost records (a subject's) are recomputed
+        deleted = set(result.docs[Student.__collection__])
+        defaulters_index.remove(deleted)
+        defaulters_index.touch({str(sid) for sid in marked if sid} - deleted)
+        print(f"Cascade {cause}: removed {', '.join(f'{c} {n}' for c, n in removed.items()) or 'nothing'}")
+        return removed
+
+    def _forget(self, result):
+        # In-process indexes and caches that still hold the removed documents
+        for user_id in result.docs[User.__collection__]:
+            user_cache.pop(str(user_id))
+        students = result.docs[Student.__collection__]
+        if len(students) > 50:
+            student_index.invalidate()
+        else:
+            for student_id in students: student_index.remove(student_id)
+
+
+cascade_jobs = CascadeJobs()
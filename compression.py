@@ -0,0 +1,86 @@
+import gzip
+import os
+import zlib
+
+from flask import request
+
+# Response compression for the HTML/JSON pages (reports and student tables run to
+# hundreds of KB). Brotli is used when the optional `brotli` package is installed
+# and the client accepts it, gzip otherwise.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024)) # bytes; smaller bodies are sent as-is
+COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5 # higher levels cost far more CPU for a few % on HTML
+COMPRESS_MIMETYPES = {'text/html', 'application/json', 'text/css', 'text/javascript', 'application/javascript', 'text/csv'}
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def rechunk(chunks, size=STREAM_CHUNK_SIZE):
+    # Jinja yields many tiny strings; group them so each network write (and each
+    # compressor flush) carries a useful amount of HTML
+    buf, buffered = [], 0
+    for chunk in chunks:
+        if not chunk: continue
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf) if isinstance(chunk, str) else b''.join(buf)
+            buf, buffered = [], 0
+    if buf:
+        yield ''.join(buf) if isinstance(buf[0], str) else b''.join(buf)
+
+
+def _compress_stream(chunks, encoding, charset='utf-8'):
+    # Flush after every chunk so the browser can paint what has been rendered so far
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = chunk.encode(charset) if isinstance(chunk, str) else chunk
+            yield compressor.process(data) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31) # 31 = gzip container
+        for chunk in chunks:
+            data = chunk.encode(charset) if isinstance(chunk, str) else chunk
+            yield compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def compress_response(response):
+    """after_request hook: gzip/brotli eligible responses."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        if encoding == 'br':
+            data = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            data = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+        response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,175 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models import (IN_QUERY_LIMIT, Attendance, BulkWriter, Student, attendance_stats, call_with_retry, get_db,
+                    utc_stamp)
+
+# Shortage index: every student's current attendance standing, one document per student
+# in `attendance_standing`, so "who is below 75%" is an indexed range query on `perc`
+# (sorted by it) instead of a recompute from raw records on every visit.
+#
+# Kept current from the write paths: saved marks (or, with write-behind, the flusher once
+# they commit), cascading deletes and semester closes touch() the students concerned. A
+# background worker recomputes those students with Student.day_counts_many() (one
+# grouped aggregation per 30 students) and rewrites their documents. A refresh that fails
+# is dropped after a log line; `flask rebuild-defaulters` recomputes everyone.
+#
+# Students without a marked day have perc None and never match a threshold. On Firestore
+# the class and department queries need composite indexes (class_id, perc) and (dept, perc).
+#
+#   DEFAULTERS_INDEX   1 (default) = maintain the index; 0 = off (the API answers 503)
+
+DEFAULTERS_INDEX = os.environ.get('DEFAULTERS_INDEX', '1') == '1'
+DEFAULTER_THRESHOLD = 75.0
+STANDING_COLLECTION = 'attendance_standing'
+BUCKET_WIDTH = 5     # percentage points per bucket: 72.4% -> 70
+REFRESH_CHUNK = 300  # students loaded and aggregated per step of a refresh
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # One worker: refreshes coalesce, and must not compete with request reads
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='defaulters')
+    return _executor
+
+
+def bucket(perc):
+    if perc is None: return None
+    return min(100, int(perc // BUCKET_WIDTH) * BUCKET_WIDTH)
+
+
+def standing(student, counts):
+    """Index document for `student` from its day_counts() tuple. `present` is after the
+    late penalty, as the percentage; `absent` counts absent days."""
+    absent = counts[2]
+    total_days, present, perc, od, leave, lates = attendance_stats(counts)
+    perc = perc if total_days else None
+    return {
+        'student_id': str(student.id),
+        'name': getattr(student, 'name', ''),
+        'roll_no': getattr(student, 'roll_no', ''),
+        'class_id': str(getattr(student, 'class_id', '') or ''),
+        'dept': getattr(student, 'dept', ''),
+        'semester': str(getattr(student, 'semester', '') or ''),
+        'total': total_days,
+        'present': present,
+        'absent': absent,
+        'od': od,
+        'leave': leave,
+        'late': lates,
+        'perc': perc,
+        'bucket': bucket(perc),
+        'updated_at': utc_stamp(),
+    }
+
+
+class DefaultersIndex:
+    def __init__(self, enabled=DEFAULTERS_INDEX):
+        self.enabled = enabled
+        self._pending = set()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def _collection(self):
+        return get_db().collection(STANDING_COLLECTION)
+
+    # -- maintenance --
+    def touch(self, student_ids):
+        """Queue a background refresh of these students' standings."""
+        if not self.enabled: return
+        ids = {str(i) for i in student_ids if i}
+        with self._lock:
+            self._pending |= ids
+            if self._scheduled or not self._pending: return
+            self._scheduled = True
+            self._idle.clear()
+        _get_executor().submit(self._drain)
+
+    def on_commit(self, collection, docs):
+        # Write-behind listener: marks count once they are in Firestore
+        if collection == Attendance.__collection__:
+            self.touch(data.get('student_id') for data in docs.values())
+
+    def _drain(self):
+        # Students touched while a refresh runs are picked up by the next round
+        while True:
+            with self._lock:
+                ids, self._pending = self._pending, set()
+                if not ids:
+                    self._scheduled = False
+                    self._idle.set()
+                    return
+            try:
+                self.refresh(ids)
+            except Exception as e:
+                print(f"Defaulters index refresh of {len(ids)} students failed: {e}")
+
+    def wait(self, timeout=None):
+        """Block until touched students are refreshed; False on timeout."""
+        return self._idle.wait(timeout)
+
+    def refresh(self, student_ids):
+        """Recompute and store the standing of these students; ids that are not student
+        documents (records keyed by roll number) are skipped. Returns the number stored."""
+        ids = sorted({str(i) for i in student_ids if i})
+        db_conn = get_db()
+        students_ref = db_conn.collection(Student.__collection__)
+        stored = 0
+        for i in range(0, len(ids), REFRESH_CHUNK):
+            refs = [students_ref.document(student_id) for student_id in ids[i:i + REFRESH_CHUNK]]
+            snaps = call_with_retry(Student.__collection__, lambda timeout: list(db_conn.get_all(refs, timeout=timeout)))
+            students = [Student(id=snap.id, **snap.to_dict()) for snap in snaps if snap.exists]
+            counts = Student.day_counts_many(students)
+            with BulkWriter() as writer:
+                for s in students:
+                    writer.set(self._collection().document(str(s.id)), standing(s, counts[str(s.id)]))
+            stored += len(students)
+        return stored
+
+    def remove(self, student_ids):
+        ids = {str(i) for i in student_ids if i}
+        if not ids: return
+        with BulkWriter() as writer:
+            for student_id in ids:
+                writer.delete(self._collection().document(student_id))
+
+    def rebuild(self):
+        """Recompute every student's standing. Returns the number stored."""
+        ids = [snap.id for snap in get_db().collection(Student.__collection__).select([]).stream()]
+        return self.refresh(ids)
+
+    # -- queries --
+    def defaulters(self, threshold=DEFAULTER_THRESHOLD, class_ids=None, dept=None, limit=None):
+        """Standings below `threshold`, lowest first, for the given classes (None = all)
+        and department."""
+        query = self._collection()
+        if dept:
+            query = query.where('dept', '==', dept)
+        if class_ids is None:
+            scopes = [query]
+        else:
+            ids = sorted({str(c) for c in class_ids if c})
+            scopes = [query.where('class_id', 'in', ids[i:i + IN_QUERY_LIMIT])
+                      for i in range(0, len(ids), IN_QUERY_LIMIT)]
+        found = []
+        for scope in scopes:
+            scope = scope.where('perc', '<', float(threshold)).order_by('perc')
+            if limit:
+                scope = scope.limit(limit)
+            snaps = call_with_retry(STANDING_COLLECTION, lambda timeout: list(scope.stream(timeout=timeout)))
+            found.extend(snap.to_dict() for snap in snaps)
+        # Several class chunks each come back sorted; merge them
+        found.sort(key=lambda d: (d['perc'], str(d.get('roll_no', '')).lower()))
+        return found[:limit] if limit else found
+
+
+defaulters_index = DefaultersIndex()
@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models import Attendance, BulkWriter, get_db, utc_stamp
+
+# Display fields copied onto attendance records at write time, so report/history
+# reads render names without joining back to students, subjects, classes and users.
+# Renames are fanned out to existing records by a background job.
+
+DENORMALIZE_ATTENDANCE = os.environ.get('DENORMALIZE_ATTENDANCE', '1') == '1'
+
+# source kind -> (attendance field holding its id, {attendance field: source attribute})
+DISPLAY_FIELDS = {
+    'student': ('student_id', {'student_name': 'name', 'roll_no': 'roll_no', 'dept': 'dept'}),
+    'subject': ('subject_id', {'subject_name': 'name', 'subject_code': 'code'}),
+    'classroom': ('class_id', {'class_name': 'name'}),
+    'teacher': ('teacher_id', {'teacher_name': 'name'}),
+}
+
+_fan_out_executor = None
+_fan_out_lock = threading.Lock()
+
+
+def _fields_for(kind, obj):
+    _, mapping = DISPLAY_FIELDS[kind]
+    return {field: getattr(obj, attr, None) for field, attr in mapping.items()}
+
+
+def display_fields(student=None, subject=None, classroom=None, teacher=None):
+    """Denormalized fields for a new attendance record (empty when disabled)."""
+    if not DENORMALIZE_ATTENDANCE:
+        return {}
+    fields = {}
+    for kind, obj in (('student', student), ('subject', subject), ('classroom', classroom), ('teacher', teacher)):
+        if obj is not None:
+            fields.update(_fields_for(kind, obj))
+    return fields
+
+
+def display_changed(kind, before, after):
+    return _fields_for(kind, before) != _fields_for(kind, after)
+
+
+def _get_executor():
+    # One background worker: fan-outs are rare and must not compete with request reads
+    global _fan_out_executor
+    if _fan_out_executor is None:
+        with _fan_out_lock:
+            if _fan_out_executor is None:
+                _fan_out_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fan-out')
+    return _fan_out_executor
+
+
+def _run_fan_out(kind, doc_id, updates, on_done):
+    id_field, _ = DISPLAY_FIELDS[kind]
+    db_conn = get_db()
+    query = db_conn.collection(Attendance.__collection__).where(id_field, '==', str(doc_id))
+    try:
+        # One batch in flight: the next page streams while it commits
+        with BulkWriter(max_in_flight=1) as writer:
+            for doc in query.stream():
+                # Stamped so incremental readers (SQLite mirror, snapshot export) pick up the rename
+                writer.update(doc.reference, {**updates, 'updated_at': utc_stamp()})
+    except Exception as e:
+        print(f"Error updating attendance display fields for {kind} {doc_id}: {e}")
+        return
+    if on_done:
+        on_done()
+    return writer.written
+
+
+def fan_out(kind, obj, on_done=None):
+    """Rewrite the display fields of `obj` (a renamed student/subject/classroom/teacher)
+    on every attendance record that references it, in the background."""
+    if not DENORMALIZE_ATTENDANCE or not getattr(obj, 'id', None):
+        return None
+    return _get_executor().submit(_run_fan_out, kind, obj.id, _fields_for(kind, obj), on_done)
+
+
+def reset():
+    # Thread pools do not survive fork
+    global _fan_out_executor
+    _fan_out_executor = None
@@ -0,0 +1,47 @@
+# Gunicorn settings (loaded automatically from the working directory).
+# Every route waits on Firestore gRPC calls, so workers run several requests
+# concurrently instead of the default one-request sync workers.
+#
+#   GUNICORN_WORKER_CLASS  gthread (default) | gevent (needs `pip install gevent`) | sync
+#   WEB_CONCURRENCY        worker processes
+#   GUNICORN_THREADS       threads per gthread worker
+#   GUNICORN_WORKER_CONNECTIONS  concurrent greenlets per gevent worker
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+# gunicorn silently turns sync workers into gthread when threads > 1
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+# Import the app once in the master so workers share its pages. create_app() only
+# registers Firebase credentials (no client, no gRPC channel), which is fork-safe.
+# gevent must monkey-patch before the app is imported, so it is never preloaded.
+preload_app = worker_class != 'gevent' and os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers periodically to bound memory growth from caches
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def post_fork(server, worker):
+    # Anything the master opened must not leak into workers: gRPC channels and
+    # thread pools do not survive fork
+    import denormalize
+    import models
+    models.reset_db()
+    denormalize.reset()
+
+
+def post_worker_init(worker):
+    if worker_class == 'gevent':
+        # Let grpc cooperate with gevent's patched sockets and threads
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
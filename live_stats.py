@@ -0,0 +1,128 @@
+import threading
+from datetime import datetime
+
+from models import Attendance, get_db
+
+# Live per-class tallies of today's attendance, kept current by a snapshot listener
+# so the dashboard and class in-charge pages stop rescanning attendance_records.
+
+
+def empty_tally():
+    return {'present': 0, 'absent': 0, 'od': 0, 'leave': 0, 'late': 0}
+
+
+def classify_day(statuses):
+    # Same day-wise rule as the dashboard: any Absent wins, otherwise Present (+ OD/Leave/Late)
+    if 'Absent' in statuses:
+        return ('absent',)
+    if 'OD' in statuses: return ('present', 'od')
+    if 'Leave' in statuses: return ('present', 'leave')
+    if 'Late' in statuses: return ('present', 'late')
+    return ('present',)
+
+
+class FirestoreAttendanceFeed:
+    """Event source backed by a Firestore on_snapshot watch on one day's records."""
+
+    def subscribe(self, date_str, on_change):
+        query = get_db().collection(Attendance.__collection__).where('date', '==', date_str)
+
+        def _on_snapshot(docs, changes, read_time):
+            for change in changes:
+                on_change(change.type.name, change.document.id, change.document.to_dict() or {})
+
+        watch = query.on_snapshot(_on_snapshot)
+        return watch.unsubscribe
+
+
+class LiveAttendanceStats:
+    def __init__(self, feed=None, today_fn=None):
+        self.feed = feed or FirestoreAttendanceFeed()
+        self._today_fn = today_fn or (lambda: datetime.utcnow().strftime('%Y-%m-%d'))
+        self._cond = threading.Condition()
+        self._date = None
+        self._unsubscribe = None
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self._docs = {}      # doc_id -> (student_id, class_id, subject_id, status)
+        self._students = {}  # student_id -> {'class_id': cid, 'records': {doc_id: (subject_id, status)}}
+        self._classes = {}   # class_id -> tally
+
+    def ensure_current(self):
+        # (Re)subscribe on first use and at day rollover
+        today = self._today_fn()
+        with self._cond:
+            if self._date == today:
+                return
+            if self._unsubscribe:
+                try:
+                    self._unsubscribe()
+                except Exception as e:
+                    print(f"Live stats unsubscribe error: {e}")
+            self._reset()
+            self._date = today
+            self.version += 1
+            self._unsubscribe = self.feed.subscribe(today, self._apply)
+
+    def _apply(self, change_type, doc_id, data):
+        with self._cond:
+            old = self._docs.pop(doc_id, None)
+            if old:
+                self._update_student(old[0], old[1], lambda recs: recs.pop(doc_id, None))
+            if change_type != 'REMOVED' and str(data.get('date', '')) == self._date:
+                sid = str(data.get('student_id', '') or '')
+                if sid:
+                    entry = (sid, str(data.get('class_id', '')), str(data.get('subject_id', '')),
+                             str(data.get('status', '')).strip())
+                    self._docs[doc_id] = entry
+                    self._update_student(sid, entry[1], lambda recs: recs.__setitem__(doc_id, (entry[2], entry[3])))
+            self.version += 1
+            self._cond.notify_all()
+
+    def _update_student(self, sid, class_id, mutate):
+        student = self._students.setdefault(sid, {'class_id': class_id, 'records': {}})
+        records = student['records']
+        before = classify_day({st for _, st in records.values()}) if records else ()
+        mutate(records)
+        after = classify_day({st for _, st in records.values()}) if records else ()
+        tally = self._classes.setdefault(student['class_id'], empty_tally())
+        for key in before: tally[key] -= 1
+        for key in after: tally[key] += 1
+        if not records:
+            del self._students[sid]
+
+    def class_tallies(self):
+        self.ensure_current()
+        with self._cond:
+            return {cid: dict(t) for cid, t in self._classes.items()}
+
+    def class_today(self, class_id):
+        """Tally and {student_id: {subject_id: status}} for one class today."""
+        self.ensure_current()
+        class_id = str(class_id)
+        with self._cond:
+            tally = dict(self._classes.get(class_id, empty_tally()))
+            status_map = {}
+            for sid, student in self._students.items():
+                if student['class_id'] != class_id: continue
+                status_map[sid] = {subid: st for subid, st in student['records'].values()}
+            return tally, status_map
+
+    def snapshot(self, class_ids=None):
+        self.ensure_current()
+        with self._cond:
+            classes = {cid: dict(t) for cid, t in self._classes.items()
+                       if class_ids is None or cid in class_ids}
+            totals = empty_tally()
+            for t in classes.values():
+                for k, v in t.items(): totals[k] += v
+            return {'date': self._date, 'version': self.version, 'classes': classes, 'totals': totals}
+
+    def wait_for_change(self, since_version, timeout):
+        """Block until the version moves past since_version or timeout; returns the current version."""
+        self.ensure_current()
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != since_version, timeout=timeout)
+            return self.version
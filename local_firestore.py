@@ -0,0 +1,423 @@
+"""In-memory stand-in for the subset of the Firestore client API used by models.py.
+
+Selected with FIRESTORE_BACKEND=memory (see models.get_db) or injected with
+models.set_db(); used for offline runs and the scripts under benchmarks/.
+Calls can be slowed down (latency, honouring per-call timeouts) and made to fail
+(inject_faults(), failure_rate) to exercise models' retry and breaker logic.
+"""
+import copy
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+MAX_BATCH_OPS = 500
+
+_MISSING = object()
+
+
+# Named like google.api_core.exceptions so models treats them as transient
+class ServiceUnavailable(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _compare(op, left, right):
+    try:
+        if op == '==': return left == right
+        if op == '!=': return left != right
+        if op == '<': return left < right
+        if op == '<=': return left <= right
+        if op == '>': return left > right
+        if op == '>=': return left >= right
+        if op == 'in': return left in right
+        if op == 'not-in': return left not in right
+        if op == 'array_contains': return isinstance(left, list) and right in left
+        if op == 'array_contains_any': return isinstance(left, list) and any(v in left for v in right)
+    except TypeError:
+        # Firestore never matches across value types
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+class _ChangeType:
+    def __init__(self, name): self.name = name
+
+
+class _DocumentChange:
+    def __init__(self, name, document):
+        self.type = _ChangeType(name)
+        self.document = document
+
+
+class _AggregationResult:
+    def __init__(self, value, alias=None):
+        self.value = value
+        self.alias = alias
+
+
+def _aggregate(kind, field, docs):
+    if kind == 'count':
+        return len(docs)
+    # Like Firestore: sum/avg only see numeric values; avg of none is None
+    values = [d.get(field) for d in docs]
+    values = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    if kind == 'sum':
+        return sum(values)
+    return sum(values) / len(values) if values else None
+
+
+class LocalSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class LocalWatch:
+    def __init__(self, client, query, callback):
+        self._client = client
+        self.query = query
+        self.callback = callback
+
+    def unsubscribe(self):
+        self._client._remove_watch(self)
+
+
+class LocalQuery:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, projection=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._projection = projection
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, projection=self._projection)
+        state.update(changes)
+        return LocalQuery(self._client, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            current = data.get(field, _MISSING)
+            if current is _MISSING or not _compare(op, current, value):
+                return False
+        for field, _ in self._orders:
+            if field not in data:
+                return False
+        return True
+
+    def _run(self, timeout=None):
+        self._client._before_call(self._collection, 'query', timeout)
+        with self._client._lock:
+            docs = [(doc_id, copy.deepcopy(data))
+                    for doc_id, data in self._client._collections.get(self._collection, {}).items()
+                    if self._matches(data)]
+        for field, direction in reversed(self._orders):
+            docs.sort(key=lambda item: item[1][field], reverse=(direction == DESCENDING))
+        if self._limit:
+            docs = docs[:self._limit]
+        return docs
+
+    def stream(self, timeout=None):
+        docs = self._run(timeout)
+        self._client._count('read', self._collection, max(1, len(docs)))
+        collection = LocalCollection(self._client, self._collection)
+        for doc_id, data in docs:
+            if self._projection is not None:
+                data = {f: data[f] for f in self._projection if f in data}
+            yield LocalSnapshot(collection.document(doc_id), data)
+
+    def get(self):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return _LocalAggregationQuery(self).count(alias)
+
+    def sum(self, field_path, alias=None):
+        return _LocalAggregationQuery(self).sum(field_path, alias)
+
+    def avg(self, field_path, alias=None):
+        return _LocalAggregationQuery(self).avg(field_path, alias)
+
+    def on_snapshot(self, callback):
+        return self._client._add_watch(self, callback)
+
+
+class _LocalAggregationQuery:
+    def __init__(self, query, aggregations=()):
+        self._query = query
+        self._aggregations = aggregations
+
+    def _add(self, kind, field, alias):
+        return _LocalAggregationQuery(self._query, self._aggregations + ((kind, field, alias),))
+
+    def count(self, alias=None): return self._add('count', None, alias)
+    def sum(self, field_path, alias=None): return self._add('sum', field_path, alias)
+    def avg(self, field_path, alias=None): return self._add('avg', field_path, alias)
+
+    def get(self, timeout=None):
+        docs = [data for _, data in self._query._run(timeout)]
+        # Billed like Firestore: one read per 1000 index entries
+        self._query._client._count('read', self._query._collection, 1 + len(docs) // 1000)
+        return [[_AggregationResult(_aggregate(kind, field, docs), alias or kind)
+                 for kind, field, alias in self._aggregations]]
+
+
+class LocalCollection(LocalQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return LocalDocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.utcnow(), ref
+
+
+class LocalDocumentReference:
+    def __init__(self, client, collection, document_id):
+        self._client = client
+        self._collection = collection
+        self.id = str(document_id)
+        self.path = f"{collection}/{self.id}"
+
+    @property
+    def parent(self):
+        return self._client.collection(self._collection)
+
+    def get(self, timeout=None):
+        self._client._before_call(self._collection, 'get', timeout)
+        self._client._count('read', self._collection)
+        with self._client._lock:
+            data = self._client._collections.get(self._collection, {}).get(self.id)
+            return LocalSnapshot(self, copy.deepcopy(data))
+
+    def set(self, document_data, merge=False, timeout=None):
+        self._client._commit([('set', self, document_data, merge)], timeout)
+
+    def update(self, field_updates, timeout=None):
+        self._client._commit([('update', self, field_updates, True)], timeout)
+
+    def delete(self, timeout=None):
+        self._client._commit([('delete', self, None, False)], timeout)
+
+
+class LocalWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(('set', reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._ops.append(('update', reference, field_updates, True))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self, timeout=None):
+        if len(self._ops) > MAX_BATCH_OPS:
+            raise ValueError(f"Batch of {len(self._ops)} writes exceeds the {MAX_BATCH_OPS} write limit")
+        self._client._commit(self._ops, timeout)
+        ops, self._ops = self._ops, []
+        return ops
+
+
+class LocalFirestoreClient:
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency   # seconds of simulated round trip per call
+        self.failure_rate = failure_rate # share of calls failing with ServiceUnavailable
+        self._faults = []        # [kind, collection, remaining calls (None = until cleared), error]
+        self._collections = {}  # name -> {doc_id: data}
+        self._lock = threading.RLock()
+        self._watches = []
+        self.ops = Counter()     # (kind, collection) -> count
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        # LOCAL_FIRESTORE_DATA: JSON dump ({collection: {doc_id: data}}) to start from;
+        # LOCAL_FIRESTORE_LATENCY_MS: simulated round trip per call;
+        # LOCAL_FIRESTORE_FAILURE_RATE: share of calls failing as UNAVAILABLE
+        client = cls(latency=float(os.environ.get('LOCAL_FIRESTORE_LATENCY_MS', 0)) / 1000.0,
+                     failure_rate=float(os.environ.get('LOCAL_FIRESTORE_FAILURE_RATE', 0)))
+        path = os.environ.get('LOCAL_FIRESTORE_DATA')
+        if path:
+            with open(path) as f:
+                client.load(json.load(f))
+        return client
+
+    def load(self, data):
+        with self._lock:
+            for name, docs in data.items():
+                self._collections.setdefault(name, {}).update(copy.deepcopy(docs))
+
+    def dump(self):
+        with self._lock:
+            return copy.deepcopy(self._collections)
+
+    # -- client surface --
+    def collection(self, name):
+        return LocalCollection(self, name)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def get_all(self, references, timeout=None):
+        for ref in references:
+            yield ref.get(timeout)
+
+    # -- instrumentation --
+    def _count(self, kind, collection, n=1):
+        with self._lock:
+            self.ops[(kind, collection)] += n
+        tracked = getattr(self._local, 'ops', None)
+        if tracked is not None:
+            tracked[kind] += n
+
+    @contextmanager
+    def track_ops(self):
+        """Count the ops issued by the current thread inside the block (e.g. one request)."""
+        previous = getattr(self._local, 'ops', None)
+        self._local.ops = Counter()
+        try:
+            yield self._local.ops
+        finally:
+            self._local.ops = previous
+
+    def inject_faults(self, times=1, kind=None, collection=None, error=ServiceUnavailable):
+        """Fail the next `times` calls matching `kind` ('query', 'get', 'commit') and
+        `collection` (None matches any) with `error`; times=None fails until clear_faults()."""
+        with self._lock:
+            self._faults.append([kind, collection, times, error])
+
+    def clear_faults(self):
+        with self._lock:
+            self._faults.clear()
+
+    def _before_call(self, collection, kind, timeout=None):
+        # Fault and latency injection; subclasses may extend it
+        error = None
+        with self._lock:
+            for fault in self._faults:
+                if fault[0] in (None, kind) and fault[1] in (None, collection):
+                    error = fault[3]
+                    if fault[2] is not None:
+                        fault[2] -= 1
+                        if fault[2] <= 0:
+                            self._faults.remove(fault)
+                    break
+        if error is None and self.failure_rate and random.random() < self.failure_rate:
+            error = ServiceUnavailable
+        if error is not None:
+            raise error(f"{kind} on {collection}: injected failure")
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                time.sleep(max(0.0, timeout))
+                raise DeadlineExceeded(f"{kind} on {collection}: exceeded the {timeout:.3f}s deadline")
+            time.sleep(self.latency)
+
+    def op_totals(self):
+        totals = Counter()
+        with self._lock:
+            for (kind, _), n in self.ops.items():
+                totals[kind] += n
+        return dict(totals)
+
+    def reset_ops(self):
+        with self._lock:
+            self.ops.clear()
+
+    # -- writes --
+    def _commit(self, ops, timeout=None):
+        if ops:
+            self._before_call(ops[0][1]._collection, 'commit', timeout)
+        events = []
+        with self._lock:
+            for kind, ref, data, merge in ops:
+                docs = self._collections.setdefault(ref._collection, {})
+                before = docs.get(ref.id)
+                if kind == 'delete':
+                    docs.pop(ref.id, None)
+                    after = None
+                elif kind == 'update':
+                    if before is None:
+                        raise KeyError(f"No document to update: {ref.path}")
+                    after = dict(before)
+                    after.update(copy.deepcopy(data))
+                    docs[ref.id] = after
+                elif merge and before is not None:
+                    after = dict(before)
+                    after.update(copy.deepcopy(data))
+                    docs[ref.id] = after
+                else:
+                    after = copy.deepcopy(data)
+                    docs[ref.id] = after
+                self._count('delete' if kind == 'delete' else 'write', ref._collection)
+                events.append((ref, before, after))
+            watches = list(self._watches)
+        for ref, before, after in events:
+            self._notify(watches, ref, before, after)
+
+    # -- snapshot listeners --
+    def _add_watch(self, query, callback):
+        watch = LocalWatch(self, query, callback)
+        initial = [_DocumentChange('ADDED', snap) for snap in query.stream()]
+        with self._lock:
+            self._watches.append(watch)
+        callback([c.document for c in initial], initial, datetime.utcnow())
+        return watch
+
+    def _remove_watch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, watches, ref, before, after):
+        for watch in watches:
+            if watch.query._collection != ref._collection:
+                continue
+            was = before is not None and watch.query._matches(before)
+            now = after is not None and watch.query._matches(after)
+            if not was and not now:
+                continue
+            name = 'REMOVED' if not now else ('ADDED' if not was else 'MODIFIED')
+            snap = LocalSnapshot(ref, copy.deepcopy(after if now else before))
+            watch.callback([snap], [_DocumentChange(name, snap)], datetime.utcnow())
@@ -1,21 +1,510 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 from flask_login import UserMixin
 from datetime import datetime, date
 import os
+import copy
 import hashlib
+import threading
+import time
+import itertools
+import queue
+import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 # Firebase is initialized in app.py to ensure environment variables are loaded first
 _db_client = None
+# One client (and gRPC channel) per process, shared by all request threads
+_db_lock = threading.Lock()
+
+# Same value as google.cloud.firestore.Query.DESCENDING; kept local so importing
+# models does not load the Firestore/gRPC stack until the first query
+DESCENDING = 'DESCENDING'
+
+# Upper bound on concurrent aggregation calls issued by count_by()
+COUNT_BY_MAX_WORKERS = 8
+_executor = None
 
 def get_db():
     global _db_client
     if _db_client is None:
+        with _db_lock:
+            if _db_client is None:
+                try:
+                    backend = os.environ.get('FIRESTORE_BACKEND')
+                    if backend == 'memory':
+                        # In-process stand-in for offline runs and benchmarks
+                        from local_firestore import LocalFirestoreClient
+                        _db_client = LocalFirestoreClient.from_env()
+                    elif backend == 'sql':
+                        # SQLAlchemy tables (SQLite locally, Postgres via DATABASE_URL)
+                        from sql_backend import SQLClient
+                        _db_client = SQLClient.from_env()
+                    else:
+                        from firebase_admin import firestore
+                        _db_client = firestore.client()
+                except Exception as e:
+                    print(f"Error: Firestore client could not be initialized. Ensure Firebase Admin is initialized. {e}")
+                    raise e
+    return _db_client
+
+def set_db(client):
+    # Swap the Firestore client (e.g. a local_firestore.LocalFirestoreClient)
+    global _db_client
+    _db_client = client
+    breakers.reset()
+
+def reset_db():
+    # Drop process-level clients after fork: gRPC channels and thread pools are not fork-safe
+    global _db_client, _executor
+    _db_client = None
+    _executor = None
+    collection_versions.reset()
+    breakers.reset()
+
+def get_executor():
+    # Shared pool for fan-out reads, so request threads reuse workers instead of spawning per call
+    global _executor
+    if _executor is None:
+        with _db_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=COUNT_BY_MAX_WORKERS, thread_name_prefix='firestore')
+    return _executor
+
+def utc_stamp():
+    return datetime.utcnow().isoformat(timespec='microseconds')
+
+# Resilience for Firestore calls: each call runs under a deadline, transient errors are
+# retried with jittered exponential backoff, and a per-collection circuit breaker fails
+# calls fast while that collection keeps failing. Callers get FirestoreUnavailable
+# (a 503 in app.py) instead of empty results.
+FIRESTORE_DEADLINE = float(os.environ.get('FIRESTORE_DEADLINE', 20)) # seconds per call, retries included
+RETRY_ATTEMPTS = int(os.environ.get('FIRESTORE_RETRY_ATTEMPTS', 4))
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+BREAKER_THRESHOLD = int(os.environ.get('FIRESTORE_BREAKER_THRESHOLD', 5)) # consecutive transient failures
+BREAKER_COOLDOWN = float(os.environ.get('FIRESTORE_BREAKER_COOLDOWN', 30))
+
+# google.api_core exception names (UNAVAILABLE, DEADLINE_EXCEEDED, ABORTED, RESOURCE_EXHAUSTED,
+# INTERNAL, ...), matched by name so the SDK is not imported up front
+TRANSIENT_ERRORS = frozenset({'ServiceUnavailable', 'DeadlineExceeded', 'Aborted', 'TooManyRequests',
+                              'ResourceExhausted', 'InternalServerError', 'BadGateway', 'GatewayTimeout'})
+
+class FirestoreUnavailable(Exception):
+    """A call kept failing with transient errors, ran out of time, or its collection's
+    circuit breaker is open."""
+    def __init__(self, collection, message):
+        super().__init__(f"{collection}: {message}")
+        self.collection = collection
+
+def is_transient(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+class CircuitBreaker:
+    """Per-collection breaker: opens after `threshold` consecutive transient failures,
+    rejects calls for `cooldown` seconds, then lets one probe call through."""
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._state = {} # collection -> [consecutive failures, opened at (monotonic) or None]
+        self._lock = threading.Lock()
+
+    def allow(self, collection):
+        with self._lock:
+            state = self._state.get(collection)
+            if state is None or state[1] is None:
+                return True
+            if time.monotonic() - state[1] < self.cooldown:
+                return False
+            # Half-open: this call probes; others keep failing fast until it reports back
+            state[1] = time.monotonic()
+            return True
+
+    def is_open(self, collection):
+        with self._lock:
+            state = self._state.get(collection)
+            return state is not None and state[1] is not None and time.monotonic() - state[1] < self.cooldown
+
+    def success(self, collection):
+        with self._lock:
+            self._state.pop(collection, None)
+
+    def failure(self, collection):
+        with self._lock:
+            state = self._state.setdefault(collection, [0, None])
+            state[0] += 1
+            if state[0] >= self.threshold:
+                state[1] = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._state.clear()
+
+breakers = CircuitBreaker()
+
+def call_with_retry(collection, call, deadline=None):
+    """Run call(timeout) against `collection`, retrying transient errors with jittered
+    exponential backoff until `deadline` seconds (FIRESTORE_DEADLINE) have passed.
+    `timeout` is the time left, for the client call's own timeout argument. Other
+    errors propagate unchanged."""
+    if not breakers.allow(collection):
+        raise FirestoreUnavailable(collection, "circuit open after repeated failures")
+    expires = time.monotonic() + (FIRESTORE_DEADLINE if deadline is None else deadline)
+    attempt = 0
+    while True:
         try:
-            _db_client = firestore.client()
+            result = call(max(0.0, expires - time.monotonic()))
+        except FirestoreUnavailable:
+            raise
         except Exception as e:
-            print(f"Error: Firestore client could not be initialized. Ensure Firebase Admin is initialized. {e}")
-            raise e
-    return _db_client
+            if not is_transient(e):
+                raise
+            breakers.failure(collection)
+            attempt += 1
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if attempt >= RETRY_ATTEMPTS or time.monotonic() + delay >= expires or breakers.is_open(collection):
+                raise FirestoreUnavailable(collection, f"{type(e).__name__} after {attempt} attempt(s): {e}") from e
+            time.sleep(delay)
+            continue
+        breakers.success(collection)
+        return result
+
+def commit_batch(batch, collection='batch'):
+    # Batched sets/deletes are idempotent, so a failed commit can be retried as a whole
+    return call_with_retry(collection, lambda timeout: batch.commit(timeout=timeout))
+
+# Firestore rejects a batch of more than 500 writes; each set, update and delete is one
+BATCH_LIMIT = 500
+BULK_MAX_IN_FLIGHT = int(os.environ.get('FIRESTORE_BULK_IN_FLIGHT', 4)) # batches committing at once
+
+class BulkWriter:
+    """Batched writes for imports, migrations and bulk marking.
+
+    set()/update()/save() queue one write each, delete() two (with its tombstone). A
+    full batch (BATCH_LIMIT writes) is committed on a background thread while the
+    caller keeps queuing, with at most `max_in_flight` batches committing at once;
+    queuing blocks beyond that. Each commit is retried by commit_batch(); reserve(n)
+    keeps the next n writes in one batch. close(), or leaving a `with` block, commits
+    the rest, waits for every batch, bumps the versions of the collections written and
+    raises the first failure. When the `with` body raises, writes not yet sent are
+    dropped.
+
+    Batches may land in any order, so write each document once per writer (or use
+    max_in_flight=1). One thread queues; the writer is not shared between threads.
+    """
+    def __init__(self, max_in_flight=BULK_MAX_IN_FLIGHT, batch_limit=BATCH_LIMIT):
+        self.db = get_db()
+        self.batch_limit = min(batch_limit, BATCH_LIMIT)
+        self._ops = []
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='bulk-write')
+        self._futures = []
+        self._lock = threading.Lock()
+        self._collections = set()
+        self._started = time.perf_counter()
+        self.latencies = [] # seconds per committed batch
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._ops = []
+        self.close()
+
+    def set(self, ref, data, merge=False):
+        self._add(('set', ref, data, merge))
+
+    def update(self, ref, data):
+        self._add(('update', ref, data, True))
+
+    def delete(self, ref):
+        # With its tombstone, in the same batch
+        self.reserve(2)
+        self._add(('delete', ref, None, False))
+        self.set(*tombstone(ref.parent.id, ref.id))
+
+    def save(self, obj):
+        # Model.save() as a queued write: the id is generated client side
+        ref = self.db.collection(obj.__collection__).document(str(obj.id) if obj.id else None)
+        obj.id = ref.id
+        self.set(ref, obj.to_dict())
+        return ref
+
+    def reserve(self, n):
+        # Writes that must commit together: start a new batch unless `n` more fit
+        if len(self._ops) + n > self.batch_limit:
+            self.flush()
+
+    def _add(self, op):
+        self._ops.append(op)
+        if len(self._ops) >= self.batch_limit:
+            self.flush()
+
+    def flush(self):
+        """Send the queued writes as one batch without waiting for it to commit."""
+        if not self._ops: return
+        ops, self._ops = self._ops, []
+        self._slots.acquire()
+        try:
+            self._futures.append(self._pool.submit(self._commit, ops))
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _commit(self, ops, release=True):
+        try:
+            batch = self.db.batch()
+            for kind, ref, data, merge in ops:
+                if kind == 'set':
+                    batch.set(ref, data, merge=merge)
+                elif kind == 'update':
+                    batch.update(ref, data)
+                else:
+                    batch.delete(ref)
+            start = time.perf_counter()
+            commit_batch(batch, ops[0][1].parent.id)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.latencies.append(elapsed)
+                self.written += len(ops)
+                self._collections.update(ref.parent.id for _, ref, _, _ in ops)
+        except Exception as e:
+            print(f"Bulk write of {len(ops)} documents failed: {e}")
+            with self._lock:
+                self.failed += len(ops)
+                self.errors.append(e)
+        finally:
+            if release:
+                self._slots.release()
+
+    def close(self):
+        # The last batch commits on this thread: the caller waits for it anyway
+        ops, self._ops = self._ops, []
+        if ops:
+            self._commit(ops, release=False)
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        self._pool.shutdown()
+        if self._collections:
+            collection_versions.bump(*self._collections)
+            self._collections = set()
+        if self.errors:
+            raise self.errors[0]
+        return self.stats()
+
+    def stats(self):
+        with self._lock:
+            ordered = sorted(self.latencies)
+            return {'batches': len(ordered), 'writes': self.written, 'failed': self.failed,
+                    'p50_ms': ordered[len(ordered) // 2] * 1000 if ordered else 0.0,
+                    'max_ms': ordered[-1] * 1000 if ordered else 0.0,
+                    'seconds': time.perf_counter() - self._started}
+
+    def summary(self):
+        s = self.stats()
+        return (f"{s['writes']} writes in {s['batches']} batches, {s['failed']} failed "
+                f"(p50 {s['p50_ms']:.0f} ms, max {s['max_ms']:.0f} ms per batch, {s['seconds']:.1f}s)")
+
+# Deletes leave a marker so incremental readers (sqlite_mirror) can drop their copy
+TOMBSTONE_COLLECTION = 'deleted_docs'
+
+def tombstone(collection, doc_id):
+    # (reference, data) of the marker for a deleted document
+    return (get_db().collection(TOMBSTONE_COLLECTION).document(f"{collection}_{doc_id}"),
+            {'collection': collection, 'doc_id': str(doc_id), 'updated_at': utc_stamp()})
+
+def write_tombstone(collection, doc_id):
+    try:
+        ref, data = tombstone(collection, doc_id)
+        ref.set(data)
+    except Exception as e:
+        print(f"Firestore tombstone write error: {e}")
+
+# Firestore caps 'in' filters at 30 values
+IN_QUERY_LIMIT = 30
+# FirestoreQuery.iter(): objects per chunk, and chunks a prefetch thread may read ahead
+STREAM_CHUNK = int(os.environ.get('STREAM_CHUNK', 500))
+PREFETCH_DEPTH = 2
+
+def day_counts(status_counts):
+    """(total_days, present, absent, od, leave, lates) from {(date, status): records}.
+
+    Day-wise: a day with any Absent record is absent, otherwise present (and counted
+    as OD, else Leave, when such a record exists). `lates` counts Late records.
+    """
+    days = {}
+    lates = 0
+    for (dt, st), n in status_counts.items():
+        days.setdefault(dt, set()).add(st)
+        if st == 'Late':
+            lates += n
+    present = absent = od = leave = 0
+    for statuses in days.values():
+        if 'Absent' in statuses:
+            absent += 1
+        else:
+            present += 1
+            if 'OD' in statuses: od += 1
+            elif 'Leave' in statuses: leave += 1
+    return len(days), present, absent, od, leave, lates
+
+def attendance_stats(counts):
+    """(total_days, effective_present, percentage, od, leave, lates) from day_counts()."""
+    total_days, present_days, _, od_days, leave_days, all_lates_count = counts
+    if total_days == 0:
+        return (0, 0, 0.0, 0, 0, 0)
+    # Penalty: 3 Total Lates across all sessions = 1 day off from presence
+    penalty = all_lates_count // 3
+    effective_present = max(0, present_days - penalty)
+    percentage = min(100.0, (effective_present / total_days) * 100)
+    return (total_days, effective_present, round(percentage, 2), od_days, leave_days, all_lates_count)
+
+def _group_value(value):
+    # Group keys match what models store: dates as 'YYYY-MM-DD', lists as tuples
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+def _group_key(key):
+    key = tuple(_group_value(v) for v in key)
+    return key if len(key) > 1 else key[0]
+
+class _Accumulator:
+    __slots__ = ('count', 'sums', 'ns', 'want_count', 'sum_fields', 'avg_fields')
+
+    def __init__(self, want_count, sum_fields, avg_fields):
+        self.want_count, self.sum_fields, self.avg_fields = want_count, sum_fields, avg_fields
+        self.count = 0
+        self.sums = {}
+        self.ns = {}
+
+    def add(self, data):
+        self.count += 1
+        for field in set(self.sum_fields) | set(self.avg_fields):
+            v = data.get(field)
+            # Like Firestore, only numeric values take part in sum/avg
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                self.sums[field] = self.sums.get(field, 0) + v
+                self.ns[field] = self.ns.get(field, 0) + 1
+
+    def result(self):
+        out = {'count': self.count} if self.want_count else {}
+        for field in self.sum_fields:
+            out[f'sum_{field}'] = self.sums.get(field, 0)
+        for field in self.avg_fields:
+            out[f'avg_{field}'] = self.sums[field] / self.ns[field] if self.ns.get(field) else None
+        return out
+
+def _native_aggregate(collection, query, count, sum_fields, avg_fields):
+    # One aggregation round trip (count/sum/avg); None when the backend cannot run it
+    try:
+        agg = query.count(alias='count') if count else None
+        for field in sum_fields:
+            agg = (agg or query).sum(field, alias=f'sum_{field}')
+        for field in avg_fields:
+            agg = (agg or query).avg(field, alias=f'avg_{field}')
+        if agg is None:
+            return {}
+        return {r.alias: r.value for r in call_with_retry(collection, lambda timeout: agg.get(timeout=timeout))[0]}
+    except FirestoreUnavailable:
+        raise
+    except Exception as e:
+        print(f"Firestore aggregate() error, streaming instead: {e}")
+        return None
+
+def _reduce(collection, query, group_by, count, sum_fields, avg_fields):
+    # Streamed reducer: memory grows with the number of groups, not documents.
+    # A failed stream is retried from the start with fresh accumulators.
+    fields = sorted(set(group_by) | set(sum_fields) | set(avg_fields))
+    if fields and hasattr(query, 'select'):
+        query = query.select(fields) # projection: only the needed fields cross the wire
+    return call_with_retry(collection, lambda timeout: _reduce_stream(query.stream(timeout=timeout), group_by, count,
+                                                                      sum_fields, avg_fields))
+
+def _reduce_stream(docs, group_by, count, sum_fields, avg_fields):
+    groups = {}
+    for doc in docs:
+        data = doc.to_dict() or {}
+        key = tuple(_group_value(data.get(f)) for f in group_by)
+        acc = groups.get(key)
+        if acc is None:
+            acc = groups[key] = _Accumulator(count, sum_fields, avg_fields)
+        acc.add(data)
+    return groups
+
+# Queued, not yet committed writes (write_behind): collection -> {doc_id: (data, merge)}.
+# Reads overlay them so a page rendered right after a submit already shows it.
+_write_overlay = None
+
+def set_write_overlay(pending):
+    global _write_overlay
+    _write_overlay = pending
+
+def _compare(op, left, right):
+    try:
+        if op == '==': return left == right
+        if op == '!=': return left != right
+        if op == '<': return left < right
+        if op == '<=': return left <= right
+        if op == '>': return left > right
+        if op == '>=': return left >= right
+        if op == 'in': return left in right
+        if op == 'not-in': return left not in right
+        if op == 'array_contains': return isinstance(left, list) and right in left
+        if op == 'array_contains_any': return isinstance(left, list) and any(v in left for v in right)
+    except TypeError:
+        # Firestore never matches across value types
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+def _filter_value(val):
+    return val.strftime("%Y-%m-%d") if isinstance(val, (date, datetime)) else val
+
+_END = object()
+
+def _prefetched(chunks, depth=PREFETCH_DEPTH):
+    # Run `chunks` in a reader thread, at most `depth` chunks ahead of the consumer
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    break
+            put(_END)
+        except Exception as e:
+            put(e)
+        finally:
+            chunks.close()
+
+    threading.Thread(target=read, name='firestore-prefetch', daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
 
 class FirestoreQuery:
     def __init__(self, model_class):
@@ -24,6 +513,7 @@ class FirestoreQuery:
         self.filters = []
         self._order_by = None
         self._limit = None
+        self._joins = [] # (model_class, local field, attribute name)
 
     def _get_collection(self):
         if not self.collection_name:
@@ -40,8 +530,12 @@ class FirestoreQuery:
                     self.filters.append((k, '==', v))
         return self
 
-    def filter(self, *args):
-        # Dummy to return self to prevent crashes when SQLAlchemy style .filter() is accidentally called
+    def filter(self, *conditions):
+        # (field, op, value) triples, e.g. .filter(('date', '>=', start), ('status', '==', 'Absent'))
+        for condition in conditions:
+            if not (isinstance(condition, tuple) and len(condition) == 3):
+                raise TypeError(f"filter() takes (field, op, value) tuples, got {condition!r}")
+            self.where(*condition)
         return self
 
     def where(self, field, op, value):
@@ -57,15 +551,32 @@ class FirestoreQuery:
         self._limit = val
         return self
 
-    def all(self):
+    def _filtered(self):
+        # Client query with this query's filters applied (None without a collection)
         collection_ref = self._get_collection()
-        if not collection_ref: return []
+        if not collection_ref: return None
         query = collection_ref
         for f in self.filters:
-            val = f[2]
-            if isinstance(val, (date, datetime)):
-                val = val.strftime("%Y-%m-%d")
-            query = query.where(f[0], f[1], val)
+            query = query.where(f[0], f[1], _filter_value(f[2]))
+        return query
+
+    def _pending(self):
+        if _write_overlay is None or not self.collection_name: return {}
+        try:
+            return _write_overlay(self.collection_name)
+        except Exception as e:
+            print(f"Write-behind overlay error: {e}")
+            return {}
+
+    def _matches(self, data):
+        # Firestore semantics: a document without the field never matches
+        return all(field in data and _compare(op, data[field], _filter_value(val))
+                   for field, op, val in self.filters)
+
+    def _prepared(self):
+        # (client query with filters/order/limit/joins, whether joins run server-side)
+        query = self._filtered()
+        if query is None: return None, False
         
         if self._order_by:
             for field in self._order_by:
@@ -73,24 +584,143 @@ class FirestoreQuery:
                 if hasattr(field, 'key'): fname = field.key
                 if isinstance(fname, str):
                     if fname.startswith('-'):
-                        query = query.order_by(fname[1:], direction=firestore.Query.DESCENDING)
+                        query = query.order_by(fname[1:], direction=DESCENDING)
                     else:
                         query = query.order_by(fname)
         
         if self._limit:
             query = query.limit(self._limit)
+
+        # The SQL backend joins server-side; Firestore gets one batched lookup per join
+        native_join = bool(self._joins) and hasattr(query, 'join_documents')
+        if native_join:
+            for model_class, on, name in self._joins:
+                query = query.join_documents(model_class.__collection__, on, name)
+        return query, native_join
+
+    def _models(self, query, native_join, timeout=None):
+        pending = self._pending()
+        if pending and (self._order_by or self._limit):
+            # Queued documents have to be sorted in among the committed ones
+            yield from self._ordered(list(self._overlaid(query, native_join, pending, timeout)))
+            return
+        yield from self._overlaid(query, native_join, pending, timeout)
+
+    def _overlay(self, docs, pending):
+        # (doc id, data, snapshot) per streamed document with its queued write applied, then
+        # (doc id, data, None) per queued document not committed yet
+        pending = dict(pending)
+        for doc in docs:
+            data = doc.to_dict()
+            queued = pending.pop(doc.id, None)
+            if queued is not None:
+                # A queued write replaces (or merges into) the committed copy
+                data = {**data, **queued[0]} if queued[1] else dict(queued[0])
+                if not self._matches(data): continue
+            yield doc.id, data, doc
+        for doc_id, (data, merge) in pending.items():
+            if not merge and self._matches(data):
+                yield doc_id, data, None
+
+    def _overlaid(self, query, native_join, pending, timeout=None):
+        added = []
+        for doc_id, data, doc in self._overlay(query.stream(timeout=timeout), pending):
+            if doc is None:
+                added.append(self.model_class(id=doc_id, **data))
+                continue
+            data['id'] = doc_id
+            obj = self.model_class(**data)
+            if native_join:
+                for model_class, _, name in self._joins:
+                    related = doc.joined.get(name)
+                    obj._attach(name, model_class(id=related[0], **related[1]) if related else None)
+            yield obj
+        if added and native_join:
+            self._attach_joins(added)
+        yield from added
+
+    def _ordered(self, objs):
+        for field in reversed(self._order_by or ()):
+            fname = getattr(field, 'key', field)
+            if not isinstance(fname, str): continue
+            try:
+                objs.sort(key=lambda o: getattr(o, fname.lstrip('-')), reverse=fname.startswith('-'))
+            except (AttributeError, TypeError):
+                pass
+        return objs[:self._limit] if self._limit else objs
+
+    def _chunks(self, query, native_join, chunk_size, timeout=None):
+        chunk = []
+        for obj in self._models(query, native_join, timeout):
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def all(self):
+        query, native_join = self._prepared()
+        if query is None: return []
         
+        # Raises FirestoreUnavailable rather than passing an outage off as "no results"
+        results = call_with_retry(self.collection_name, lambda timeout: list(self._models(query, native_join, timeout)))
+        if self._joins and not native_join:
+            self._attach_joins(results)
+        return results
+
+    def iter(self, chunk_size=STREAM_CHUNK, prefetch=False):
+        """Lazily yield model objects from the Firestore stream instead of building a list.
+
+        Memory stays at one chunk of `chunk_size` objects (joins are resolved per chunk).
+        With `prefetch`, a background thread reads the next chunk while the caller works
+        on the current one. The stream is retried until its first chunk arrives; a failure
+        after that cannot be resumed and raises FirestoreUnavailable (transient errors) or
+        the original error.
+        """
+        query, native_join = self._prepared()
+        if query is None: return
+
+        def first_chunk(timeout):
+            chunks = self._chunks(query, native_join, chunk_size, timeout)
+            return chunks, next(chunks, None)
+
+        chunks, first = call_with_retry(self.collection_name, first_chunk)
+        if first is None: return
+        if prefetch:
+            chunks = _prefetched(chunks)
         try:
-            docs = query.stream()
-            results = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                results.append(self.model_class(**data))
-            return results
+            for chunk in itertools.chain([first], chunks):
+                if self._joins and not native_join:
+                    self._attach_joins(chunk)
+                yield from chunk
         except Exception as e:
-            print(f"Firestore all() error: {e}")
-            return []
+            if not is_transient(e):
+                raise
+            breakers.failure(self.collection_name)
+            raise FirestoreUnavailable(self.collection_name, f"stream interrupted: {e}") from e
+        finally:
+            chunks.close()
+
+    stream = iter
+
+    def columns(self, fields):
+        """{field: [values]} of every matching document, reading only `fields` and building
+        no model object per record. Retried like all(), with queued writes overlaid; order
+        and limit are not applied."""
+        fields = list(fields)
+        query = self._filtered()
+        if query is None: return {f: [] for f in fields}
+        query = query.select(fields)
+        pending = self._pending()
+
+        def read(timeout):
+            columns = {f: [] for f in fields}
+            for _, data, _ in self._overlay(query.stream(timeout=timeout), pending):
+                for f in fields:
+                    columns[f].append(data.get(f))
+            return columns
+        return call_with_retry(self.collection_name, read)
 
     def first(self):
         res = self.limit(1).all()
@@ -98,33 +728,101 @@ class FirestoreQuery:
 
     def count(self):
         # Native Firestore count aggregation (much faster than fetching all docs)
-        collection_ref = self._get_collection()
-        if not collection_ref: return 0
-        query = collection_ref
-        for f in self.filters:
-            val = f[2]
-            if isinstance(val, (date, datetime)):
-                val = val.strftime("%Y-%m-%d")
-            query = query.where(f[0], f[1], val)
+        query = self._filtered()
+        if query is None: return 0
+        pending = self._pending()
+        if pending:
+            # Queued writes are not in the native count: count the overlaid documents
+            return call_with_retry(self.collection_name,
+                                   lambda timeout: sum(1 for _ in self._overlaid(query, False, pending, timeout)))
         
-        try:
-            # count().get() returns an aggregation results object
-            return query.count().get()[0][0].value
-        except Exception as e:
-            print(f"Firestore count() error: {e}")
-            return len(self.all())
+        # count().get() returns an aggregation results object. No fallback to a full
+        # scan: failures here are outages, where a scan would only add load.
+        return call_with_retry(self.collection_name, lambda timeout: query.count().get(timeout=timeout))[0][0].value
+
+    def count_by(self, field, values):
+        # Grouped count: one native count aggregation per value, run concurrently on the
+        # shared pool so D groups cost roughly one round trip instead of D serial ones
+        return {value: r['count'] for value, r in self.aggregate(group_by=field, groups=values).items()}
+
+    def aggregate(self, count=True, sum=(), avg=(), group_by=None, groups=None):
+        """Aggregate the matching documents without building model objects.
+
+        `sum`/`avg` name numeric fields (a string or a list); results are keyed 'count',
+        'sum_<field>' and 'avg_<field>'. Ungrouped, returns one such dict. With `group_by`
+        (a field or tuple of fields) returns {value or (values...): dict}; documents missing
+        a group field are grouped under None. Native aggregations are used where the backend
+        has them (one query per value when `groups` lists a single field's values);
+        otherwise the documents are streamed once through a reducer.
+        """
+        query = self._filtered()
+        sum_fields = (sum,) if isinstance(sum, str) else tuple(sum)
+        avg_fields = (avg,) if isinstance(avg, str) else tuple(avg)
+        if query is None:
+            return {} if group_by else _Accumulator(count, sum_fields, avg_fields).result()
+        if self._limit:
+            query = query.limit(self._limit)
+
+        collection = self.collection_name
+        pending = self._pending()
+        if pending:
+            # Queued (write-behind) documents are not in native aggregations: reduce over
+            # the overlaid documents until the flusher has committed them
+            return self._overlaid_aggregate(query, pending, count, sum_fields, avg_fields, group_by, groups)
+        if group_by is None:
+            result = _native_aggregate(collection, query, count, sum_fields, avg_fields)
+            if result is not None:
+                return result
+            reduced = _reduce(collection, query, (), count, sum_fields, avg_fields)
+            return reduced.get((), _Accumulator(count, sum_fields, avg_fields)).result()
+
+        group_by = (group_by,) if isinstance(group_by, str) else tuple(group_by)
+        if groups is not None and len(group_by) == 1 and not self._limit:
+            values = list(dict.fromkeys(v for v in groups if v is not None))
+
+            def _one(value):
+                sub = FirestoreQuery(self.model_class)
+                sub.filters = list(self.filters)
+                return value, sub.where(group_by[0], '==', value).aggregate(count, sum_fields, avg_fields)
+
+            return dict(get_executor().map(_one, values)) if values else {}
+
+        if hasattr(query, 'group_count') and not sum_fields and not avg_fields:
+            # SQL backend: GROUP BY runs in the database
+            try:
+                counts = call_with_retry(collection, lambda timeout: query.group_count(group_by))
+                return {_group_key(key): {'count': n} for key, n in counts.items()}
+            except FirestoreUnavailable:
+                raise
+            except Exception as e:
+                print(f"Firestore aggregate() error: {e}")
+        reduced = _reduce(collection, query, group_by, count, sum_fields, avg_fields)
+        return {key if len(group_by) > 1 else key[0]: acc.result() for key, acc in reduced.items()}
+
+    def _overlaid_aggregate(self, query, pending, count, sum_fields, avg_fields, group_by, groups):
+        keys = () if group_by is None else ((group_by,) if isinstance(group_by, str) else tuple(group_by))
+        reduced = call_with_retry(self.collection_name, lambda timeout: _reduce_stream(
+            self._overlaid(query, False, pending, timeout), keys, count, sum_fields, avg_fields))
+        empty = _Accumulator(count, sum_fields, avg_fields)
+        if not keys:
+            return reduced.get((), empty).result()
+        if groups is not None and len(keys) == 1:
+            # Same shape as the per-value native path: every listed value, matched or not
+            return {v: reduced.get((_group_value(v),), empty).result() for v in dict.fromkeys(groups) if v is not None}
+        return {key if len(keys) > 1 else key[0]: acc.result() for key, acc in reduced.items()}
 
     def get(self, doc_id):
         collection_ref = self._get_collection()
         if not doc_id or not collection_ref: return None
-        try:
-            doc = collection_ref.document(str(doc_id)).get()
-            if doc.exists:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                return self.model_class(**data)
-        except Exception as e:
-            print(f"Firestore get() error: {e}")
+        queued = self._pending().get(str(doc_id))
+        if queued is not None and not queued[1]:
+            return self.model_class(id=str(doc_id), **queued[0])
+        ref = collection_ref.document(str(doc_id))
+        doc = call_with_retry(self.collection_name, lambda timeout: ref.get(timeout=timeout))
+        if doc.exists:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            return self.model_class(**data)
         return None
 
     def get_or_404(self, doc_id):
@@ -134,7 +832,25 @@ class FirestoreQuery:
             abort(404)
         return res
 
-    def join(self, *args): return self
+    def join(self, model_class, on, name=None):
+        # Attach each result's `model_class` document (the one whose id is result.<on>) as
+        # attribute `name` (default: the model name, lowercased), or None when it is missing
+        self._joins.append((model_class, on, name or model_class.__name__.lower()))
+        return self
+
+    def _attach_joins(self, results):
+        db_conn = get_db()
+        for model_class, on, name in self._joins:
+            ids = sorted({str(getattr(r, on)) for r in results if getattr(r, on, None) not in (None, '')})
+            collection = db_conn.collection(model_class.__collection__)
+            related = {}
+            refs = [collection.document(i) for i in ids]
+            snaps = call_with_retry(model_class.__collection__, lambda timeout: list(db_conn.get_all(refs, timeout=timeout)))
+            for snap in snaps:
+                if snap.exists:
+                    related[snap.id] = model_class(id=snap.id, **snap.to_dict())
+            for r in results:
+                r._attach(name, related.get(str(getattr(r, on, None))))
 
 class FirestoreSession:
     def add(self, obj):
@@ -143,7 +859,10 @@ class FirestoreSession:
     def commit(self): pass
     def delete(self, obj):
         if hasattr(obj, 'id') and obj.id:
-            get_db().collection(obj.__collection__).document(str(obj.id)).delete()
+            ref = get_db().collection(obj.__collection__).document(str(obj.id))
+            call_with_retry(obj.__collection__, lambda timeout: ref.delete(timeout=timeout))
+            write_tombstone(obj.__collection__, obj.id)
+            collection_versions.bump(obj.__collection__)
     def rollback(self): pass
     def flush(self): pass
 
@@ -159,27 +878,36 @@ class FirestoreModel(metaclass=ModelMeta):
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+    def _attach(self, name, related):
+        # Joined documents are read-only extras: to_dict() (and so save()) leaves them out
+        setattr(self, name, related)
+        self.__dict__.setdefault('_joined', set()).add(name)
+
     def to_dict(self):
         data = self.__dict__.copy()
         data.pop('id', None)
+        joined = data.get('_joined', ())
         clean_data = {}
         for k, v in data.items():
-            if k.startswith('_') or callable(v): continue
+            if k.startswith('_') or callable(v) or k in joined: continue
             if isinstance(v, (date, datetime)):
                 # Convert date/datetime to string as requested
                 v = v.strftime("%Y-%m-%d")
             clean_data[k] = v
+        # Write time: the watermark for incremental readers (snapshot export, SQLite mirror)
+        clean_data['updated_at'] = utc_stamp()
         return clean_data
 
     def save(self):
         clean_data = self.to_dict()
         doc_id = getattr(self, 'id', None)
 
-        if doc_id:
-            get_db().collection(self.__collection__).document(str(doc_id)).set(clean_data)
-        else:
-            _, doc_ref = get_db().collection(self.__collection__).add(clean_data)
-            self.id = doc_ref.id
+        # The id is generated client side before the first attempt, so a retried set()
+        # cannot create a second document the way a retried add() could
+        ref = get_db().collection(self.__collection__).document(str(doc_id) if doc_id else None)
+        call_with_retry(self.__collection__, lambda timeout: ref.set(clean_data, timeout=timeout))
+        self.id = ref.id
+        collection_versions.bump(self.__collection__)
 
     def update(self, **kwargs):
         for k, v in kwargs.items():
@@ -188,7 +916,10 @@ class FirestoreModel(metaclass=ModelMeta):
 
     def delete(self):
         if self.id:
-            get_db().collection(self.__collection__).document(str(self.id)).delete()
+            ref = get_db().collection(self.__collection__).document(str(self.id))
+            call_with_retry(self.__collection__, lambda timeout: ref.delete(timeout=timeout))
+            write_tombstone(self.__collection__, self.id)
+            collection_versions.bump(self.__collection__)
 
     @property
     def display_id(self):
@@ -211,6 +942,93 @@ class DBWrapper:
 
 db = DBWrapper()
 
+class TTLCache:
+    """Small thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Loaded user documents for the per-request user_loader; short TTL bounds staleness across workers
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 2048))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Change stamps for the collections behind the JSON dropdown APIs. Every write bumps
+# its collection's stamp in one shared document, so all workers agree on ETags.
+VERSIONED_COLLECTIONS = ('classrooms', 'departments', 'students', 'subjects')
+VERSIONS_COLLECTION = 'maintenance'
+VERSIONS_DOC = 'collection_versions'
+VERSION_TTL = float(os.environ.get('VERSION_TTL', 5)) # seconds a worker reuses its copy of the stamps
+
+class CollectionVersions:
+    def __init__(self, ttl=VERSION_TTL):
+        self.ttl = ttl
+        self._stamps = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _doc(self):
+        return get_db().collection(VERSIONS_COLLECTION).document(VERSIONS_DOC)
+
+    def get(self, *collections):
+        """Combined stamp for `collections`, or None when the stamps cannot be read."""
+        with self._lock:
+            if self._stamps is None or time.monotonic() - self._loaded_at > self.ttl:
+                try:
+                    doc = self._doc().get()
+                    self._stamps = (doc.to_dict() or {}) if doc.exists else {}
+                    self._loaded_at = time.monotonic()
+                except Exception as e:
+                    print(f"Firestore versions read error: {e}")
+                    return None
+            return '.'.join(str(self._stamps.get(c, 0)) for c in collections)
+
+    def bump(self, *collections):
+        # Nanosecond stamps instead of a counter: unique without a read-modify-write
+        stamps = {c: time.time_ns() for c in collections if c in VERSIONED_COLLECTIONS}
+        if not stamps: return
+        try:
+            self._doc().set(stamps, merge=True)
+        except Exception as e:
+            print(f"Firestore versions write error: {e}")
+        with self._lock:
+            if self._stamps is not None:
+                self._stamps.update(stamps)
+
+    def reset(self):
+        with self._lock:
+            self._stamps = None
+
+collection_versions = CollectionVersions()
+
 class User(UserMixin, FirestoreModel):
     __collection__ = 'users'
     def __init__(self, **kwargs):
@@ -224,6 +1042,44 @@ class User(UserMixin, FirestoreModel):
 
     def get_id(self): return str(self.id)
 
+    def to_dict(self):
+        data = super().to_dict()
+        # Single lowercase lookup key set so login resolves username or email in one query
+        data['login_keys'] = sorted({
+            str(v).strip().lower() for v in (data.get('username'), data.get('email')) if v and str(v).strip()
+        })
+        return data
+
+    def save(self):
+        super().save()
+        user_cache.pop(str(self.id))
+
+    def delete(self):
+        user_cache.pop(str(self.id))
+        super().delete()
+
+    @classmethod
+    def get_cached(cls, user_id):
+        # Served from the session cache; a fresh object per call so requests never share state
+        user_id = str(user_id)
+        data = user_cache.get(user_id)
+        if data is None:
+            user = cls.query.get(user_id)
+            if not user: return None
+            data = user.to_dict()
+            user_cache.set(user_id, data)
+        return cls(id=user_id, **copy.deepcopy(data))
+
+    @classmethod
+    def find_by_login(cls, login):
+        key = str(login or '').strip().lower()
+        if not key: return None
+        user = cls.query.where('login_keys', 'array_contains', key).first()
+        if not user:
+            # Accounts saved before login_keys existed
+            user = cls.query.filter_by(username=key).first() or cls.query.filter_by(email=key).first()
+        return user
+
 
 
 
@@ -239,60 +1095,38 @@ class Classroom(FirestoreModel):
 
 class Student(FirestoreModel):
     __collection__ = 'students'
+    def _attendance_keys(self):
+        # Records reference a student by doc id or, in older data, by roll number
+        return {str(k) for k in (self.id, getattr(self, 'roll_no', None)) if k not in (None, '')}
+
     def get_attendance_stats(self, subject_id=None):
-        # Robust Fetch: check both ID and Roll Number
-        query_id = Attendance.query.filter_by(student_id=str(self.id))
-        query_roll = Attendance.query.filter_by(student_id=str(self.roll_no))
-        
-        if subject_id:
-            query_id = query_id.filter_by(subject_id=subject_id)
-            query_roll = query_roll.filter_by(subject_id=subject_id)
-            
-        recs_id = query_id.all()
-        recs_roll = query_roll.all()
-        
-        # Merge and deduplicate
-        records_map = {r.id: r for r in (recs_id + recs_roll)}
-        records = list(records_map.values())
-        
-        # Day-wise grouping
-        days_marked = {} # date -> set of statuses
-        all_lates_count = 0
-        for r in records:
-            dt = getattr(r, 'date', '')
-            st = getattr(r, 'status', 'Present')
-            if dt not in days_marked:
-                days_marked[dt] = set()
-            days_marked[dt].add(st)
-            if st == 'Late':
-                all_lates_count += 1
-                
-        total_days = len(days_marked)
-        if total_days == 0:
-            return 0, 0, 0.0, 0, 0, 0
-            
-        absent_days = 0
-        od_days = 0
-        leave_days = 0
-        late_days = 0
-        present_days = 0
-        
-        for dt, statuses in days_marked.items():
-            if 'Absent' in statuses:
-                absent_days += 1
-            else:
-                present_days += 1
-                if 'OD' in statuses: od_days += 1
-                elif 'Leave' in statuses: leave_days += 1
-                elif 'Late' in statuses: late_days += 1
-        
-        # Penalty: 3 Total Lates across all sessions = 1 day off from presence
-        penalty = all_lates_count // 3
-        effective_present = max(0, present_days - penalty)
-        
-        percentage = min(100.0, (effective_present / total_days) * 100) if total_days > 0 else 0.0
-        
-        return total_days, effective_present, round(percentage, 2), od_days, leave_days, all_lates_count
+        return Student.attendance_stats_many([self], subject_id)[str(self.id)]
+
+    @staticmethod
+    def attendance_stats_many(students, subject_id=None):
+        """get_attendance_stats() for many students: one grouped aggregation per 30 keys
+        instead of two full record fetches per student. Returns {student id: stats}."""
+        return {sid: attendance_stats(counts) for sid, counts in Student.day_counts_many(students, subject_id).items()}
+
+    @staticmethod
+    def day_counts_many(students, subject_id=None):
+        """day_counts() of many students, read as attendance_stats_many() does. Returns
+        {student id: (total_days, present, absent, od, leave, lates)}."""
+        owners = {} # student_id value in records -> ids of the students it refers to
+        for s in students:
+            for key in s._attendance_keys():
+                owners.setdefault(key, set()).add(str(s.id))
+        status_counts = {str(s.id): {} for s in students}
+        keys = sorted(owners)
+        for i in range(0, len(keys), IN_QUERY_LIMIT):
+            query = Attendance.query.where('student_id', 'in', keys[i:i + IN_QUERY_LIMIT])
+            if subject_id:
+                query = query.filter_by(subject_id=subject_id)
+            for (sid, dt, st), r in query.aggregate(group_by=('student_id', 'date', 'status')).items():
+                for owner in owners.get(str(sid), ()):
+                    counts = status_counts[owner]
+                    counts[(dt, st)] = counts.get((dt, st), 0) + r['count']
+        return {sid: day_counts(counts) for sid, counts in status_counts.items()}
 
 class Subject(FirestoreModel):
     __collection__ = 'subjects'
@@ -304,3 +1138,9 @@ class Attendance(FirestoreModel):
         # Ensure date is a string YYYY-MM-DD
         if hasattr(self, 'date') and isinstance(self.date, (date, datetime)):
             self.date = self.date.strftime("%Y-%m-%d")
+
+    @staticmethod
+    def global_doc_id(student_id, date_str):
+        # One GLOBAL (subject independent) record per student per day; a fixed id makes
+        # re-marking an idempotent overwrite instead of a query-then-save
+        return f"GLOBAL_{date_str}_{student_id}"
@@ -0,0 +1,210 @@
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from models import TOMBSTONE_COLLECTION, Attendance, Classroom, Student, Subject, get_db
+
+# Columnar snapshots of attendance for analytics: attendance_records joined with the
+# student/subject/class dimensions, written as hive-style partitions
+#   <out>/month=YYYY-MM/dept=<dept>/part-<run>-<n>.parquet   (or .arrow)
+# Incremental runs only read records written since the watermark kept in
+# <out>/_watermark.json. A re-marked record shows up again in a later part; consumers
+# keep the row with the newest updated_at per record_id.
+#
+# Incremental runs also list the records deleted since the watermark (from the
+# deleted_docs tombstones, as sqlite_mirror reads them) in
+#   <out>/_deleted/deleted-<run>.parquet   (or .arrow; record_id, deleted_at)
+# Consumers drop a record whose deleted_at is at or after its newest updated_at. The
+# leading underscore keeps the directory out of pyarrow dataset discovery.
+#
+# Needs the optional `pyarrow` package (pip install pyarrow).
+
+WATERMARK_FILE = '_watermark.json'
+PART_ROWS = 100000 # rows buffered per partition before a part file is written
+MAX_BUFFERED_ROWS = 500000 # across partitions; bounds memory on long multi-month exports
+# The next watermark is this run's start minus a margin for clock skew between app
+# servers; records in the overlap are exported twice rather than missed
+WATERMARK_LAG_SECONDS = 60
+FORMATS = ('parquet', 'arrow')
+DELETED_DIR = '_deleted'
+
+SNAPSHOT_COLUMNS = ('record_id', 'date', 'month', 'status', 'student_id', 'roll_no', 'student_name', 'dept',
+                    'class_id', 'class_name', 'semester', 'subject_id', 'subject_code', 'subject_name',
+                    'teacher_id', 'updated_at')
+UNIQUE_COLUMNS = ('record_id', 'updated_at')
+
+
+def _stream(collection):
+    for doc in get_db().collection(collection).stream():
+        yield doc.id, doc.to_dict()
+
+
+def load_dimensions():
+    students = {sid: d for sid, d in _stream(Student.__collection__)}
+    subjects = {sid: d for sid, d in _stream(Subject.__collection__)}
+    classes = {cid: d for cid, d in _stream(Classroom.__collection__)}
+    return students, subjects, classes
+
+
+def read_watermark(out_dir):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_watermark(out_dir, state):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path) # atomic: a crashed run leaves the previous watermark
+
+
+def _write_table(table, path, fmt):
+    import pyarrow as pa
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression='zstd')
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _deleted_since(since):
+    # (record id, deleted_at) of attendance records deleted after the watermark
+    gone = (get_db().collection(TOMBSTONE_COLLECTION).where('collection', '==', Attendance.__collection__)
+            .where('updated_at', '>', since))
+    for doc in gone.stream():
+        data = doc.to_dict()
+        yield str(data.get('doc_id')), None if data.get('updated_at') is None else str(data['updated_at'])
+
+
+def _write_deleted(out_dir, fmt, run_id, deleted):
+    import pyarrow as pa
+    directory = os.path.join(out_dir, DELETED_DIR)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"deleted-{run_id}.{fmt}")
+    table = pa.table({'record_id': pa.array([record_id for record_id, _ in deleted], type=pa.string()),
+                      'deleted_at': pa.array([deleted_at for _, deleted_at in deleted], type=pa.string())})
+    _write_table(table, path, fmt)
+    return path
+
+
+class _PartitionWriter:
+    def __init__(self, out_dir, fmt, run_id):
+        import pyarrow as pa
+        self.pa = pa
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.run_id = run_id
+        self.buffers = {} # (month, dept) -> {column: [values]}
+        self.parts = {}   # (month, dept) -> parts written
+        self.files = []
+        self.rows = 0
+        self.buffered = 0
+
+    def add(self, row):
+        key = (row['month'], row['dept'] or 'unknown')
+        buf = self.buffers.get(key)
+        if buf is None:
+            buf = self.buffers[key] = {c: [] for c in SNAPSHOT_COLUMNS}
+        for c in SNAPSHOT_COLUMNS:
+            buf[c].append(row.get(c))
+        self.buffered += 1
+        if len(buf['record_id']) >= PART_ROWS:
+            self._flush(key)
+        elif self.buffered >= MAX_BUFFERED_ROWS:
+            self.close()
+
+    def _flush(self, key):
+        buf = self.buffers.pop(key, None)
+        if not buf or not buf['record_id']: return
+        self.buffered -= len(buf['record_id'])
+        month, dept = key
+        n = self.parts.get(key, 0)
+        self.parts[key] = n + 1
+        directory = os.path.join(self.out_dir, f"month={month}", f"dept={quote(dept, safe=' ')}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{self.run_id}-{n}.{self.fmt}")
+        table = self.pa.table({c: self.pa.array(buf[c], type=self.pa.string()) for c in SNAPSHOT_COLUMNS})
+        if self.fmt == 'arrow':
+            # Arrow IPC file: uncompressed so readers can pa.memory_map() it with zero copies;
+            # repetitive columns are dictionary-encoded instead
+            table = self.pa.table({c: (table.column(c) if c in UNIQUE_COLUMNS else table.column(c).dictionary_encode())
+                                   for c in SNAPSHOT_COLUMNS})
+        _write_table(table, path, self.fmt)
+        self.files.append(path)
+        self.rows += table.num_rows
+
+    def close(self):
+        for key in list(self.buffers):
+            self._flush(key)
+
+
+def export_snapshot(out_dir, fmt='parquet', full=False):
+    """Export attendance records (all, or only those updated since the watermark) to `out_dir`.
+
+    Returns a dict with rows, files, deleted (record ids listed as deleted by an
+    incremental run), the new watermark and elapsed seconds.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    state = None if full else read_watermark(out_dir)
+    since = state['updated_at'] if state else None
+
+    run_started = datetime.utcnow()
+    students, subjects, classes = load_dimensions()
+    run_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    writer = _PartitionWriter(out_dir, fmt, run_id)
+
+    query = get_db().collection(Attendance.__collection__)
+    if since:
+        query = query.where('updated_at', '>', since)
+    for doc in query.stream():
+        rec = doc.to_dict()
+        date_str = str(rec.get('date') or '')
+        if not date_str: continue
+        sid, sub_id, cid = str(rec.get('student_id', '')), str(rec.get('subject_id', '')), str(rec.get('class_id', ''))
+        student, subject, cls = students.get(sid, {}), subjects.get(sub_id, {}), classes.get(cid, {})
+        updated_at = rec.get('updated_at')
+        writer.add({
+            'record_id': doc.id,
+            'date': date_str,
+            'month': date_str[:7],
+            'status': rec.get('status'),
+            'student_id': sid,
+            'roll_no': student.get('roll_no') or rec.get('roll_no'),
+            'student_name': student.get('name') or rec.get('student_name'),
+            'dept': student.get('dept') or rec.get('dept') or cls.get('dept'),
+            'class_id': cid,
+            'class_name': cls.get('name') or rec.get('class_name'),
+            'semester': None if student.get('semester') is None else str(student.get('semester')),
+            'subject_id': sub_id,
+            'subject_code': subject.get('code') or rec.get('subject_code'),
+            'subject_name': subject.get('name') or rec.get('subject_name') or ('Global/Late' if sub_id == 'GLOBAL' else None),
+            'teacher_id': None if rec.get('teacher_id') is None else str(rec.get('teacher_id')),
+            'updated_at': updated_at,
+        })
+    writer.close()
+
+    # A full export holds only live records; an incremental one must also say what went
+    deleted = list(_deleted_since(since)) if since else []
+    files = list(writer.files)
+    if deleted:
+        files.append(_write_deleted(out_dir, fmt, run_id, deleted))
+
+    new_state = {
+        'updated_at': (run_started - timedelta(seconds=WATERMARK_LAG_SECONDS)).isoformat(timespec='microseconds'),
+        'last_run': run_id,
+        'runs': (state or {}).get('runs', 0) + 1,
+    }
+    _write_watermark(out_dir, new_state)
+    return {'rows': writer.rows, 'files': files, 'deleted': len(deleted), 'watermark': new_state['updated_at'],
+            'seconds': time.perf_counter() - started}
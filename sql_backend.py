@@ -0,0 +1,526 @@
+"""SQL storage backend behind the Firestore client surface used by models.py.
+
+Selected with FIRESTORE_BACKEND=sql (see models.get_db); DATABASE_URL picks the
+database (sqlite:///attendance.db when unset, postgresql://... in production).
+Every collection is a table of (id, data JSON, updated_at) plus indexed columns for
+the fields the app filters on. where()/order_by()/limit() on those columns run in
+SQL; anything else (array_contains, != , non-string values) is applied in Python
+with Firestore's semantics, so models.py and the raw get_db() call sites work
+unchanged. Snapshot listeners (LIVE_DASHBOARD) are Firestore-only. Per-call
+`timeout` arguments are accepted for API compatibility; the engine's own connect
+and statement timeouts apply instead.
+"""
+import copy
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, Index, MetaData, String, Table, create_engine, delete, event, func, or_, select
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+MAX_BATCH_OPS = 500
+BULK_CHUNK = 500 # rows per executemany / IN (...) list
+DEFAULT_DATABASE_URL = 'sqlite:///attendance.db'
+
+# collection -> indexed columns (string values only; other types stay in `data`)
+INDEXED_FIELDS = {
+    'attendance_records': ('student_id', 'subject_id', 'class_id', 'teacher_id', 'date', 'status'),
+    'students': ('class_id', 'dept', 'roll_no', 'semester'),
+    'subjects': ('dept', 'semester', 'teacher_id', 'code'),
+    'classrooms': ('dept',),
+    'departments': ('name',),
+    'users': ('role', 'username', 'email', 'student_id'),
+    'deleted_docs': ('collection',),
+    'attendance_rollups': ('class_id', 'semester'),
+    'attendance_standing': ('class_id', 'dept'), # perc is numeric: filtered and sorted in Python
+}
+# Composite indexes for the reporting paths; single-column ones exist for every indexed field
+COMPOSITE_INDEXES = {
+    'attendance_records': (('class_id', 'date'), ('student_id', 'date'), ('subject_id', 'class_id'), ('date', 'status')),
+    'students': (('class_id', 'roll_no'),),
+}
+
+_MISSING = object()
+
+
+def _compare(op, left, right):
+    try:
+        if op == '==': return left == right
+        if op == '!=': return left != right
+        if op == '<': return left < right
+        if op == '<=': return left <= right
+        if op == '>': return left > right
+        if op == '>=': return left >= right
+        if op == 'in': return left in right
+        if op == 'not-in': return left not in right
+        if op == 'array_contains': return isinstance(left, list) and right in left
+        if op == 'array_contains_any': return isinstance(left, list) and any(v in left for v in right)
+    except TypeError:
+        # Firestore never matches across value types
+        return False
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _sqlite_pragmas(dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+class _AggregationResult:
+    def __init__(self, value, alias=None):
+        self.value = value
+        self.alias = alias
+
+
+class SQLSnapshot:
+    def __init__(self, reference, data, joined=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.joined = joined or {} # join_documents() name -> (doc id, data) or None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class SQLQuery:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, joins=(), projection=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._joins = tuple(joins)
+        self._projection = projection
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, joins=self._joins,
+                     projection=self._projection)
+        state.update(changes)
+        return SQLQuery(self._client, self._collection, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def join_documents(self, collection, on, name):
+        """Attach the `collection` document whose id is this document's `on` field (LEFT JOIN)."""
+        return self._copy(joins=self._joins + ((collection, on, name),))
+
+    # -- SQL translation --
+    def _condition(self, table, field, op, value):
+        # None when the filter cannot be expressed exactly on an indexed string column
+        if field not in table.c or field in ('id', 'data'):
+            return None
+        column = table.c[field]
+        if op in ('==', '<', '<=', '>', '>=') and isinstance(value, str):
+            return {'==': column.__eq__, '<': column.__lt__, '<=': column.__le__,
+                    '>': column.__gt__, '>=': column.__ge__}[op](value)
+        if op == 'in' and value and all(isinstance(v, str) for v in value):
+            return column.in_(list(value))
+        return None
+
+    def _plan(self):
+        client = self._client
+        table = client.table(self._collection)
+        stmt = select(table.c.id, table.c.data)
+        residual = [] # filters applied in Python
+        for field, op, value in self._filters:
+            condition = self._condition(table, field, op, value)
+            if condition is None:
+                residual.append((field, op, value))
+            else:
+                stmt = stmt.where(condition)
+
+        sql_orders = all(field in table.c and field not in ('id', 'data') for field, _ in self._orders)
+        if sql_orders:
+            for field, direction in self._orders:
+                column = table.c[field]
+                stmt = stmt.where(column.isnot(None))
+                stmt = stmt.order_by(column.desc() if direction == DESCENDING else column.asc())
+        if self._limit and not residual and sql_orders:
+            stmt = stmt.limit(self._limit)
+
+        sql_joins, late_joins = [], []
+        for collection, on, name in self._joins:
+            if on in table.c and on not in ('id', 'data'):
+                related = client.table(collection).alias(f"j_{name}")
+                stmt = stmt.outerjoin(related, related.c.id == table.c[on]).add_columns(related.c.id, related.c.data)
+                sql_joins.append(name)
+            else:
+                late_joins.append((collection, on, name))
+        return stmt, residual, sql_orders, sql_joins, late_joins
+
+    def _matches(self, data, residual, sql_orders):
+        for field, op, value in residual:
+            current = data.get(field, _MISSING)
+            if current is _MISSING or not _compare(op, current, value):
+                return False
+        if not sql_orders:
+            for field, _ in self._orders:
+                if field not in data:
+                    return False
+        return True
+
+    def stream(self, timeout=None):
+        stmt, residual, sql_orders, sql_joins, late_joins = self._plan()
+        collection = SQLCollection(self._client, self._collection)
+        buffered = bool(late_joins) or not sql_orders
+        results, n = [], 0
+        with self._client.engine.connect() as conn:
+            for row in conn.execution_options(yield_per=BULK_CHUNK).execute(stmt):
+                data = row[1] or {}
+                if not self._matches(data, residual, sql_orders):
+                    continue
+                joined = {}
+                for i, name in enumerate(sql_joins):
+                    rel_id, rel_data = row[2 + 2 * i], row[3 + 2 * i]
+                    joined[name] = (rel_id, rel_data) if rel_id is not None else None
+                if self._projection is not None:
+                    data = {f: data[f] for f in self._projection if f in data}
+                snapshot = SQLSnapshot(collection.document(row[0]), data, joined)
+                if buffered:
+                    results.append(snapshot)
+                    continue
+                yield snapshot
+                n += 1
+                if self._limit and n >= self._limit:
+                    return
+        if not buffered:
+            return
+        for field, direction in reversed(self._orders if not sql_orders else ()):
+            results.sort(key=lambda s: s._data[field], reverse=(direction == DESCENDING))
+        if self._limit:
+            results = results[:self._limit]
+        for collection_name, on, name in late_joins:
+            refs = {str(s._data.get(on)) for s in results if s._data.get(on) is not None}
+            found = {doc.id: doc for doc in self._client.get_all(
+                [self._client.collection(collection_name).document(i) for i in refs]) if doc.exists}
+            for s in results:
+                doc = found.get(str(s._data.get(on)))
+                s.joined[name] = (doc.id, doc.to_dict()) if doc else None
+        yield from results
+
+    def get(self, timeout=None):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return _SQLAggregationQuery(self).count(alias)
+
+    def sum(self, field_path, alias=None):
+        return _SQLAggregationQuery(self).sum(field_path, alias)
+
+    def avg(self, field_path, alias=None):
+        return _SQLAggregationQuery(self).avg(field_path, alias)
+
+    def group_count(self, group_by):
+        """{(values...): count} over the matching documents, GROUP BY in SQL where possible."""
+        stmt, residual, _, _, _ = self._copy(orders=(), joins=(), projection=None)._plan()
+        table = self._client.table(self._collection)
+        if residual or self._limit or any(f not in table.c or f in ('id', 'data') for f in group_by):
+            counts = {}
+            for doc in self.select(group_by).stream():
+                data = doc.to_dict()
+                key = tuple(data.get(f) for f in group_by)
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+        columns = [table.c[f] for f in group_by]
+        counts = {}
+        with self._client.engine.connect() as conn:
+            grouped = stmt.with_only_columns(*columns, func.count()).where(*(c.isnot(None) for c in columns)) \
+                .group_by(*columns)
+            for row in conn.execute(grouped):
+                counts[tuple(row[:-1])] = row[-1]
+            # Indexed columns only hold strings; rows with other (or no) values are grouped from `data`
+            others = stmt.where(or_(*(c.is_(None) for c in columns)))
+            for _, data in conn.execute(others):
+                key = tuple(data.get(f) for f in group_by)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError("Snapshot listeners need Firestore; disable LIVE_DASHBOARD with the SQL backend")
+
+
+class _SQLAggregationQuery:
+    def __init__(self, query, aggregations=()):
+        self._query = query
+        self._aggregations = aggregations
+
+    def _add(self, kind, field, alias):
+        return _SQLAggregationQuery(self._query, self._aggregations + ((kind, field, alias),))
+
+    def count(self, alias=None): return self._add('count', None, alias)
+    def sum(self, field_path, alias=None): return self._add('sum', field_path, alias)
+    def avg(self, field_path, alias=None): return self._add('avg', field_path, alias)
+
+    def _count(self):
+        query = self._query
+        stmt, residual, _, _, _ = query._copy(orders=(), joins=(), limit=None)._plan()
+        if residual:
+            return sum(1 for _ in query.select(()).stream())
+        with query._client.engine.connect() as conn:
+            n = conn.execute(select(func.count()).select_from(stmt.subquery())).scalar()
+        return min(n, query._limit) if query._limit else n
+
+    def get(self, timeout=None):
+        fields = sorted({f for kind, f, _ in self._aggregations if kind != 'count'})
+        sums, ns = {}, {}
+        if fields:
+            # Values live in the JSON document: one projected pass for all sums/averages
+            for doc in self._query.select(fields).stream():
+                data = doc.to_dict()
+                for f in fields:
+                    v = data.get(f)
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        sums[f] = sums.get(f, 0) + v
+                        ns[f] = ns.get(f, 0) + 1
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = self._count()
+            elif kind == 'sum':
+                value = sums.get(field, 0)
+            else:
+                value = sums[field] / ns[field] if ns.get(field) else None
+            results.append(_AggregationResult(value, alias or kind))
+        return [results]
+
+
+class SQLCollection(SQLQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return SQLDocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return datetime.utcnow(), ref
+
+
+class SQLDocumentReference:
+    def __init__(self, client, collection, document_id):
+        self._client = client
+        self._collection = collection
+        self.id = str(document_id)
+        self.path = f"{collection}/{self.id}"
+
+    @property
+    def parent(self):
+        return self._client.collection(self._collection)
+
+    def get(self, timeout=None):
+        return next(iter(self._client.get_all([self])))
+
+    def set(self, document_data, merge=False, timeout=None):
+        self._client._commit([('set', self, document_data, merge)])
+
+    def update(self, field_updates, timeout=None):
+        self._client._commit([('update', self, field_updates, True)])
+
+    def delete(self, timeout=None):
+        self._client._commit([('delete', self, None, False)])
+
+
+class SQLWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(('set', reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self._ops.append(('update', reference, field_updates, True))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self, timeout=None):
+        # Same limit as Firestore, so code tested here does not break there
+        if len(self._ops) > MAX_BATCH_OPS:
+            raise ValueError(f"Batch of {len(self._ops)} writes exceeds the {MAX_BATCH_OPS} write limit")
+        self._client._commit(self._ops)
+        ops, self._ops = self._ops, []
+        return ops
+
+
+class SQLClient:
+    def __init__(self, url=DEFAULT_DATABASE_URL, **engine_options):
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        # Raw writes may carry datetimes; they are stored as their string form
+        self.engine = create_engine(url, json_serializer=lambda o: json.dumps(o, default=str), **engine_options)
+        if self.engine.dialect.name == 'sqlite':
+            # WAL: writes (e.g. batch.update() while a stream() is open) do not wait on readers
+            event.listen(self.engine, 'connect', _sqlite_pragmas)
+        self.metadata = MetaData()
+        self._tables = {}
+        self._lock = threading.Lock()
+        for name in INDEXED_FIELDS:
+            self.table(name)
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL)
+
+    def table(self, collection):
+        table = self._tables.get(collection)
+        if table is not None:
+            return table
+        with self._lock:
+            if collection not in self._tables:
+                fields = INDEXED_FIELDS.get(collection, ())
+                table = Table(collection, self.metadata,
+                              Column('id', String(255), primary_key=True),
+                              Column('data', JSON, nullable=False),
+                              Column('updated_at', String(32), index=True),
+                              *(Column(f, String, index=True) for f in fields))
+                for cols in COMPOSITE_INDEXES.get(collection, ()):
+                    Index(f"ix_{collection}_{'_'.join(cols)}", *(table.c[c] for c in cols))
+                table.create(self.engine, checkfirst=True)
+                self._tables[collection] = table
+            return self._tables[collection]
+
+    # -- client surface --
+    def collection(self, name):
+        return SQLCollection(self, name)
+
+    def batch(self):
+        return SQLWriteBatch(self)
+
+    def get_all(self, references, timeout=None):
+        references = list(references)
+        by_collection = {}
+        for ref in references:
+            by_collection.setdefault(ref._collection, set()).add(ref.id)
+        found = {}
+        with self.engine.connect() as conn:
+            for collection, ids in by_collection.items():
+                table = self.table(collection)
+                ids = sorted(ids)
+                for i in range(0, len(ids), BULK_CHUNK):
+                    stmt = select(table.c.id, table.c.data).where(table.c.id.in_(ids[i:i + BULK_CHUNK]))
+                    for doc_id, data in conn.execute(stmt):
+                        found[(collection, doc_id)] = data
+        for ref in references:
+            yield SQLSnapshot(ref, found.get((ref._collection, ref.id)))
+
+    def copy_from(self, source, collections):
+        """Stream `collections` from another client (e.g. Firestore) in bulk inserts; returns counts."""
+        counts = {}
+        for collection in collections:
+            chunk, n = [], 0
+            for doc in source.collection(collection).stream():
+                chunk.append((doc.id, doc.to_dict()))
+                if len(chunk) >= BULK_CHUNK:
+                    self._write(collection, chunk, [])
+                    n += len(chunk)
+                    chunk = []
+            self._write(collection, chunk, [])
+            counts[collection] = n + len(chunk)
+        return counts
+
+    def load(self, data):
+        """Bulk insert {collection: {doc_id: data}} (e.g. a local_firestore dump)."""
+        for collection, docs in data.items():
+            items = list(docs.items())
+            for i in range(0, len(items), BULK_CHUNK):
+                self._write(collection, items[i:i + BULK_CHUNK], [])
+
+    # -- writes --
+    def _row(self, table, doc_id, data):
+        row = {'id': doc_id, 'data': data}
+        stamp = data.get('updated_at')
+        row['updated_at'] = stamp if isinstance(stamp, str) else None
+        for column in table.c.keys():
+            if column not in ('id', 'data', 'updated_at'):
+                value = data.get(column)
+                row[column] = value if isinstance(value, str) else None
+        return row
+
+    def _write(self, collection, upserts, deletes, conn=None):
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self._write(collection, upserts, deletes, conn)
+        table = self.table(collection)
+        if deletes:
+            conn.execute(delete(table).where(table.c.id.in_(deletes)))
+        if not upserts:
+            return
+        rows = [self._row(table, doc_id, data) for doc_id, data in upserts]
+        dialect = self.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(index_elements=['id'],
+                                              set_={c: stmt.excluded[c] for c in rows[0] if c != 'id'})
+            conn.execute(stmt, rows)
+        else:
+            conn.execute(delete(table).where(table.c.id.in_([r['id'] for r in rows])))
+            conn.execute(table.insert(), rows)
+
+    def _commit(self, ops):
+        if not ops: return
+        with self.engine.begin() as conn:
+            # Current contents of documents that merge/update ops build on, in one read per collection
+            needed = {}
+            for kind, ref, _, merge in ops:
+                if kind == 'update' or merge:
+                    needed.setdefault(ref._collection, set()).add(ref.id)
+            current = {}
+            for collection, ids in needed.items():
+                table = self.table(collection)
+                for doc_id, data in conn.execute(select(table.c.id, table.c.data).where(table.c.id.in_(sorted(ids)))):
+                    current[(collection, doc_id)] = data
+
+            touched = {} # (collection, id) -> data, or None for deleted; insertion order kept
+            for kind, ref, data, merge in ops:
+                key = (ref._collection, ref.id)
+                if kind == 'delete':
+                    touched[key] = None
+                    continue
+                if kind == 'update' or merge:
+                    base = touched[key] if key in touched else current.get(key)
+                    if base is None and kind == 'update':
+                        raise KeyError(f"No document to update: {ref.path}")
+                    after = dict(base or {})
+                    after.update(copy.deepcopy(data))
+                else:
+                    after = copy.deepcopy(data)
+                touched[key] = after
+
+            by_collection = {}
+            for (collection, doc_id), data in touched.items():
+                upserts, deletes = by_collection.setdefault(collection, ([], []))
+                if data is None:
+                    deletes.append(doc_id)
+                else:
+                    upserts.append((doc_id, data))
+            for collection, (upserts, deletes) in by_collection.items():
+                self._write(collection, upserts, deletes, conn)
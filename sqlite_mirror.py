@@ -0,0 +1,245 @@
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import TOMBSTONE_COLLECTION, get_db
+
+# Optional local read replica for reporting: students, classrooms, subjects, users and
+# attendance_records copied into an embedded SQLite file and kept current through the
+# updated_at watermark every model write carries (deletes through tombstones).
+# reports(), export_summary_excel() and dashboard() aggregate here with indexed SQL
+# while the mirror is fresh, and fall back to Firestore when it lags.
+#
+#   SQLITE_MIRROR           path of the database file; unset = mirror disabled
+#   SQLITE_MIRROR_INTERVAL  seconds between syncs (default 30)
+#   SQLITE_MIRROR_MAX_LAG   a mirror older than this is not used (default 120)
+#
+# Every worker runs the sync loop, but a file lock lets only one of them sync at a time.
+
+SQLITE_MIRROR = os.environ.get('SQLITE_MIRROR')
+SYNC_INTERVAL = float(os.environ.get('SQLITE_MIRROR_INTERVAL', 30))
+MAX_LAG = float(os.environ.get('SQLITE_MIRROR_MAX_LAG', 120))
+# Watermarks trail each sync's start to absorb clock skew between app servers;
+# the overlap is re-applied as idempotent upserts
+WATERMARK_LAG_SECONDS = 60
+UPSERT_CHUNK = 1000
+
+# collection -> (table, mirrored fields). Users keep no password hashes.
+TABLES = {
+    'students': ('students', ('name', 'roll_no', 'dept', 'class_id', 'semester')),
+    'classrooms': ('classrooms', ('name', 'dept', 'current_semester', 'year')),
+    'subjects': ('subjects', ('name', 'code', 'dept', 'semester', 'teacher_id')),
+    'users': ('users', ('name', 'role', 'student_id')),
+    'attendance_records': ('attendance', ('student_id', 'subject_id', 'class_id', 'teacher_id', 'date', 'status')),
+}
+
+SCHEMA = [
+    *(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, {', '.join(f'{c} TEXT' for c in fields)}, updated_at TEXT)"
+      for table, fields in TABLES.values()),
+    "CREATE TABLE IF NOT EXISTS mirror_state (collection TEXT PRIMARY KEY, watermark TEXT, synced_at REAL, row_count INTEGER)",
+    "CREATE INDEX IF NOT EXISTS att_class_date ON attendance (class_id, date)",
+    "CREATE INDEX IF NOT EXISTS att_student_date ON attendance (student_id, date, status)",
+    "CREATE INDEX IF NOT EXISTS att_subject ON attendance (subject_id, student_id)",
+    "CREATE INDEX IF NOT EXISTS att_date ON attendance (date, student_id, status)",
+    "CREATE INDEX IF NOT EXISTS students_class ON students (class_id)",
+    "CREATE INDEX IF NOT EXISTS students_roll ON students (roll_no)",
+]
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _date_text(value):
+    # Legacy records hold Firestore timestamps (midnight); newer ones 'YYYY-MM-DD' strings
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else _text(value)
+
+
+class SQLiteMirror:
+    def __init__(self, path, interval=SYNC_INTERVAL, max_lag=MAX_LAG):
+        self.path = path
+        self.interval = interval
+        self.max_lag = max_lag
+        self._local = threading.local()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        with self._connect() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL') # readers never block the syncing writer
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def conn(self):
+        # One connection per thread (and per process: connections do not survive fork)
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    # -- sync --
+    def sync_collection(self, collection):
+        table, fields = TABLES[collection]
+        conn = self.conn()
+        row = conn.execute('SELECT watermark FROM mirror_state WHERE collection = ?', (collection,)).fetchone()
+        since = row[0] if row else None
+        started = datetime.utcnow()
+
+        query = get_db().collection(collection)
+        if since:
+            query = query.where('updated_at', '>', since)
+        sql = (f"INSERT OR REPLACE INTO {table} (id, {', '.join(fields)}, updated_at) "
+               f"VALUES ({', '.join('?' * (len(fields) + 2))})")
+        pending, applied = [], 0
+        for doc in query.stream():
+            data = doc.to_dict()
+            pending.append((doc.id, *((_date_text if f == 'date' else _text)(data.get(f)) for f in fields),
+                            data.get('updated_at')))
+            if len(pending) >= UPSERT_CHUNK:
+                with conn:
+                    conn.executemany(sql, pending)
+                applied += len(pending)
+                pending = []
+        with conn:
+            conn.executemany(sql, pending)
+        applied += len(pending)
+
+        if since:
+            gone = get_db().collection(TOMBSTONE_COLLECTION).where('collection', '==', collection).where('updated_at', '>', since)
+            ids = [(doc.to_dict().get('doc_id'),) for doc in gone.stream()]
+            with conn:
+                conn.executemany(f"DELETE FROM {table} WHERE id = ?", ids)
+            applied += len(ids)
+        watermark = (started - timedelta(seconds=WATERMARK_LAG_SECONDS)).isoformat(timespec='microseconds')
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO mirror_state VALUES (?, ?, ?, "
+                         f"(SELECT COUNT(*) FROM {table}))", (collection, watermark, time.time()))
+        return applied
+
+    def sync(self):
+        """Sync every mirrored collection unless another process holds the sync lock."""
+        with open(self.path + '.lock', 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            return {collection: self.sync_collection(collection) for collection in TABLES}
+
+    def _loop(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"SQLite mirror sync error: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        # Lazily per process: gunicorn forks after import, and threads do not survive fork
+        if self._pid == os.getpid(): return
+        with self._start_lock:
+            if self._pid == os.getpid(): return
+            self._thread = threading.Thread(target=self._loop, name='sqlite-mirror', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    # -- freshness --
+    def synced_at(self):
+        row = self.conn().execute('SELECT MIN(synced_at), COUNT(*) FROM mirror_state').fetchone()
+        if not row or row[1] < len(TABLES):
+            return None
+        return row[0]
+
+    def fresh(self):
+        synced = self.synced_at()
+        return synced is not None and time.time() - synced <= self.max_lag
+
+    def as_of(self):
+        # For the "Data as of ..." note on pages served from the mirror
+        synced = self.synced_at()
+        return datetime.fromtimestamp(synced).strftime('%d %b %Y, %H:%M:%S') if synced else None
+
+    # -- reporting queries --
+    def _attendance_where(self, subject_id=None, class_id=None, class_ids=None):
+        clauses, params = ['student_id IS NOT NULL', 'date IS NOT NULL'], []
+        if subject_id:
+            clauses.append('subject_id = ?'); params.append(str(subject_id))
+        if class_id:
+            clauses.append('class_id = ?'); params.append(str(class_id))
+        elif class_ids is not None:
+            clauses.append(f"class_id IN ({', '.join('?' * len(class_ids))})"); params.extend(class_ids)
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def student_day_counts(self, subject_id=None, class_id=None, class_ids=None):
+        """student_id -> (total_days, present, absent, od, leave, lates) with the reports() day rules."""
+        where, params = self._attendance_where(subject_id, class_id, class_ids)
+        sql = f"""
+            SELECT student_id, COUNT(*), SUM(1 - absent), SUM(absent),
+                   SUM(od * (1 - absent)), SUM(leave * (1 - od) * (1 - absent)), SUM(lates)
+            FROM (SELECT student_id, date,
+                         MAX(status = 'Absent') AS absent, MAX(status = 'OD') AS od,
+                         MAX(status = 'Leave') AS leave, SUM(status = 'Late') AS lates
+                  FROM attendance{where} GROUP BY student_id, date)
+            GROUP BY student_id"""
+        return {row[0]: row[1:] for row in self.conn().execute(sql, params)}
+
+    def attendance_columns(self, subject_id=None, class_id=None, class_ids=None):
+        """Column lists in the shape summary_export.stream_attendance_columns() returns."""
+        where, params = self._attendance_where(subject_id, class_id, class_ids)
+        rows = self.conn().execute(
+            f"SELECT student_id, subject_id, class_id, date, status FROM attendance{where}", params).fetchall()
+        names = ('student_id', 'subject_id', 'class_id', 'date', 'status')
+        return {name: [r[i] for r in rows] for i, name in enumerate(names)}
+
+    def day_statuses(self, date_str):
+        """One row per student marked on `date_str`: (student_id, class_id, dept, statuses set).
+
+        Records are resolved to students by doc id, then by roll number; class_id is None
+        when neither matches.
+        """
+        sql = """
+            SELECT a.student_id,
+                   CASE WHEN COALESCE(s1.id, s2.id) IS NULL THEN NULL ELSE COALESCE(s1.class_id, s2.class_id, '') END,
+                   COALESCE(s1.dept, s2.dept, 'Unknown'), GROUP_CONCAT(DISTINCT COALESCE(a.status, ''))
+            FROM attendance a
+            LEFT JOIN students s1 ON s1.id = a.student_id
+            LEFT JOIN students s2 ON s1.id IS NULL AND s2.roll_no = a.student_id
+            WHERE a.date = ? AND a.student_id IS NOT NULL AND a.student_id != ''
+            GROUP BY a.student_id"""
+        return [(sid, cid, dept, set(statuses.split(',')))
+                for sid, cid, dept, statuses in self.conn().execute(sql, (date_str,))]
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """The configured mirror with its sync loop running in this process, or None."""
+    global _mirror
+    if not SQLITE_MIRROR:
+        return None
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = SQLiteMirror(SQLITE_MIRROR)
+    _mirror.start()
+    return _mirror
+
+
+def fresh_mirror():
+    """The mirror if it is within SQLITE_MIRROR_MAX_LAG, else None (read Firestore)."""
+    mirror = get_mirror()
+    if mirror is None: return None
+    try:
+        return mirror if mirror.fresh() else None
+    except sqlite3.Error as e:
+        print(f"SQLite mirror read error: {e}")
+        return None
@@ -0,0 +1,131 @@
+import bisect
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from models import Attendance
+from student_search import student_index
+
+# Rolling per-status window of recent OD/Leave/Late entries for the status portal's
+# history panel. Seeded with one ordered, limited query per status and then fed by
+# every saved mark (app.save_attendance: class attendance and the portal's own), so
+# renders stop scanning 30 days of records and all students.
+
+HISTORY_DAYS = 30
+HISTORY_SIZE = 500  # entries kept per status (the panel shows 100)
+HISTORY_TTL = 120   # seconds before re-seeding, to pick up marks made on other workers
+
+
+def _cutoff():
+    return (datetime.utcnow() - timedelta(days=HISTORY_DAYS)).strftime('%Y-%m-%d')
+
+
+def history_entry(record_id, student, date_str, class_id=None):
+    return {
+        'id': record_id,
+        'student_id': str(student.id),
+        'name': getattr(student, 'name', ''),
+        'roll_no': getattr(student, 'roll_no', ''),
+        'dept': getattr(student, 'dept', ''),
+        'class_id': str(class_id or getattr(student, 'class_id', '')),
+        'date': date_str,
+    }
+
+
+class StatusHistory:
+    def __init__(self, size=HISTORY_SIZE, ttl=HISTORY_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._windows = {}    # status -> deque of entries, newest date first
+        self._loaded_at = {}  # status -> monotonic time of the last seed
+        self._lock = threading.Lock()
+
+    def _seed(self, status):
+        records = (Attendance.query.filter_by(status=status)
+                   .where('date', '>=', _cutoff())
+                   .order_by('-date')
+                   .limit(self.size)
+                   .all())
+        window = deque(maxlen=self.size)
+        for rec in records:
+            sid = str(getattr(rec, 'student_id', ''))
+            if getattr(rec, 'student_name', None) is not None:
+                # Denormalized at write time
+                window.append({
+                    'id': rec.id, 'student_id': sid,
+                    'name': rec.student_name,
+                    'roll_no': getattr(rec, 'roll_no', ''),
+                    'dept': getattr(rec, 'dept', ''),
+                    'class_id': str(getattr(rec, 'class_id', '')),
+                    'date': rec.date,
+                })
+                continue
+            # Older records carry only the student id
+            student = student_index.get(sid)
+            if student:
+                window.append(history_entry(rec.id, student, rec.date, getattr(rec, 'class_id', None)))
+        return window
+
+    def _ensure(self, status):
+        if status in self._windows and time.monotonic() - self._loaded_at[status] < self.ttl:
+            return
+        with self._lock:
+            if status in self._windows and time.monotonic() - self._loaded_at[status] < self.ttl:
+                return
+            self._windows[status] = self._seed(status)
+            self._loaded_at[status] = time.monotonic()
+
+    def record(self, status, entry):
+        """Put a freshly written mark into its status window (dropping any older copy)."""
+        with self._lock:
+            for window in self._windows.values():
+                for i, existing in enumerate(window):
+                    if existing['id'] == entry['id']:
+                        del window[i]
+                        break
+            window = self._windows.get(status)
+            if window is None:
+                return  # not seeded yet; the first read will pick it up
+            # Newest first: insert before the first entry that is not newer
+            dates = [e['date'] for e in window]
+            pos = len(dates) - bisect.bisect_right(dates[::-1], entry['date'])
+            if len(window) == window.maxlen:
+                if pos >= len(window):
+                    return  # older than everything kept
+                window.pop()
+            window.insert(pos, entry)
+
+    def record_many(self, records):
+        """record() the saved Attendance records whose status has a window, whichever page
+        marked them: class attendance as well as the portal's GLOBAL marks."""
+        for rec in records:
+            status = getattr(rec, 'status', None)
+            if status not in self._windows:
+                continue  # Present/Absent, or not seeded yet
+            student = student_index.get(str(getattr(rec, 'student_id', '')))
+            if student:
+                self.record(status, history_entry(rec.id, student, rec.date, getattr(rec, 'class_id', None)))
+
+    def recent(self, status, limit=100, class_ids=None):
+        self._ensure(status)
+        cutoff = _cutoff()
+        results = []
+        with self._lock:
+            for entry in self._windows.get(status, ()):
+                if entry['date'] < cutoff:
+                    break
+                if class_ids is not None and entry['class_id'] not in class_ids:
+                    continue
+                results.append(dict(entry))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def invalidate(self, status=None):
+        with self._lock:
+            for key in ([status] if status else list(self._loaded_at)):
+                self._loaded_at[key] = 0
+
+
+status_history = StatusHistory()
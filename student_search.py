@@ -0,0 +1,185 @@
+import heapq
+import threading
+import time
+
+from models import Student
+
+# In-memory student search for the status portal and its typeahead endpoint.
+# Bigram/trigram postings give substring matches on name/roll number without scanning
+# the collection; class and dept partitions scope results for teachers and filters.
+
+INDEX_TTL = 300 # seconds before a lazy rebuild picks up writes made by other workers
+GRAM_SIZES = (2, 3)
+
+
+def _grams(text, sizes=GRAM_SIZES):
+    return {text[i:i + n] for n in sizes for i in range(len(text) - n + 1)}
+
+
+def _query_grams(q):
+    # Longest grams are the most selective
+    n = min(len(q), GRAM_SIZES[-1])
+    return _grams(q, (n,)) if n >= GRAM_SIZES[0] else set()
+
+
+def _norm(value):
+    return str(value or '').lower().strip()
+
+
+def _sort_key(s):
+    return (_norm(getattr(s, 'dept', '')), str(getattr(s, 'roll_no', 'zzzz')).lower())
+
+
+class _IndexState:
+    def __init__(self):
+        self.students = {}  # student_id -> Student
+        self.keys = {}      # student_id -> (lower name, lower roll_no)
+        self.grams = {}     # bigram/trigram -> set(student_id)
+        self.by_class = {}  # class_id -> set(student_id)
+        self.by_dept = {}   # dept (lowercased) -> set(student_id)
+        self.by_roll = {}   # roll_no (lowercased) -> student_id
+        self.order = []     # student ids in display order, re-sorted lazily after writes
+        self.order_dirty = True
+
+    def add(self, s):
+        sid = str(s.id)
+        self.remove(sid)
+        name, roll = _norm(getattr(s, 'name', '')), _norm(getattr(s, 'roll_no', ''))
+        self.students[sid] = s
+        self.keys[sid] = (name, roll)
+        for g in _grams(name) | _grams(roll):
+            self.grams.setdefault(g, set()).add(sid)
+        self.by_class.setdefault(str(getattr(s, 'class_id', '')), set()).add(sid)
+        self.by_dept.setdefault(_norm(getattr(s, 'dept', '')), set()).add(sid)
+        if roll: self.by_roll[roll] = sid
+        self.order_dirty = True
+
+    def remove(self, sid):
+        s = self.students.pop(sid, None)
+        if s is None: return
+        name, roll = self.keys.pop(sid)
+        for g in _grams(name) | _grams(roll):
+            postings = self.grams.get(g)
+            if postings is not None:
+                postings.discard(sid)
+                if not postings: del self.grams[g]
+        self.by_class.get(str(getattr(s, 'class_id', '')), set()).discard(sid)
+        self.by_dept.get(_norm(getattr(s, 'dept', '')), set()).discard(sid)
+        if self.by_roll.get(roll) == sid: del self.by_roll[roll]
+        self.order_dirty = True
+
+    def ordered_ids(self):
+        if self.order_dirty:
+            self.order = sorted(self.students, key=lambda sid: _sort_key(self.students[sid]))
+            self.order_dirty = False
+        return self.order
+
+
+class StudentSearchIndex:
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._state = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._pending = None  # writes that arrive while a rebuild is streaming
+
+    def _ensure(self):
+        if self._state is not None and time.monotonic() - self._built_at < self.ttl:
+            return
+        with self._build_lock:
+            if self._state is not None and time.monotonic() - self._built_at < self.ttl:
+                return
+            with self._lock:
+                self._pending = []
+            state = _IndexState()
+            try:
+                for s in Student.query.all():
+                    state.add(s)
+            except Exception:
+                # No half-built index (or an empty one passed off as "no students")
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for op, arg in self._pending:
+                    state.add(arg) if op == 'add' else state.remove(arg)
+                self._pending = None
+                self._state = state
+                self._built_at = time.monotonic()
+
+    # -- incremental maintenance from write paths --
+    def upsert(self, student):
+        with self._lock:
+            if self._pending is not None: self._pending.append(('add', student))
+            if self._state is not None: self._state.add(student)
+
+    def remove(self, student_id):
+        with self._lock:
+            if self._pending is not None: self._pending.append(('remove', str(student_id)))
+            if self._state is not None: self._state.remove(str(student_id))
+
+    def invalidate(self):
+        # Bulk writes: cheaper to rebuild lazily on the next search
+        self._built_at = 0
+
+    # -- reads --
+    def get(self, student_id):
+        self._ensure()
+        with self._lock:
+            return self._state.students.get(str(student_id))
+
+    def resolve(self, key):
+        """Student for a document id or an exact roll number (as scanned from an ID card)."""
+        self._ensure()
+        key = str(key or '').strip()
+        with self._lock:
+            state = self._state
+            s = state.students.get(key)
+            if s is None:
+                s = state.students.get(state.by_roll.get(key.lower()))
+            return s
+
+    def search(self, query='', class_ids=None, dept=None, limit=None):
+        """Students whose name or roll number contains `query`, within the class/dept scope.
+
+        Results are sorted dept-wise then by roll number, like the portal table.
+        """
+        self._ensure()
+        q = _norm(query)
+        with self._lock:
+            state = self._state
+            scopes = []
+            if class_ids is not None:
+                scopes.append(set().union(*(state.by_class.get(str(c), set()) for c in class_ids)))
+            if dept:
+                scopes.append(state.by_dept.get(_norm(dept), set()))
+            scopes.extend(state.grams.get(g, set()) for g in _query_grams(q))
+            if scopes:
+                scopes.sort(key=len)
+                candidates = scopes[0].intersection(*scopes[1:])
+            else:
+                candidates = None # whole index
+
+            def matches(sid):
+                name, roll = state.keys[sid]
+                # Grams can over-match (out of order), so confirm the substring
+                return not q or q in name or q in roll
+
+            if limit and (candidates is None or len(candidates) > limit * 8):
+                # Large result sets: walk the pre-sorted order and stop at `limit`
+                found = []
+                for sid in state.ordered_ids():
+                    if (candidates is None or sid in candidates) and matches(sid):
+                        found.append(state.students[sid])
+                        if len(found) >= limit: break
+                return found
+            pool = state.students.keys() if candidates is None else candidates
+            found = [state.students[sid] for sid in pool if matches(sid)]
+        if limit:
+            return heapq.nsmallest(limit, found, key=_sort_key)
+        found.sort(key=_sort_key)
+        return found
+
+
+student_index = StudentSearchIndex()
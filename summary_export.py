@@ -0,0 +1,183 @@
+import importlib.util
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from defaulters import DEFAULTER_THRESHOLD
+from models import Attendance
+
+# Attendance summary workbook built from one columnar frame of attendance records.
+# Same day-wise rules as reports(): a day with any Absent counts absent, otherwise
+# present (+ OD, else Leave); every 3 Late records cost one present day.
+
+ATTENDANCE_COLUMNS = ('student_id', 'subject_id', 'class_id', 'date', 'status')
+
+
+def stream_attendance_columns(filters):
+    """Stream attendance records matching `filters` [(field, op, value)] into column lists.
+
+    Only the columns the summary needs are read, so no model object is built per record.
+    """
+    query = Attendance.query
+    for field, op, value in filters:
+        query = query.where(field, op, value)
+    return query.columns(ATTENDANCE_COLUMNS)
+
+
+def attendance_frame(columns, student_ids=None):
+    df = pd.DataFrame(columns, columns=list(ATTENDANCE_COLUMNS))
+    df = df.dropna(subset=['student_id', 'date'])
+    df['student_id'] = df['student_id'].astype(str)
+    df['subject_id'] = df['subject_id'].astype(str)
+    df['status'] = df['status'].fillna('Present')
+    if student_ids is not None:
+        df = df[df['student_id'].isin(student_ids)]
+    return df
+
+
+def _codes(values):
+    codes, uniques = pd.factorize(values, sort=False)
+    return codes, uniques
+
+
+def student_summary(students_df, df):
+    """Per-student day counts, late penalty and final percentage (one row per student)."""
+    status = df['status'].to_numpy()
+    sid, sid_uniques = _codes(df['student_id'])
+    day, date_uniques = _codes(df['date'])
+    # (student, date) -> one day slot; string keys are factorized once instead of grouped on
+    day_slot, day_keys = _codes(sid.astype(np.int64) * len(date_uniques) + day)
+    n_days, n_students = len(day_keys), len(sid_uniques)
+
+    def any_per_day(mask):
+        return np.bincount(day_slot, weights=mask, minlength=n_days) > 0
+
+    absent = any_per_day(status == 'Absent')
+    od = any_per_day(status == 'OD')
+    leave = any_per_day(status == 'Leave')
+    present = ~absent
+    day_student = day_keys // len(date_uniques)
+
+    def per_student(weights, codes=day_student):
+        return np.bincount(codes, weights=weights, minlength=n_students).astype(int)
+
+    per_day = pd.DataFrame({
+        'total': per_student(None),
+        'absent': per_student(absent),
+        'present': per_student(present),
+        'od': per_student(present & od),
+        'leave': per_student(present & ~od & leave),
+        'late': per_student(status == 'Late', sid),
+    }, index=sid_uniques)
+
+    out = students_df.join(per_day, on='student_id')
+    counts = ['total', 'absent', 'present', 'od', 'leave', 'late']
+    out[counts] = out[counts].fillna(0).astype(int)
+    out['penalty'] = out['late'] // 3
+    out['effective'] = (out['present'] - out['penalty']).clip(lower=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perc = (out['effective'] / out['total'] * 100).round(2).clip(upper=100.0)
+    out['perc'] = perc.where(out['total'] > 0, 0.0)
+    return out
+
+
+def subject_matrix(students_df, df, subject_labels, class_labels):
+    """Per-class blocks of students x subjects: share of each subject's sessions not marked Absent.
+
+    Classes take different subjects, so one college-wide grid would be mostly empty;
+    each block only carries its own class's subject columns.
+    """
+    sessions = df[df['subject_id'] != 'GLOBAL']
+    if sessions.empty:
+        return []
+    sid, sid_uniques = _codes(sessions['student_id'])
+    sub, sub_uniques = _codes(sessions['subject_id'])
+    cell = sid.astype(np.int64) * len(sub_uniques) + sub
+    size = len(sid_uniques) * len(sub_uniques)
+    held = np.bincount(cell, minlength=size)
+    attended = np.bincount(cell, weights=sessions['status'].to_numpy() != 'Absent', minlength=size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grid = np.where(held > 0, np.round(attended / held * 100, 2), np.nan)
+    grid = pd.DataFrame(grid.reshape(len(sid_uniques), len(sub_uniques)), index=sid_uniques,
+                        columns=[subject_labels.get(c, c) for c in sub_uniques])
+
+    blocks = []
+    roster = students_df[students_df['student_id'].isin(grid.index)]
+    for class_id, members in roster.groupby('class_id', sort=False):
+        block = grid.loc[members['student_id']].dropna(axis=1, how='all')
+        block = block[sorted(block.columns, key=str)]
+        block.insert(0, 'Name', members['name'].to_numpy())
+        block.insert(0, 'Roll No', members['roll_no'].to_numpy())
+        blocks.append((class_labels.get(class_id, class_id), block.reset_index(drop=True)))
+    blocks.sort(key=lambda b: str(b[0]))
+    return blocks
+
+
+def defaulters(summary):
+    # Students with no recorded days are not defaulters, just unmarked
+    return (summary['perc'] < DEFAULTER_THRESHOLD) & (summary['total'] > 0)
+
+
+def class_summary(summary, class_labels):
+    grouped = summary.assign(defaulter=defaulters(summary)).groupby('class_id', sort=False)
+    out = pd.DataFrame({
+        'Students': grouped.size(),
+        'Average %': grouped['perc'].mean().round(2),
+        'Defaulters': grouped['defaulter'].sum(),
+        'Total Lates': grouped['late'].sum(),
+    })
+    out.insert(0, 'Class', [class_labels.get(c, c) for c in out.index])
+    return out.sort_values('Class')
+
+
+def _summary_sheet(summary):
+    return pd.DataFrame({
+        'Roll No': summary['roll_no'],
+        'Name': summary['name'],
+        'Department': summary['dept'],
+        'Total Days': summary['total'],
+        'Present Days': summary['effective'],
+        'Absent Days': summary['absent'],
+        'OD': summary['od'],
+        'Leave': summary['leave'],
+        'Late': summary['late'],
+        'Penalty (Leaves)': summary['penalty'],
+        'Final Percentage': summary['perc'].map(lambda p: f"{p}%"),
+    })
+
+
+def build_summary_workbook(students, columns, subject_labels=None, class_labels=None):
+    """Summary, per-subject matrix, per-class and defaulters sheets as .xlsx bytes."""
+    students_df = pd.DataFrame({
+        'student_id': [str(s.id) for s in students],
+        'roll_no': [getattr(s, 'roll_no', '') for s in students],
+        'name': [getattr(s, 'name', '') for s in students],
+        'dept': [getattr(s, 'dept', '') for s in students],
+        'class_id': [str(getattr(s, 'class_id', '')) for s in students],
+    })
+    df = attendance_frame(columns, set(students_df['student_id']))
+    summary = student_summary(students_df, df)
+
+    sheets = {
+        'Summary': _summary_sheet(summary),
+        'Classes': class_summary(summary, class_labels or {}),
+        'Defaulters': _summary_sheet(summary[defaulters(summary)].sort_values('perc')),
+    }
+    matrix = subject_matrix(students_df, df, subject_labels or {}, class_labels or {})
+    # xlsxwriter writes large sheets several times faster than openpyxl when installed
+    engine = 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') else 'openpyxl'
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine=engine) as writer:
+        sheets['Summary'].to_excel(writer, index=False, sheet_name='Summary')
+        row = 0
+        for class_label, block in matrix:
+            # Class title row, then that class's own header and students
+            pd.DataFrame({'Class': [class_label]}).to_excel(writer, index=False, header=False,
+                                                            sheet_name='Subject Matrix', startrow=row)
+            block.to_excel(writer, index=False, sheet_name='Subject Matrix', startrow=row + 1)
+            row += len(block) + 3
+        sheets['Classes'].to_excel(writer, index=False, sheet_name='Classes')
+        sheets['Defaulters'].to_excel(writer, index=False, sheet_name='Defaulters')
+    output.seek(0)
+    return output
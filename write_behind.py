@@ -0,0 +1,319 @@
+import atexit
+import fcntl
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from models import collection_versions, get_db, set_write_overlay, utc_stamp
+
+# Optional write-behind queue for attendance writes. With WRITE_BEHIND set, the marking
+# routes append their records to a local SQLite file and return at once. A background flusher coalesces queued writes per
+# document and commits them in batches of up to 500, backing off (with jitter) while
+# Firestore fails. Rows are deleted only after their batch commits, so a crash between
+# the commit and the delete replays them; writes are whole-document sets, so replays
+# are harmless.
+#
+# Queued documents are overlaid on FirestoreQuery reads (models.set_write_overlay), so
+# the page a teacher lands on after submitting already shows the records. While the queue
+# holds documents of a collection, count() and aggregate() on it reduce over the overlaid
+# documents instead of using native aggregations.
+#
+#   WRITE_BEHIND            path of the queue file; unset = synchronous writes
+#   WRITE_BEHIND_INTERVAL   seconds between flushes (default 0.5); a full batch flushes at once
+#   WRITE_BEHIND_RETRY_MAX  longest pause between retries of a failing flush (default 30)
+#   WRITE_BEHIND_SYNCHRONOUS  SQLite synchronous mode: NORMAL (default) survives a worker
+#                           crash; FULL also an OS crash or power loss, at an fsync per submit
+#
+# The queue is per host: every worker runs a flusher (one flushes at a time, under a
+# file lock) and every worker on the host reads the queued writes. With several app
+# hosts, read-your-writes needs sticky sessions.
+
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND')
+FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 0.5))
+RETRY_MAX = float(os.environ.get('WRITE_BEHIND_RETRY_MAX', 30))
+SYNCHRONOUS = os.environ.get('WRITE_BEHIND_SYNCHRONOUS', 'NORMAL').upper()
+FLUSH_BATCH = 500 # Firestore's hard limit on writes per batch
+# A batch failing this many times is moved to the `failed` table instead of blocking the queue
+MAX_ATTEMPTS = 10
+
+# One encoder for every queued row: json.dumps() builds a new one per call when given options
+_encode = json.JSONEncoder(default=str, separators=(',', ':')).encode
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS pending (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, doc_id TEXT NOT NULL,
+        data TEXT NOT NULL, merge INTEGER NOT NULL, queued_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0, UNIQUE (collection, doc_id))""",
+    """CREATE TABLE IF NOT EXISTS failed (
+        seq INTEGER, collection TEXT, doc_id TEXT, data TEXT, merge INTEGER, queued_at REAL,
+        attempts INTEGER, error TEXT, failed_at REAL)""",
+]
+
+
+class _Submit:
+    # One set_many() call waiting for the group commit that writes it
+    __slots__ = ('collection', 'rows', 'merge', 'done', 'lead', 'error')
+
+    def __init__(self, collection, rows, merge):
+        self.collection, self.rows, self.merge = collection, rows, merge
+        self.done = threading.Event()
+        self.lead = False
+        self.error = None
+
+
+class WriteBehindQueue:
+    def __init__(self, path, interval=FLUSH_INTERVAL, retry_max=RETRY_MAX):
+        self.path = path
+        self.interval = interval
+        self.retry_max = retry_max
+        self._local = threading.local()
+        self._wake = threading.Event()
+        # SQLite allows one writer; the group-commit leader and the flusher take turns here
+        # rather than in its busy backoff
+        self._write_lock = threading.Lock()
+        self._submits = [] # waiting for the next group commit
+        self._submit_lock = threading.Lock()
+        self._committing = False
+        self._queued = 0 # rows queued by this process since the last flush: wakes the flusher
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._parsed = {} # collection -> {seq: (doc_id, data, merge)}, reused across reads
+        self._parsed_lock = threading.Lock()
+        self._listeners = []
+        conn = self._connect()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={"FULL" if SYNCHRONOUS == "FULL" else "NORMAL"}')
+        return conn
+
+    def conn(self):
+        # One connection per thread (and per process: connections do not survive fork)
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    # -- enqueue --
+    def set_many(self, collection, docs, merge=False):
+        """Queue {doc_id: data} writes. A document already queued is replaced, or with
+        `merge` has the new fields merged into its queued data. Returns once the writes
+        are in the queue file; concurrent calls share one SQLite transaction."""
+        # Encoded by the caller, outside the commit
+        rows = [(str(doc_id), data, None if merge else _encode(data)) for doc_id, data in docs.items()]
+        submit = _Submit(collection, rows, merge)
+        with self._submit_lock:
+            self._submits.append(submit)
+            lead = not self._committing
+            self._committing = True
+        if not lead:
+            submit.done.wait()
+            lead = submit.lead
+        if lead:
+            self._group_commit()
+        if submit.error is not None:
+            raise submit.error
+        self.start()
+        with self._submit_lock:
+            self._queued += len(rows)
+            full = self._queued >= FLUSH_BATCH
+        if full:
+            self._wake.set()
+
+    def _group_commit(self):
+        # The leader writes every submit waiting so far in one transaction, then hands the
+        # lead to the first submit that arrived meanwhile instead of writing it too
+        with self._submit_lock:
+            submits, self._submits = self._submits, []
+        conn = self.conn()
+        now = time.time()
+        error = None
+        try:
+            with self._write_lock, conn:
+                for submit in submits:
+                    values = []
+                    for doc_id, data, encoded in submit.rows:
+                        doc_merge = submit.merge
+                        if doc_merge:
+                            row = conn.execute('SELECT data, merge FROM pending WHERE collection = ? AND doc_id = ?',
+                                               (submit.collection, doc_id)).fetchone()
+                            if row:
+                                data = {**json.loads(row[0]), **data}
+                                doc_merge = bool(row[1])
+                            encoded = _encode(data)
+                        values.append((submit.collection, doc_id, encoded, int(doc_merge), now))
+                    conn.executemany("INSERT OR REPLACE INTO pending (collection, doc_id, data, merge, queued_at) "
+                                     "VALUES (?, ?, ?, ?, ?)", values)
+        except Exception as e:
+            error = e
+        for submit in submits:
+            submit.error = error
+            submit.done.set()
+        with self._submit_lock:
+            if not self._submits:
+                self._committing = False
+                return
+            successor = self._submits[0]
+            successor.lead = True
+        successor.done.set()
+
+    def set(self, collection, doc_id, data, merge=False):
+        self.set_many(collection, {doc_id: data}, merge=merge)
+
+    def pending(self, collection):
+        """{doc_id: (data, merge)} queued for `collection` and not yet committed."""
+        self.start()
+        conn = self.conn()
+        # Every read overlays the queue: only rows queued since the last read are parsed.
+        # Seqs only grow (a re-queued document gets a new one), so new rows are those above
+        # the highest seq already parsed.
+        seqs = {row[0] for row in conn.execute('SELECT seq FROM pending WHERE collection = ?', (collection,))}
+        with self._parsed_lock:
+            parsed = self._parsed.setdefault(collection, {})
+            for seq in [seq for seq in parsed if seq not in seqs]:
+                del parsed[seq]
+            if len(parsed) < len(seqs):
+                rows = conn.execute('SELECT seq, doc_id, data, merge FROM pending WHERE collection = ? AND seq > ?',
+                                    (collection, max(parsed, default=0)))
+                for seq, doc_id, data, merge in rows:
+                    if seq in seqs:
+                        parsed[seq] = (doc_id, json.loads(data), bool(merge))
+            entries = sorted(parsed.items())
+        # Data dicts are shared between readers: callers copy before changing them
+        return {doc_id: (data, merge) for _, (doc_id, data, merge) in entries}
+
+    def on_commit(self, listener):
+        """Call listener(collection, {doc_id: data}) after each flushed batch commits."""
+        self._listeners.append(listener)
+
+    def _notify(self, committed):
+        for listener in self._listeners:
+            for collection, docs in committed.items():
+                try:
+                    listener(collection, docs)
+                except Exception as e:
+                    print(f"Write-behind commit listener error: {e}")
+
+    def size(self):
+        return self.conn().execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    # -- flush --
+    def _commit(self, rows):
+        # Returns the committed documents as {collection: {doc_id: data}} for the listeners
+        db_conn = get_db()
+        batch = db_conn.batch()
+        # Stamp the commit, not the enqueue: incremental readers (SQLite mirror, snapshot
+        # export) must not skip writes that waited out a retry
+        stamp = utc_stamp()
+        committed = {}
+        for _, collection, doc_id, data, merge, _ in rows:
+            data = json.loads(data)
+            if 'updated_at' in data:
+                data['updated_at'] = stamp
+            batch.set(db_conn.collection(collection).document(doc_id), data, merge=bool(merge))
+            committed.setdefault(collection, {})[doc_id] = data
+        batch.commit()
+        return committed
+
+    def flush(self):
+        """Commit everything queued in batches of FLUSH_BATCH. Returns the number of writes
+        committed, or None when another process is flushing; raises when a batch fails."""
+        with open(self.path + '.lock', 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            conn = self.conn()
+            committed = 0
+            while True:
+                rows = conn.execute('SELECT seq, collection, doc_id, data, merge, attempts FROM pending '
+                                    'ORDER BY seq LIMIT ?', (FLUSH_BATCH,)).fetchall()
+                if not rows:
+                    with self._submit_lock:
+                        self._queued = 0
+                    return committed
+                try:
+                    docs = self._commit(rows)
+                except Exception as e:
+                    self._failed(rows, e)
+                    raise
+                # By seq: a document re-queued meanwhile has a new seq and stays queued
+                with self._write_lock, conn:
+                    conn.executemany('DELETE FROM pending WHERE seq = ?', [(row[0],) for row in rows])
+                collection_versions.bump(*{row[1] for row in rows})
+                if self._listeners:
+                    self._notify(docs)
+                committed += len(rows)
+
+    def _failed(self, rows, error):
+        conn = self.conn()
+        with self._write_lock, conn:
+            conn.executemany('UPDATE pending SET attempts = attempts + 1 WHERE seq = ?', [(row[0],) for row in rows])
+            dead = [row for row in rows if row[5] + 1 >= MAX_ATTEMPTS]
+            if dead:
+                print(f"Write-behind: giving up on {len(dead)} queued writes after {MAX_ATTEMPTS} attempts: {error}")
+                conn.executemany('INSERT INTO failed SELECT seq, collection, doc_id, data, merge, queued_at, '
+                                 'attempts, ?, ? FROM pending WHERE seq = ?',
+                                 [(str(error), time.time(), row[0]) for row in dead])
+                conn.executemany('DELETE FROM pending WHERE seq = ?', [(row[0],) for row in dead])
+
+    def _loop(self):
+        failures = 0
+        while True:
+            if failures:
+                # Jittered exponential backoff while Firestore is failing
+                time.sleep(min(self.retry_max, self.interval * 2 ** failures) * random.uniform(0.5, 1.0))
+            else:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+            try:
+                self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"Write-behind flush error (attempt {failures}): {e}")
+
+    def start(self):
+        # Lazily per process: gunicorn forks after import, and threads do not survive fork
+        if self._pid == os.getpid(): return
+        with self._start_lock:
+            if self._pid == os.getpid(): return
+            self._thread = threading.Thread(target=self._loop, name='write-behind', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self._drain)
+
+    def _drain(self):
+        # Best effort on shutdown; whatever is left is flushed by the next process
+        try:
+            if self.size():
+                self.flush()
+        except Exception as e:
+            print(f"Write-behind flush at exit failed, {self.size()} writes stay queued: {e}")
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """The configured queue, its reads overlaid on FirestoreQuery, or None (synchronous writes)."""
+    global _queue
+    if not WRITE_BEHIND:
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteBehindQueue(WRITE_BEHIND)
+                set_write_overlay(_queue.pending)
+    return _queue